@@ -3,7 +3,8 @@ from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.shortcuts import redirect, render
-from django_ratelimit.decorators import ratelimit
+
+from medic_card.ratelimit import rate_limit
 
 from .forms import (
     CustomAuthenticationForm,
@@ -14,7 +15,7 @@ from .forms import (
 from .models import UserProfile
 
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('auth')
 def register(request):
     if request.method == "POST":
         form = CustomUserCreationForm(request.POST)
@@ -28,7 +29,7 @@ def register(request):
     return render(request, "medic_auth/register.html", {"form": form})
 
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('auth')
 def user_login(request):
     if request.method == "POST":
         form = CustomAuthenticationForm(request, data=request.POST)
@@ -64,13 +65,13 @@ def user_login(request):
         form = CustomAuthenticationForm()
     return render(request, "medic_auth/login.html", {"form": form})
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('auth')
 def user_logout(request):
     logout(request)
     messages.info(request, "Вы вышли из системы.")
     return redirect("medic_card:home")
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('read')
 @login_required
 def profile(request):
     """Личный кабинет пользователя"""
@@ -92,7 +93,7 @@ def profile(request):
 
     return render(request, "medic_auth/profile.html", context)
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('auth')
 @login_required
 def change_password(request):
     """Изменение пароля"""
@@ -112,7 +113,7 @@ def change_password(request):
 
     return redirect("medic_auth:profile")
 
-@ratelimit(key='ip', rate='50/h')
+@rate_limit('auth')
 @login_required
 def change_password_hint(request):
     """Изменение фразы-подсказки"""
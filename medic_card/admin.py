@@ -1,13 +1,23 @@
 from django.contrib import admin
 from django.utils.html import format_html
 from unfold.admin import ModelAdmin, TabularInline, StackedInline
-from unfold.decorators import display
+from unfold.decorators import action, display
 from django import forms
 from django.shortcuts import redirect
 from django.urls import path
 from django.template.response import TemplateResponse
 from django.contrib import messages
-from .models import Answer, Question, Theme, Ticket, TicketProgress, UserAnswer, Favorites
+from .importers import QuestionImporter, detect_format, read_rows
+from .models import (
+    Answer,
+    Favorites,
+    Question,
+    Theme,
+    Ticket,
+    TicketProgress,
+    TicketQuestion,
+    UserAnswer,
+)
 
 
 # ============================================================================
@@ -20,7 +30,10 @@ class QuestionCreateForm(forms.ModelForm):
         queryset=Ticket.objects.filter(is_active=True),
         required=True,
         label="Билеты",
-        help_text="Выберите один или несколько билетов. Для каждого билета будет создана копия вопроса."
+        help_text=(
+            "Выберите один или несколько билетов. Вопрос будет добавлен "
+            "во все выбранные билеты без копирования."
+        ),
     )
 
     class Meta:
@@ -36,6 +49,30 @@ class QuestionEditForm(forms.ModelForm):
         fields = ['text', 'image', 'is_active', 'order']
 
 
+class QuestionImportForm(forms.Form):
+    """Форма загрузки файла для массового импорта вопросов"""
+    file = forms.FileField(
+        label="Файл",
+        help_text=(
+            "CSV, JSONL или JSON: тема, билет, текст вопроса, изображение "
+            "и варианты ответа"
+        ),
+    )
+    dry_run = forms.BooleanField(
+        label="Только проверить",
+        required=False,
+        help_text="Проверить файл и показать, что будет создано, ничего не записывая"
+    )
+
+    def clean_file(self):
+        upload = self.cleaned_data["file"]
+        try:
+            detect_format(upload.name)
+        except ValueError as error:
+            raise forms.ValidationError(str(error))
+        return upload
+
+
 # ============================================================================
 # INLINE КЛАССЫ
 # ============================================================================
@@ -79,32 +116,26 @@ class ThemeInline(TabularInline):
     autocomplete_fields = ['theme']
 
 
-class QuestionCloneInline(TabularInline):
-    """Inline для отображения копий вопроса в других билетах"""
-    model = Question
+class TicketQuestionInline(TabularInline):
+    """Inline для вхождений вопроса в билеты"""
+    model = TicketQuestion
     extra = 0
-    can_delete = False
-    readonly_fields = ['ticket', 'text_preview', 'is_active', 'created_at']
-    verbose_name = "Копия вопроса"
-    verbose_name_plural = "Копии этого вопроса в других билетах"
+    fields = ["ticket", "order"]
+    verbose_name = "Билет"
+    verbose_name_plural = "Билеты, в которые входит вопрос"
     classes = ['collapse']
+    autocomplete_fields = ['ticket']
 
-    def text_preview(self, obj):
-        return obj.text[:80] + "..." if len(obj.text) > 80 else obj.text
-    text_preview.short_description = "Текст вопроса"
-
-    def has_add_permission(self, request, obj):
-        return False
-
-    def has_change_permission(self, request, obj=None):
-        return False
 
-    def get_queryset(self, request):
-        # Показываем только копии этого вопроса
-        qs = super().get_queryset(request)
-        if hasattr(self, 'parent_object') and self.parent_object:
-            return qs.filter(original_question=self.parent_object)
-        return qs.none()
+class QuestionLinkInline(TabularInline):
+    """Inline для вопросов билета и их порядка"""
+    model = TicketQuestion
+    extra = 0
+    fields = ["question", "order"]
+    verbose_name = "Вопрос"
+    verbose_name_plural = "Вопросы в этом билете"
+    classes = ['collapse']
+    autocomplete_fields = ['question']
 
 
 # ============================================================================
@@ -160,7 +191,7 @@ class TicketAdmin(ModelAdmin):
     search_fields = ["title", "description", "themes__title"]
     readonly_fields = ["created_at", "created_by"]
     filter_horizontal = ["themes"]
-    inlines = [ThemeInline]
+    inlines = [ThemeInline, QuestionLinkInline]
 
     fieldsets = (
         ("Основная информация", {
@@ -202,21 +233,21 @@ class TicketAdmin(ModelAdmin):
 class QuestionAdmin(ModelAdmin):
     list_display = [
         "text_preview",
-        "ticket",
+        "tickets_display",
         "ticket_themes_display",
         "created_by",
         "created_at",
         "is_active",
         "answers_count",
         "image_preview",
-        "is_clone_display",
     ]
-    list_filter = ["is_active", "created_at", "ticket__themes", "created_by", "original_question"]
-    search_fields = ["text", "ticket__title", "ticket__themes__title"]
-    readonly_fields = ["created_at", "created_by", "original_question", "ticket"]
-    inlines = [AnswerInline, QuestionCloneInline]
+    list_filter = ["is_active", "created_at", "tickets__themes", "created_by"]
+    search_fields = ["text", "tickets__title", "tickets__themes__title"]
+    readonly_fields = ["created_at", "created_by"]
+    inlines = [AnswerInline, TicketQuestionInline]
 
     actions = ['clone_questions_to_tickets']
+    actions_list = ['import_questions']
 
     def get_form(self, request, obj=None, **kwargs):
         """
@@ -240,20 +271,21 @@ class QuestionAdmin(ModelAdmin):
             return (
                 ("Основная информация", {
                     "fields": ("tickets", "text", "image", "is_active", "order"),
-                    "description": "Выберите один или несколько билетов. Для каждого билета будет создана копия вопроса."
+                    "description": (
+                        "Выберите один или несколько билетов. Вопрос будет "
+                        "добавлен во все выбранные билеты."
+                    ),
                 }),
             )
         else:
-            # РЕДАКТИРОВАНИЕ - показываем обычные поля + информацию о клонировании
+            # РЕДАКТИРОВАНИЕ - билеты редактируются во вложенной таблице
             return (
                 ("Основная информация", {
-                    "fields": ("ticket", "text", "image", "is_active", "order"),
-                    "description": "Редактирование вопроса. Изменения применятся ко всем копиям этого вопроса."
-                }),
-                ("Информация о клонировании", {
-                    "fields": ("original_question",),
-                    "classes": ["collapse"],
-                    "description": "Если этот вопрос является копией, здесь будет указан оригинал"
+                    "fields": ("text", "image", "is_active", "order"),
+                    "description": (
+                        "Редактирование вопроса. Изменения видны во всех "
+                        "билетах, куда он входит."
+                    ),
                 }),
                 ("Служебная информация", {
                     "fields": ("created_at", "created_by"),
@@ -263,16 +295,23 @@ class QuestionAdmin(ModelAdmin):
 
     def get_inline_instances(self, request, obj=None):
         """
-        Передаем parent_object в inline для правильного отображения копий
+        При создании билеты выбираются в форме, inline с билетами не показываем
         """
         inline_instances = super().get_inline_instances(request, obj)
-        for inline in inline_instances:
-            if isinstance(inline, QuestionCloneInline):
-                inline.parent_object = obj
+        if obj is None:
+            return [
+                inline for inline in inline_instances
+                if not isinstance(inline, TicketQuestionInline)
+            ]
         return inline_instances
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('ticket', 'created_by', 'original_question').prefetch_related('ticket__themes', 'answers')
+        return (
+            super()
+            .get_queryset(request)
+            .select_related('created_by')
+            .prefetch_related('tickets__themes', 'answers')
+        )
 
     def save_model(self, request, obj, form, change):
         """Обрабатываем сохранение вопроса с множественными билетами"""
@@ -285,22 +324,17 @@ class QuestionAdmin(ModelAdmin):
                 messages.error(request, "Необходимо выбрать хотя бы один билет")
                 return
 
-            # Создаем вопрос для первого билета (это будет оригинал)
-            first_ticket = tickets[0]
-            obj.ticket = first_ticket
             obj.created_by = request.user
-
-            # Сохраняем основной вопрос
             super().save_model(request, obj, form, change)
 
-            # Создаем копии для остальных билетов
-            if len(tickets) > 1:
-                created_copies = 0
-                for ticket in tickets[1:]:
-                    self._create_question_copy(obj, ticket, request.user)
-                    created_copies += 1
+            # Один вопрос подключается ко всем выбранным билетам
+            for ticket in tickets:
+                ticket.add_questions([obj])
 
-                messages.success(request, f"Создан вопрос и {created_copies} копий в других билетах")
+            if len(tickets) > 1:
+                messages.success(
+                    request, f"Вопрос создан и добавлен в {len(tickets)} билетов"
+                )
             else:
                 messages.success(request, "Вопрос успешно создан")
 
@@ -310,68 +344,29 @@ class QuestionAdmin(ModelAdmin):
                 obj.created_by = request.user
             super().save_model(request, obj, form, change)
 
-            # Также обновляем все копии этого вопроса
-            if obj.original_question is None:  # Это оригинальный вопрос
-                copies = Question.objects.filter(original_question=obj)
-                update_count = 0
-                for copy in copies:
-                    copy.text = obj.text
-                    copy.image = obj.image
-                    copy.is_active = obj.is_active
-                    copy.order = obj.order
-                    copy.save()
-                    update_count += 1
-
-                if update_count > 0:
-                    messages.info(request, f"Обновлено {update_count} копий этого вопроса")
-
-    def _create_question_copy(self, original_question, ticket, user):
-        """Создает копию вопроса для указанного билета"""
-        copy = Question(
-            ticket=ticket,
-            text=original_question.text,
-            image=original_question.image,
-            is_active=original_question.is_active,
-            order=original_question.order,
-            original_question=original_question,
-            created_by=user
-        )
-        copy.save()
-
-        # Копируем ответы
-        for answer in original_question.answers.all():
-            Answer.objects.create(
-                question=copy,
-                text=answer.text,
-                is_correct=answer.is_correct,
-                is_active=answer.is_active,
-                order=answer.order
-            )
-
-        return copy
-
-    @display(description="Клон")
-    def is_clone_display(self, obj):
-        if obj.original_question:
-            return format_html(
-                '✅ Копия (<a href="{}">{}</a>)',
-                f'../question/{obj.original_question.id}/change/',
-                obj.original_question.text[:50] + "..." if len(obj.original_question.text) > 50 else obj.original_question.text
-            )
-        elif obj.question_copies.exists():
-            copy_count = obj.question_copies.count()
-            return format_html('📖 Оригинал ({} копий)', copy_count)
+    @display(description="Билеты")
+    def tickets_display(self, obj):
+        tickets = obj.tickets.all()
+        if tickets:
+            titles = ", ".join(ticket.title for ticket in tickets[:2])
+            return titles + ("..." if len(tickets) > 2 else "")
         return "—"
 
     @display(description="Текст вопроса")
     def text_preview(self, obj):
         return obj.text[:100] + "..." if len(obj.text) > 100 else obj.text
 
-    @display(description="Темы билета")
+    @display(description="Темы билетов")
     def ticket_themes_display(self, obj):
-        themes = obj.ticket.themes.all()
+        themes = {
+            theme.id: theme
+            for ticket in obj.tickets.all()
+            for theme in ticket.themes.all()
+        }
+        themes = list(themes.values())
         if themes:
-            return ", ".join([theme.title for theme in themes[:2]]) + ("..." if themes.count() > 2 else "")
+            titles = ", ".join(theme.title for theme in themes[:2])
+            return titles + ("..." if len(themes) > 2 else "")
         return "—"
 
     @display(description="Ответы", label=True)
@@ -387,31 +382,65 @@ class QuestionAdmin(ModelAdmin):
             )
         return "—"
 
-    @admin.action(description="📋 Клонировать выбранные вопросы в другие билеты")
+    @action(description="📥 Импорт из файла", url_path="import", permissions=["add"])
+    def import_questions(self, request):
+        """Загрузка банка вопросов из файла CSV / JSONL / JSON"""
+        form = QuestionImportForm(request.POST or None, request.FILES or None)
+        report = None
+
+        if request.method == "POST" and form.is_valid():
+            upload = form.cleaned_data["file"]
+            try:
+                fmt = detect_format(upload.name)
+            except ValueError as error:
+                form.add_error("file", str(error))
+            else:
+                importer = QuestionImporter(
+                    request.user, dry_run=form.cleaned_data["dry_run"]
+                )
+                report = importer.run(read_rows(upload.file, fmt))
+                if report.errors:
+                    messages.warning(
+                        request, f"Записей с ошибками: {len(report.errors)}"
+                    )
+                messages.success(request, report.summary())
+
+        context = {
+            **self.admin_site.each_context(request),
+            'title': "Импорт вопросов",
+            'opts': self.model._meta,
+            'form': form,
+            'report': report,
+        }
+        return TemplateResponse(request, 'admin/import_questions.html', context)
+
+    @admin.action(description="📋 Добавить выбранные вопросы в другие билеты")
     def clone_questions_to_tickets(self, request, queryset):
-        """Массовое действие для клонирования вопросов в другие билеты"""
+        """Массовое действие: добавить вопросы в другие билеты без копирования"""
         if 'apply' in request.POST:
             ticket_ids = request.POST.getlist('tickets')
             if not ticket_ids:
-                messages.error(request, "Необходимо выбрать билеты для клонирования")
+                messages.error(request, "Необходимо выбрать билеты")
                 return redirect(request.get_full_path())
 
             tickets = Ticket.objects.filter(id__in=ticket_ids, is_active=True)
-            cloned_count = 0
+            questions = list(queryset)
 
-            for question in queryset:
-                for ticket in tickets:
-                    if question.ticket != ticket:  # Не клонируем в тот же билет
-                        self._create_question_copy(question, ticket, request.user)
-                        cloned_count += 1
+            for ticket in tickets:
+                # Уже входящие в билет вопросы пропускаются
+                ticket.add_questions(questions)
 
-            messages.success(request, f"Создано {cloned_count} копий вопросов")
+            messages.success(
+                request,
+                f"Вопросы ({len(questions)}) добавлены "
+                f"в выбранные билеты ({len(tickets)})",
+            )
             return redirect(request.get_full_path())
 
         # Показываем форму выбора билетов
         tickets = Ticket.objects.filter(is_active=True)
         context = {
-            'title': "Клонирование вопросов в другие билеты",
+            'title': "Добавление вопросов в другие билеты",
             'questions': queryset,
             'tickets': tickets,
             'action': 'clone_questions_to_tickets'
@@ -422,8 +451,8 @@ class QuestionAdmin(ModelAdmin):
 @admin.register(Answer)
 class AnswerAdmin(ModelAdmin):
     list_display = ["text_preview", "question", "question_ticket_display", "is_correct", "is_active", "order"]
-    list_filter = ["is_correct", "is_active", "question__ticket__themes"]
-    search_fields = ["text", "question__text", "question__ticket__title"]
+    list_filter = ["is_correct", "is_active", "question__tickets__themes"]
+    search_fields = ["text", "question__text", "question__tickets__title"]
 
     fieldsets = (
         ("Основная информация", {
@@ -432,36 +461,46 @@ class AnswerAdmin(ModelAdmin):
     )
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('question__ticket').prefetch_related('question__ticket__themes')
+        return (
+            super()
+            .get_queryset(request)
+            .select_related('question')
+            .prefetch_related('question__tickets')
+        )
 
     @display(description="Текст ответа")
     def text_preview(self, obj):
         return obj.text[:80] + "..." if len(obj.text) > 80 else obj.text
 
-    @display(description="Билет вопроса")
+    @display(description="Билеты вопроса")
     def question_ticket_display(self, obj):
-        return obj.question.ticket.title
+        return ", ".join([ticket.title for ticket in obj.question.tickets.all()]) or "—"
 
 
 # Остальные admin-классы остаются без изменений
 @admin.register(UserAnswer)
 class UserAnswerAdmin(ModelAdmin):
     list_display = ["user", "question_preview", "question_ticket_display", "is_correct", "answered_at"]
-    list_filter = ["is_correct", "answered_at", "question__ticket__themes"]
-    search_fields = ["user__username", "question__text", "question__ticket__title"]
+    list_filter = ["is_correct", "answered_at", "question__tickets__themes"]
+    search_fields = ["user__username", "question__text", "question__tickets__title"]
     readonly_fields = ["answered_at"]
     filter_horizontal = ["selected_answers"]
 
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('user', 'question__ticket').prefetch_related('question__ticket__themes')
+        return (
+            super()
+            .get_queryset(request)
+            .select_related('user', 'question')
+            .prefetch_related('question__tickets')
+        )
 
     @display(description="Вопрос")
     def question_preview(self, obj):
         return obj.question.text[:80] + "..." if len(obj.question.text) > 80 else obj.question.text
 
-    @display(description="Билет")
+    @display(description="Билеты")
     def question_ticket_display(self, obj):
-        return obj.question.ticket.title
+        return ", ".join([ticket.title for ticket in obj.question.tickets.all()]) or "—"
 
 
 @admin.register(TicketProgress)
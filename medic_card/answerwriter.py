@@ -0,0 +1,181 @@
+"""Запись ответов на вопросы билета: сразу или через общий поток-писатель.
+
+apply_answer выполняет все записи одного ответа (UserAnswer, выбранные
+варианты, TicketProgress). По умолчанию submit_answer вызывает его в
+своей транзакции. При ANSWER_WRITE_BEHIND ответы ставятся в очередь
+WRITER: поток забирает ответы, накопившиеся за ANSWER_WRITE_BATCH_WINDOW
+секунд (не больше ANSWER_WRITE_BATCH_SIZE), и пишет их одной транзакцией -
+SQLite берет блокировку записи и делает fsync один раз на пачку.
+
+record_answer возвращается только после COMMIT пачки, поэтому ответ,
+на который пользователь получил редирект, уже сохранен. Каждый ответ
+пишется в своей точке сохранения: ошибка в одном не откатывает остальные.
+Писатель свой в каждом процессе gunicorn; между процессами записи
+по-прежнему упорядочивает блокировка SQLite. Ответы одного пользователя
+пишутся в порядке поступления (очередь одна, поток один). При остановке
+воркера stop() дописывает очередь до выхода процесса.
+"""
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import TicketProgress, UserAnswer
+
+logger = logging.getLogger("medic_card.answerwriter")
+
+
+class AnswerWriteTimeout(Exception):
+    """Писатель не подтвердил запись за ANSWER_WRITE_TIMEOUT секунд"""
+
+
+# Метка в очереди: записать накопленное и завершить поток
+STOP = object()
+
+
+@dataclass
+class AnswerWrite:
+    user_id: int
+    question_id: int
+    progress_id: int
+    answer_ids: list
+    is_correct: bool
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+    error: Exception = None
+
+
+def apply_answer(write):
+    """Сохраняет ответ и пересчитывает правильные ответы в прогрессе.
+
+    Повторное применение того же ответа прогресс не меняет, поэтому
+    после AnswerWriteTimeout ответ можно безопасно отправить снова.
+    """
+    progress = TicketProgress.objects.get(pk=write.progress_id)
+    user_answer, created = UserAnswer.objects.get_or_create(
+        user_id=write.user_id,
+        question_id=write.question_id,
+        defaults={"is_correct": write.is_correct},
+    )
+
+    # Ответ из прошлой попытки (или из другого билета с этим же вопросом)
+    # учитывается в прогрессе как новый
+    counted = not created and user_answer.answered_at >= progress.started_at
+    old_correct = user_answer.is_correct
+
+    user_answer.is_correct = write.is_correct
+    user_answer.answered_at = timezone.now()
+    user_answer.save()
+    user_answer.selected_answers.set(write.answer_ids)
+
+    if not counted:
+        if write.is_correct:
+            progress.correct_answers += 1
+    elif write.is_correct and not old_correct:
+        progress.correct_answers += 1
+    elif not write.is_correct and old_correct:
+        progress.correct_answers = max(0, progress.correct_answers - 1)
+    progress.save(update_fields=["correct_answers"])
+
+
+class AnswerWriter:
+    """Фоновый поток, записывающий ответы из очереди пачками"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(
+                        target=self.run, name="medic-card-answers", daemon=True
+                    )
+                    self.thread.start()
+
+    def submit(self, write):
+        """Ставит ответ в очередь и ждет фиксации его пачки"""
+        self.ensure_started()
+        self.queue.put(write)
+        if not write.done.wait(settings.ANSWER_WRITE_TIMEOUT):
+            raise AnswerWriteTimeout
+        if write.error is not None:
+            raise write.error
+
+    def stop(self, timeout=None):
+        """Дописывает очередь и останавливает поток (при выходе воркера)"""
+        with self.lock:
+            thread = self.thread
+            if thread is None or not thread.is_alive():
+                return
+            self.queue.put(STOP)
+        thread.join(timeout)
+
+    def collect(self):
+        """Пачка ответов и признак того, что после нее поток завершается"""
+        batch = []
+        deadline = None
+        while len(batch) < settings.ANSWER_WRITE_BATCH_SIZE:
+            try:
+                if deadline is None:
+                    write = self.queue.get()
+                    deadline = time.monotonic() + settings.ANSWER_WRITE_BATCH_WINDOW
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    write = self.queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if write is STOP:
+                return batch, True
+            batch.append(write)
+        return batch, False
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self.collect()
+            if not batch:
+                continue
+            try:
+                self.write(batch)
+            except Exception as error:
+                logger.exception("Не удалось записать пачку ответов")
+                for write in batch:
+                    write.error = write.error or error
+            finally:
+                close_old_connections()
+                for write in batch:
+                    write.done.set()
+
+    def write(self, batch):
+        with transaction.atomic():
+            for write in batch:
+                try:
+                    with transaction.atomic():
+                        apply_answer(write)
+                except (DatabaseError, ObjectDoesNotExist) as error:
+                    write.error = error
+        metrics.ANSWER_WRITE_BATCH.observe(len(batch))
+
+
+WRITER = AnswerWriter()
+
+
+def record_answer(write):
+    """Записывает ответ сразу или через WRITER (ANSWER_WRITE_BEHIND)"""
+    if settings.ANSWER_WRITE_BEHIND:
+        WRITER.submit(write)
+        return
+    with transaction.atomic():
+        apply_answer(write)
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MedicCardConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "medic_card"
+
+    def ready(self):
+        import medic_card.checks
+        import medic_card.pagecache
+        import medic_card.images  # noqa: F401 - подключает сигналы изображений
+        from medic_card.warmup import warm_after_migrate
+
+        post_migrate.connect(warm_after_migrate, sender=self)
@@ -0,0 +1,216 @@
+"""Нагрузочный прогон основных сценариев сайта.
+
+Каждый симулируемый пользователь работает в своем потоке со своим
+тестовым клиентом (и своим соединением с БД) и по кругу выполняет
+сценарии просмотра (главная, тема, поиск) и прохождения билета
+(start_ticket -> take_question -> submit_answer -> next_question ->
+ticket_result). Для каждого запроса замеряются время ответа и число
+SQL-запросов, итог группируется по имени URL.
+"""
+
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.db import close_old_connections, connections
+from django.test import Client
+from django.urls import resolve, reverse
+
+from .db.routers import execute_wrapper_all
+from .models import Question, Theme, Ticket, TicketProgress
+
+SCENARIOS = ("browse", "quiz")
+ANSWER_INPUT_RE = re.compile(r'name="answers" value="(\d+)"')
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга (values отсортированы)"""
+    if not values:
+        return 0.0
+    rank = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class QueryCounter:
+    """execute_wrapper, считающий SQL-запросы во всех псевдонимах базы"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Recorder:
+    """Потокобезопасный сборщик замеров по именам URL"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def add(self, name, elapsed, queries, failed):
+        with self.lock:
+            self.latencies[name].append(elapsed)
+            self.queries[name].append(queries)
+            if failed:
+                self.errors[name] += 1
+
+    def summary(self, duration):
+        views = {}
+        for name in sorted(self.latencies):
+            latencies = sorted(self.latencies[name])
+            queries = self.queries[name]
+            views[name] = {
+                "requests": len(latencies),
+                "errors": self.errors[name],
+                "rps": round(len(latencies) / duration, 2) if duration else 0.0,
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+                "queries_avg": round(sum(queries) / len(queries), 2),
+                "queries_max": max(queries),
+            }
+        total = sum(view["requests"] for view in views.values())
+        return {
+            "duration_s": round(duration, 2),
+            "requests": total,
+            "errors": sum(view["errors"] for view in views.values()),
+            "rps": round(total / duration, 2) if duration else 0.0,
+            "views": views,
+        }
+
+
+class SimulatedUser:
+    """Один пользователь: тестовый клиент и сценарии"""
+
+    def __init__(self, user, recorder, data, seed):
+        self.user = user
+        self.recorder = recorder
+        self.data = data
+        self.rng = random.Random(seed)
+        self.client = Client(HTTP_HOST="localhost", raise_request_exception=False)
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None):
+        name = resolve(path).url_name
+        queries = QueryCounter()
+        with execute_wrapper_all(queries):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, data or {})
+            elapsed = time.perf_counter() - started
+        self.recorder.add(name, elapsed, queries.count, response.status_code >= 400)
+        return response
+
+    def browse(self):
+        self.request("get", reverse("medic_card:home"))
+        theme_id = self.rng.choice(self.data["theme_ids"])
+        self.request("get", reverse("medic_card:theme_detail", args=[theme_id]))
+        query = self.rng.choice(self.data["words"])
+        self.request("get", reverse("medic_card:search"), {"q": query})
+
+    def quiz(self):
+        ticket_id = self.rng.choice(self.data["ticket_ids"])
+        # Подготовка, не входит в замеры: билет проходится с начала
+        TicketProgress.objects.filter(user=self.user, ticket_id=ticket_id).delete()
+
+        response = self.request(
+            "get", reverse("medic_card:start_ticket", args=[ticket_id])
+        )
+        index = 0
+        while response.status_code == 302:
+            match = resolve(response.url.split("?")[0])
+            if match.url_name != "take_question":
+                self.request("get", response.url)
+                break
+            response = self.request("get", response.url)
+            answer_ids = ANSWER_INPUT_RE.findall(response.content.decode())
+            if response.status_code != 200 or not answer_ids:
+                break
+            self.request(
+                "post",
+                reverse("medic_card:submit_answer", args=[ticket_id, index]),
+                {"answers": [self.rng.choice(answer_ids)]},
+            )
+            response = self.request(
+                "get", reverse("medic_card:next_question", args=[ticket_id, index])
+            )
+            index += 1
+
+    def run(self, scenarios, deadline, iterations):
+        try:
+            done = 0
+            while time.monotonic() < deadline and (not iterations or done < iterations):
+                for scenario in scenarios:
+                    getattr(self, scenario)()
+                done += 1
+        finally:
+            connections.close_all()
+
+
+def load_benchmark_data(seed):
+    """Темы, билеты и слова для поиска, по которым ходят пользователи"""
+    rng = random.Random(seed)
+    theme_ids = list(Theme.objects.filter(is_active=True).values_list("id", flat=True))
+    ticket_ids = list(
+        Ticket.objects.filter(
+            is_active=True, is_temporary=False, question_links__isnull=False
+        )
+        .distinct()
+        .values_list("id", flat=True)
+    )
+    texts = list(
+        Question.objects.filter(is_active=True)
+        .order_by("id")
+        .values_list("text", flat=True)[:200]
+    )
+    words = sorted(
+        {word for text in texts for word in re.findall(r"\w{4,}", text)}
+    ) or ["вопрос"]
+    return {
+        "theme_ids": theme_ids,
+        "ticket_ids": ticket_ids,
+        "words": rng.sample(words, min(len(words), 50)),
+    }
+
+
+def run_benchmark(users, scenarios=SCENARIOS, duration=30.0, iterations=0, seed=42):
+    """Запускает пользователей в потоках и возвращает сводку замеров"""
+    data = load_benchmark_data(seed)
+    if not data["theme_ids"] or not data["ticket_ids"]:
+        raise ValueError("Нет тем или билетов с вопросами")
+
+    recorder = Recorder()
+    simulated = [
+        SimulatedUser(user, recorder, data, seed + number)
+        for number, user in enumerate(users)
+    ]
+    started = time.monotonic()
+    deadline = started + duration if duration else float("inf")
+
+    def worker(simulated_user):
+        close_old_connections()
+        simulated_user.run(scenarios, deadline, iterations)
+
+    threads = [
+        threading.Thread(target=worker, args=(simulated_user,))
+        for simulated_user in simulated
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = recorder.summary(time.monotonic() - started)
+    result["config"] = {
+        "users": len(simulated),
+        "scenarios": list(scenarios),
+        "duration": duration,
+        "iterations": iterations,
+        "seed": seed,
+    }
+    return result
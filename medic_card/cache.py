@@ -0,0 +1,236 @@
+"""Бэкенды кэша Django: с учетом попаданий для Server-Timing и счетчики
+ограничения частоты в общем файле SQLite"""
+
+import itertools
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+from .timing import record_cache_lookup
+
+logger = logging.getLogger("medic_card.cache")
+
+_MISSING = object()
+
+
+class CacheStatsMixin:
+    """Учитывает обращения get в замерах текущего запроса.
+
+    get_many в базовом классе вызывает get для каждого ключа, поэтому
+    отдельно не переопределяется.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            record_cache_lookup(0, 1)
+            return default
+        record_cache_lookup(1)
+        return value
+
+
+class InstrumentedLocMemCache(CacheStatsMixin, LocMemCache):
+    pass
+
+
+class InstrumentedFileBasedCache(CacheStatsMixin, FileBasedCache):
+    pass
+
+
+class SQLiteCounterCache(BaseCache):
+    """Общий для процессов кэш счетчиков в файле SQLite (WAL).
+
+    Хранилище ограничения частоты (RATELIMIT_USE_CACHE): add и incr - один
+    оператор SQL каждый, поэтому атомарны и между воркерами gunicorn, а
+    счетчики переживают перезапуск. take() - атомарное ведро токенов для
+    лимитов с запасом на всплеск (см. medic_card/ratelimit.py).
+
+    Целые числа хранятся как INTEGER, остальные значения - pickle.
+    Просроченные строки удаляются раз в CULL_EVERY записей (OPTIONS).
+    При ошибке SQLite операции ведут себя как промах: решение, пропускать
+    ли запрос, принимает RATELIMIT_FAIL_OPEN.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self.local = threading.local()
+        self.cull_every = params.get("OPTIONS", {}).get("CULL_EVERY", 1000)
+        self.writes = itertools.count(1)
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters (key TEXT PRIMARY KEY, "
+                "value, expires REAL) WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS counters_expires ON counters (expires)"
+            )
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def operation(self, name):
+        """Замер операции; ошибка SQLite пишется в лог и пробрасывается"""
+        started = time.perf_counter()
+        try:
+            yield self.connect()
+        except sqlite3.Error:
+            metrics.COUNTER_STORE_ERRORS.inc(op=name)
+            logger.warning("Хранилище счетчиков: ошибка в %s", name, exc_info=True)
+            raise
+        finally:
+            metrics.COUNTER_STORE_LATENCY.observe(
+                time.perf_counter() - started, op=name
+            )
+
+    @staticmethod
+    def encode(value):
+        return value if type(value) is int else pickle.dumps(value)
+
+    @staticmethod
+    def decode(value):
+        return pickle.loads(value) if isinstance(value, bytes) else value
+
+    def wrote(self, conn):
+        if next(self.writes) % self.cull_every == 0:
+            conn.execute("DELETE FROM counters WHERE expires <= ?", (time.time(),))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        try:
+            with self.operation("add") as conn:
+                # Просроченную строку add перезаписывает, живую - нет
+                cursor = conn.execute(
+                    "INSERT INTO counters (key, value, expires) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                    "expires = excluded.expires WHERE counters.expires <= ?",
+                    (key, self.encode(value), self.get_backend_timeout(timeout), now),
+                )
+                self.wrote(conn)
+        except sqlite3.Error:
+            return False
+        return cursor.rowcount == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        try:
+            with self.operation("get") as conn:
+                row = conn.execute(
+                    "SELECT value FROM counters WHERE key = ? "
+                    "AND (expires IS NULL OR expires > ?)",
+                    (key, time.time()),
+                ).fetchone()
+        except sqlite3.Error:
+            return default
+        return default if row is None else self.decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        try:
+            with self.operation("set") as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO counters (key, value, expires) "
+                    "VALUES (?, ?, ?)",
+                    (key, self.encode(value), self.get_backend_timeout(timeout)),
+                )
+                self.wrote(conn)
+        except sqlite3.Error:
+            pass
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        try:
+            with self.operation("incr") as conn:
+                # fetchall: оператор должен завершиться, иначе транзакция
+                # записи останется открытой
+                rows = conn.execute(
+                    "UPDATE counters SET value = value + ? WHERE key = ? "
+                    "AND (expires IS NULL OR expires > ?) RETURNING value",
+                    (delta, key, time.time()),
+                ).fetchall()
+        except sqlite3.Error:
+            rows = []
+        if not rows:
+            raise ValueError(f"Key '{key}' not found")
+        return rows[0][0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        try:
+            with self.operation("touch") as conn:
+                cursor = conn.execute(
+                    "UPDATE counters SET expires = ? WHERE key = ? "
+                    "AND (expires IS NULL OR expires > ?)",
+                    (self.get_backend_timeout(timeout), key, time.time()),
+                )
+        except sqlite3.Error:
+            return False
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        try:
+            with self.operation("delete") as conn:
+                cursor = conn.execute("DELETE FROM counters WHERE key = ?", (key,))
+        except sqlite3.Error:
+            return False
+        return cursor.rowcount == 1
+
+    def clear(self):
+        with self.operation("clear") as conn:
+            conn.execute("DELETE FROM counters")
+
+    def take(self, key, capacity, refill_rate, cost=1, version=None):
+        """Берет cost токенов из ведра емкостью capacity.
+
+        Ведро пополняется на refill_rate токенов в секунду. Возвращает
+        (разрешено, через сколько секунд хватит токенов). Строка живет,
+        пока ведро не наполнится снова: отсутствие строки - полное ведро.
+        """
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        with self.operation("take") as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM counters WHERE key = ? AND expires > ?",
+                    (key, now),
+                ).fetchone()
+                tokens = capacity
+                if row is not None:
+                    tokens, updated = self.decode(row[0])
+                    tokens = min(capacity, tokens + (now - updated) * refill_rate)
+                allowed = tokens >= cost
+                if allowed:
+                    tokens -= cost
+                conn.execute(
+                    "INSERT OR REPLACE INTO counters (key, value, expires) "
+                    "VALUES (?, ?, ?)",
+                    (
+                        key,
+                        self.encode((tokens, now)),
+                        now + (capacity - tokens) / refill_rate,
+                    ),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.wrote(conn)
+        retry_after = 0.0 if allowed else (cost - tokens) / refill_rate
+        return allowed, retry_after
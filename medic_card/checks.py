@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.checks import Error, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+
+from .querybudget import uncovered_url_names
+from .ratelimit import get_policy
+
+
+@register()
+def query_budgets_check(app_configs, **kwargs):
+    """Каждое представление приложения должно иметь бюджет SQL-запросов"""
+    return [
+        Warning(
+            f"Для {name} не объявлен бюджет SQL-запросов",
+            hint="Добавьте имя URL в settings.QUERY_BUDGETS",
+            id="medic_card.W001",
+        )
+        for name in uncovered_url_names()
+    ]
+
+
+@register()
+def ratelimit_policies_check(app_configs, **kwargs):
+    """Политики ограничения частоты должны разбираться"""
+    errors = []
+    for name in settings.RATELIMIT_POLICIES:
+        try:
+            get_policy(name)
+        except (ImproperlyConfigured, KeyError, TypeError) as error:
+            errors.append(
+                Error(
+                    f"Политика ограничения частоты {name}: {error}",
+                    hint="Ожидается {'rate': '600/h', 'burst': 100}",
+                    id="medic_card.E001",
+                )
+            )
+    return errors
@@ -0,0 +1,79 @@
+"""Условные GET (ETag / Last-Modified) для страниц темы, билета и вопроса.
+
+Дата изменения страницы - самая поздняя updated_at среди объектов, которые
+на ней видны (сама тема и ее билеты, билет с вопросами и темами, вопрос с
+билетами и их темами). Она считается одним агрегатным запросом, поэтому
+повторный визит с If-None-Match / If-Modified-Since получает
+304 Not Modified без выборки и отрисовки страницы.
+
+Чтобы дата не уменьшалась при удалении или исключении объекта, сигналы в
+pagecache обновляют updated_at у объектов по обе стороны связи.
+"""
+
+import hashlib
+
+from django.db.models import Max, Q
+from django.views.decorators.http import condition
+
+from .models import Question, Theme, Ticket
+
+# Временные билеты работы над ошибками на публичных страницах не видны
+PERMANENT_TICKETS = Q(tickets__is_temporary=False)
+
+
+def _latest(values):
+    dates = [value for value in values.values() if value is not None]
+    return max(dates) if dates else None
+
+
+def theme_last_modified(theme_id):
+    return _latest(
+        Theme.objects.filter(pk=theme_id, is_active=True).aggregate(
+            own_updated=Max("updated_at"),
+            tickets_updated=Max("tickets__updated_at", filter=PERMANENT_TICKETS),
+        )
+    )
+
+
+def ticket_last_modified(ticket_id):
+    return _latest(
+        Ticket.objects.filter(pk=ticket_id, is_active=True).aggregate(
+            own_updated=Max("updated_at"),
+            questions_updated=Max("questions__updated_at"),
+            themes_updated=Max("themes__updated_at"),
+        )
+    )
+
+
+def question_last_modified(question_id):
+    return _latest(
+        Question.objects.filter(pk=question_id, is_active=True).aggregate(
+            own_updated=Max("updated_at"),
+            tickets_updated=Max("tickets__updated_at", filter=PERMANENT_TICKETS),
+            themes_updated=Max("tickets__themes__updated_at", filter=PERMANENT_TICKETS),
+        )
+    )
+
+
+def content_condition(last_modified):
+    """condition() с ETag и Last-Modified по дате изменения контента.
+
+    Страница зависит и от пользователя (меню, ссылки входа), поэтому
+    ETag у каждого пользователя свой, а у всех анонимов общий.
+    """
+
+    def get_last_modified(request, *args, **kwargs):
+        # condition вызывает обе функции; агрегат считается один раз
+        if not hasattr(request, "content_last_modified"):
+            request.content_last_modified = last_modified(*args, **kwargs)
+        return request.content_last_modified
+
+    def get_etag(request, *args, **kwargs):
+        modified = get_last_modified(request, *args, **kwargs)
+        if modified is None:
+            return None
+        user_id = request.user.pk if request.user.is_authenticated else 0
+        key = f"{request.path}:{modified.isoformat()}:{user_id}"
+        return hashlib.md5(key.encode()).hexdigest()
+
+    return condition(etag_func=get_etag, last_modified_func=get_last_modified)
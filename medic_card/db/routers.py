@@ -0,0 +1,72 @@
+"""Чтение через отдельное соединение SQLite только для чтения.
+
+Псевдоним READONLY_ALIAS открывает тот же файл базы с mode=ro (см.
+READONLY_OPTIONS в settings). В режиме WAL читатели не ждут писателя,
+поэтому выборки идут через это соединение и не стоят в очереди за
+BEGIN IMMEDIATE записей в default.
+
+Файл один и тот же, отставания реплики нет: зафиксированные записи видны
+следующему чтению сразу. Поэтому в default остаются только:
+
+- все записи (db_for_write) и миграции;
+- чтения внутри транзакции default (atomic), которые должны видеть ее
+  незафиксированные изменения;
+- код, явно обернутый в use_primary() (например, проверка перед записью,
+  которой нужна та же транзакция).
+"""
+
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+READONLY_ALIAS = "readonly"
+
+_use_primary = ContextVar("medic_card_use_primary", default=False)
+
+
+@contextmanager
+def use_primary():
+    """Направляет чтения в default; работает и как декоратор @use_primary()"""
+    token = _use_primary.set(True)
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+def reads_from_primary():
+    return (
+        _use_primary.get()
+        or READONLY_ALIAS not in settings.DATABASES
+        or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    )
+
+
+@contextmanager
+def execute_wrapper_all(wrapper):
+    """connection.execute_wrapper сразу для всех псевдонимов базы"""
+    with ExitStack() as stack:
+        for alias in settings.DATABASES:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+class ReadOnlyRouter:
+    """Чтения - в READONLY_ALIAS, записи и миграции - в default"""
+
+    def db_for_read(self, model, **hints):
+        if reads_from_primary():
+            return DEFAULT_DB_ALIAS
+        return READONLY_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Оба псевдонима - одна и та же база
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,69 @@
+"""SQLite для работы под нагрузкой: PRAGMA при подключении и BEGIN IMMEDIATE.
+
+Параметры задаются в DATABASES[...]["OPTIONS"]:
+
+    "pragmas"          - PRAGMA, выполняемые на каждом новом соединении
+                         (дополняют и переопределяют DEFAULT_PRAGMAS);
+    "transaction_mode" - режим BEGIN для atomic(): "IMMEDIATE" (по
+                         умолчанию), "DEFERRED" или "EXCLUSIVE";
+    "read_only"        - открыть файл с mode=ro (псевдоним для чтения,
+                         см. medic_card/db/routers.py).
+
+Со штатным BEGIN (DEFERRED) транзакция, которая сначала читает, а потом
+пишет, при занятой блокировке сразу получает "database is locked" - SQLite
+не может ждать busy_timeout, не нарушив изоляцию. BEGIN IMMEDIATE берет
+блокировку записи в начале транзакции, и конкурирующие записи ждут друг
+друга в пределах busy_timeout.
+
+Соединение переиспользуется между запросами при CONN_MAX_AGE > 0, а при
+CONN_HEALTH_CHECKS перед каждым запросом проверяется is_usable.
+"""
+
+from pathlib import Path
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # WAL: читатели не блокируют писателя и наоборот
+    "journal_mode": "WAL",
+    # В режиме WAL NORMAL не теряет целостность, fsync только при checkpoint
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,
+    # Отрицательное значение - размер в КиБ (на соединение)
+    "cache_size": -20000,
+    "mmap_size": 128 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        # Остальные OPTIONS передаются в sqlite3.connect
+        self.pragmas = {**DEFAULT_PRAGMAS, **params.pop("pragmas", {})}
+        self.transaction_mode = params.pop("transaction_mode", "IMMEDIATE").upper()
+        if self.transaction_mode not in TRANSACTION_MODES:
+            raise ValueError(f"Неизвестный transaction_mode: {self.transaction_mode}")
+        if params.pop("read_only", False) and not self.is_in_memory_db():
+            # Режим журнала хранится в файле и меняется только на запись
+            self.pragmas.pop("journal_mode", None)
+            path = Path(params["database"]).resolve()
+            params["database"] = f"{path.as_uri()}?mode=ro"
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def is_usable(self):
+        try:
+            self.connection.execute("SELECT 1")
+        except self.Database.Error:
+            return False
+        return True
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f"BEGIN {self.transaction_mode}")
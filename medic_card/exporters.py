@@ -0,0 +1,217 @@
+"""Потоковая выгрузка банка вопросов и результатов пользователей.
+
+Все генераторы читают данные через .iterator(chunk_size=...), поэтому
+память не зависит от объема выгрузки. Формат выгрузки вопросов
+совпадает с форматом импорта (см. medic_card.importers).
+"""
+
+import csv
+import json
+
+from django.contrib.auth.models import User
+from django.db.models import Count, Max, Prefetch
+
+from .models import Answer, TicketProgress, TicketQuestion, UserAnswer
+
+CHUNK_SIZE = 2000
+FORMATS = ("csv", "jsonl")
+
+
+class Echo:
+    """Псевдо-буфер для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def select_users(usernames=None, group=None):
+    """Пользователи для выгрузки: по именам и/или по группе (когорте)"""
+    users = User.objects.all()
+    if usernames:
+        users = users.filter(username__in=usernames)
+    if group:
+        users = users.filter(groups__name=group)
+    return users
+
+
+def _question_links(theme_id=None, ticket_id=None):
+    links = TicketQuestion.objects.filter(ticket__is_temporary=False)
+    if theme_id:
+        links = links.filter(ticket__themes__id=theme_id)
+    if ticket_id:
+        links = links.filter(ticket_id=ticket_id)
+    return links
+
+
+def max_answers_count(theme_id=None, ticket_id=None):
+    """Максимальное число вариантов ответа у выгружаемых вопросов"""
+    question_ids = _question_links(theme_id, ticket_id).values("question_id")
+    return (
+        Answer.objects.filter(question_id__in=question_ids)
+        .values("question_id")
+        .annotate(total=Count("id"))
+        .aggregate(Max("total"))["total__max"]
+        or 0
+    )
+
+
+def iter_questions(theme_id=None, ticket_id=None):
+    """Записи вопросов (по одной на вхождение вопроса в билет)"""
+    links = (
+        _question_links(theme_id, ticket_id)
+        .select_related("ticket", "question")
+        .prefetch_related(
+            "ticket__themes",
+            Prefetch(
+                "question__answers",
+                queryset=Answer.objects.order_by("order", "id"),
+            ),
+        )
+        .order_by("ticket_id", "order", "id")
+    )
+    for link in links.iterator(chunk_size=CHUNK_SIZE):
+        question = link.question
+        yield {
+            "theme": ";".join(theme.title for theme in link.ticket.themes.all()),
+            "ticket": link.ticket.title,
+            "text": question.text,
+            "image": question.image.name if question.image else "",
+            "order": link.order,
+            "answers": [
+                {"text": answer.text, "is_correct": answer.is_correct}
+                for answer in question.answers.all()
+            ],
+        }
+
+
+def iter_user_answers(users):
+    """Ответы пользователей на вопросы"""
+    answers = (
+        UserAnswer.objects.filter(user__in=users)
+        .select_related("user", "question")
+        .prefetch_related("selected_answers")
+        .order_by("user_id", "answered_at", "id")
+    )
+    for answer in answers.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            "user": answer.user.username,
+            "question_id": answer.question_id,
+            "question": answer.question.text,
+            "is_correct": answer.is_correct,
+            "answered_at": answer.answered_at.isoformat(),
+            "selected_answers": [
+                selected.text for selected in answer.selected_answers.all()
+            ],
+        }
+
+
+def iter_ticket_progress(users):
+    """Прогресс пользователей по постоянным билетам"""
+    progress_list = (
+        TicketProgress.objects.filter(user__in=users, ticket__is_temporary=False)
+        .select_related("user", "ticket")
+        .order_by("user_id", "ticket_id")
+    )
+    for progress in progress_list.iterator(chunk_size=CHUNK_SIZE):
+        yield {
+            "user": progress.user.username,
+            "ticket_id": progress.ticket_id,
+            "ticket": progress.ticket.title,
+            "is_completed": progress.is_completed,
+            "correct_answers": progress.correct_answers,
+            "total_questions": progress.total_questions,
+            "started_at": progress.started_at.isoformat(),
+            "completed_at": (
+                progress.completed_at.isoformat() if progress.completed_at else ""
+            ),
+            "time_spent_seconds": (
+                int(progress.time_spent.total_seconds()) if progress.time_spent else ""
+            ),
+        }
+
+
+def _flatten_question(record, answers_count):
+    row = {key: record[key] for key in ("theme", "ticket", "text", "image", "order")}
+    correct = []
+    for number in range(1, answers_count + 1):
+        answer = (
+            record["answers"][number - 1]
+            if number <= len(record["answers"])
+            else None
+        )
+        row[f"answer_{number}"] = answer["text"] if answer else ""
+        if answer and answer["is_correct"]:
+            correct.append(str(number))
+    row["correct"] = ";".join(correct)
+    return row
+
+
+def question_csv_header(answers_count):
+    return ["theme", "ticket", "text", "image", "order"] + [
+        f"answer_{number}" for number in range(1, answers_count + 1)
+    ] + ["correct"]
+
+
+def stream_questions(fmt, theme_id=None, ticket_id=None):
+    """Строки выгрузки вопросов в формате csv или jsonl"""
+    records = iter_questions(theme_id, ticket_id)
+    if fmt == "jsonl":
+        return stream_jsonl(records)
+    answers_count = max_answers_count(theme_id, ticket_id)
+    return stream_csv(
+        question_csv_header(answers_count),
+        (_flatten_question(record, answers_count) for record in records),
+    )
+
+
+def stream_csv(header, records):
+    """Строки CSV для потокового ответа или файла"""
+    writer = csv.DictWriter(Echo(), fieldnames=header)
+    yield writer.writerow(dict(zip(header, header)))
+    for record in records:
+        yield writer.writerow(
+            {
+                key: ";".join(value) if isinstance(value, list) else value
+                for key, value in record.items()
+            }
+        )
+
+
+def stream_jsonl(records):
+    """Строки JSON Lines для потокового ответа или файла"""
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False) + "\n"
+
+
+RESULT_HEADERS = {
+    "answers": [
+        "user",
+        "question_id",
+        "question",
+        "is_correct",
+        "answered_at",
+        "selected_answers",
+    ],
+    "progress": [
+        "user",
+        "ticket_id",
+        "ticket",
+        "is_completed",
+        "correct_answers",
+        "total_questions",
+        "started_at",
+        "completed_at",
+        "time_spent_seconds",
+    ],
+}
+
+
+def stream_results(fmt, kind, users):
+    """Строки выгрузки ответов или прогресса пользователей"""
+    if kind == "answers":
+        records = iter_user_answers(users)
+    else:
+        records = iter_ticket_progress(users)
+    if fmt == "jsonl":
+        return stream_jsonl(records)
+    return stream_csv(RESULT_HEADERS[kind], records)
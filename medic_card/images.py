@@ -0,0 +1,240 @@
+"""Уменьшенные копии изображений вопросов.
+
+Для изображения вопроса создаются копии шириной RENDITION_WIDTHS (не шире
+оригинала) в WebP и JPEG в подкаталоге renditions/ рядом с оригиналом.
+Размеры оригинала и список готовых ширин сохраняются в Question, поэтому
+тег {% question_image %} строит srcset без обращений к хранилищу.
+
+Изображение, загруженное в админке, обрабатывается при сохранении
+вопроса; массовый импорт ставит вопросы в очередь фонового потока
+(WORKER), а для уже загруженных файлов есть команда
+build_image_renditions.
+
+Оригиналы называются по хэшу содержимого (см. storage.py), поэтому копии
+одного файла общие для всех вопросов с ним. Файлы, на которые не ссылается
+ни один вопрос, находит unreferenced_files (команда gc_media).
+"""
+
+import logging
+import os
+import queue
+import re
+import threading
+from datetime import timedelta
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models import Count
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Question
+from .pagecache import bump_content_version
+
+logger = logging.getLogger("medic_card.images")
+
+RENDITION_WIDTHS = (200, 400, 800)
+# Расширение файла -> формат Pillow и параметры сохранения
+RENDITION_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+IMAGE_ERRORS = (OSError, UnidentifiedImageError, Image.DecompressionBombError)
+UPLOAD_DIR = Question._meta.get_field("image").upload_to.rstrip("/")
+RENDITION_RE = re.compile(r"^(?P<stem>.+)-\d+w\.[a-z]+$")
+
+
+def rendition_name(name, width, extension):
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return f"{directory}/renditions/{stem}-{width}w.{extension}"
+
+
+def rendition_url(name, width, extension):
+    return default_storage.url(rendition_name(name, width, extension))
+
+
+def _open(name):
+    with default_storage.open(name, "rb") as file:
+        image = Image.open(file)
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    # Прозрачность сохраняется для WebP; для JPEG подложим белый фон
+    if image.mode in ("P", "LA", "RGBA") or "transparency" in image.info:
+        return image.convert("RGBA")
+    return image.convert("RGB")
+
+
+def _encode(image, extension):
+    fmt, options = RENDITION_FORMATS[extension]
+    if fmt == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, "white")
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+    buffer = BytesIO()
+    image.save(buffer, fmt, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def build_renditions(question, force=False):
+    """Создает копии изображения вопроса и сохраняет его размеры.
+
+    Готовые копии того же файла (он мог быть загружен в другой вопрос)
+    пересоздаются только с force.
+    """
+    name = question.image.name
+    image = _open(name)
+    width, height = image.size
+    widths = sorted({min(target, width) for target in RENDITION_WIDTHS})
+    for target in widths:
+        resized = image
+        if target != width:
+            size = (target, max(round(height * target / width), 1))
+            resized = image.resize(size, Image.Resampling.LANCZOS)
+        for extension in RENDITION_FORMATS:
+            path = rendition_name(name, target, extension)
+            if not force and default_storage.exists(path):
+                continue
+            # save() не перезаписывает файл, а подбирает новое имя
+            default_storage.delete(path)
+            default_storage.save(path, _encode(resized, extension))
+
+    # Условие на image: пока шла обработка, изображение могли заменить
+    Question.objects.filter(pk=question.pk, image=name).update(
+        image_width=width, image_height=height, image_renditions=widths
+    )
+    question.image_width = width
+    question.image_height = height
+    question.image_renditions = widths
+    return widths
+
+
+def image_references():
+    """Число вопросов, ссылающихся на каждый файл изображения"""
+    return {
+        row["image"]: row["count"]
+        for row in Question.objects.exclude(image="")
+        .exclude(image__isnull=True)
+        .values("image")
+        .annotate(count=Count("id"))
+    }
+
+
+def unreferenced_files(min_age=timedelta(0)):
+    """Файлы в UPLOAD_DIR без ссылок из вопросов и копии таких файлов.
+
+    Файлы моложе min_age пропускаются: вопрос с только что загруженным
+    изображением может быть еще не сохранен.
+    """
+    referenced = image_references()
+    stems = {
+        os.path.splitext(os.path.basename(name))[0]
+        for name in referenced
+        if os.path.dirname(name) == UPLOAD_DIR
+    }
+    cutoff = timezone.now() - min_age
+
+    def is_old(name):
+        return default_storage.get_modified_time(name) < cutoff
+
+    if not default_storage.exists(UPLOAD_DIR):
+        return []
+    directories, files = default_storage.listdir(UPLOAD_DIR)
+    garbage = [
+        f"{UPLOAD_DIR}/{filename}"
+        for filename in files
+        if f"{UPLOAD_DIR}/{filename}" not in referenced
+    ]
+    if "renditions" in directories:
+        for filename in default_storage.listdir(f"{UPLOAD_DIR}/renditions")[1]:
+            match = RENDITION_RE.match(filename)
+            if not match or match["stem"] not in stems:
+                garbage.append(f"{UPLOAD_DIR}/renditions/{filename}")
+    return [name for name in garbage if is_old(name)]
+
+
+class RenditionWorker:
+    """Фоновый поток, создающий копии для вопросов из очереди"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(
+                        target=self.run, name="medic-card-renditions", daemon=True
+                    )
+                    self.thread.start()
+
+    def enqueue(self, question_ids):
+        if question_ids:
+            self.queue.put(list(question_ids))
+            self.ensure_started()
+
+    def wait(self):
+        """Ждет, пока очередь будет обработана (для команд)"""
+        self.queue.join()
+
+    def run(self):
+        while True:
+            question_ids = self.queue.get()
+            try:
+                self.process(question_ids)
+            except Exception:
+                logger.exception("Не удалось обработать изображения вопросов")
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def process(self, question_ids):
+        for question in Question.objects.filter(pk__in=question_ids).exclude(image=""):
+            try:
+                build_renditions(question)
+            except IMAGE_ERRORS as error:
+                logger.warning("Вопрос %s: %s", question.pk, error)
+        # Страницы с этими вопросами теперь можно отдать с srcset
+        bump_content_version()
+
+
+WORKER = RenditionWorker()
+
+
+@receiver(pre_save, sender=Question)
+def remember_image_change(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and "image" not in update_fields:
+        return
+    previous = ""
+    if not instance._state.adding:
+        previous = (
+            Question.objects.filter(pk=instance.pk)
+            .values_list("image", flat=True)
+            .first()
+        ) or ""
+    instance._image_changed = (instance.image.name or "") != previous
+    if instance._image_changed:
+        instance.image_width = None
+        instance.image_height = None
+        instance.image_renditions = []
+
+
+@receiver(post_save, sender=Question)
+def build_renditions_on_upload(sender, instance, **kwargs):
+    if not getattr(instance, "_image_changed", False):
+        return
+    instance._image_changed = False
+    if not instance.image:
+        return
+    try:
+        build_renditions(instance)
+    except IMAGE_ERRORS as error:
+        logger.warning("Вопрос %s: %s", instance.pk, error)
+        return
+    bump_content_version()
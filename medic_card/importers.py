@@ -0,0 +1,438 @@
+"""Потоковый импорт банка вопросов из CSV / JSONL / JSON.
+
+Одна запись описывает один вопрос:
+
+    theme      - название темы (несколько тем разделяются ";")
+    ticket     - название билета
+    text       - текст вопроса
+    image      - путь к изображению внутри MEDIA_ROOT (необязательно); файл
+                 копируется в хранилище изображений под именем по хэшу
+    order      - порядок вопроса в билете (необязательно)
+    answers    - список {"text": ..., "is_correct": ...} (JSON / JSONL)
+    answer_1.. - варианты ответа (CSV), correct - номера правильных ("1;3")
+
+Записи читаются потоково, проверяются пачками и записываются через
+bulk_create, каждая пачка - в своей транзакции.
+"""
+
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Max
+
+from .images import UPLOAD_DIR, WORKER
+from .models import Answer, Question, Theme, Ticket, TicketQuestion
+from .pagecache import bump_content_version, touch
+
+ALLOWED_IMAGE_EXTENSIONS = ("png", "jpg", "jpeg", "gif")
+IMAGE_STORAGE = Question._meta.get_field("image").storage
+FORMATS = ("csv", "jsonl", "json")
+
+
+class ImportRowError(ValueError):
+    """Ошибка валидации одной записи импорта"""
+
+    def __init__(self, line, message):
+        super().__init__(f"Строка {line}: {message}")
+        self.line = line
+
+
+@dataclass
+class ImportReport:
+    """Итоги импорта"""
+
+    dry_run: bool = False
+    rows: int = 0
+    questions: int = 0
+    answers: int = 0
+    themes: int = 0
+    tickets: int = 0
+    skipped: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        prefix = "[dry-run] " if self.dry_run else ""
+        return (
+            f"{prefix}Обработано записей: {self.rows}, "
+            f"вопросов: {self.questions}, ответов: {self.answers}, "
+            f"новых тем: {self.themes}, новых билетов: {self.tickets}, "
+            f"пропущено дублей: {self.skipped}, ошибок: {len(self.errors)}. "
+            f"{self.elapsed:.2f} с ({self.rows_per_second:.0f} записей/с)"
+        )
+
+
+def detect_format(filename):
+    """Определяет формат по расширению файла"""
+    extension = filename.rsplit(".", 1)[-1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Неподдерживаемый формат файла: {filename}")
+    return extension
+
+
+def read_rows(stream, fmt):
+    """Потоково читает записи из бинарного потока.
+
+    Возвращает пары (номер строки, словарь). Вместо словаря может прийти
+    ImportRowError, если строку не удалось разобрать: импорт продолжается
+    со следующей. Формат json читается целиком, поэтому для больших банков
+    лучше использовать jsonl.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError as error:
+                yield line_number, ImportRowError(
+                    line_number, f"некорректный JSON: {error.msg}"
+                )
+    else:
+        try:
+            rows = json.load(text)
+        except json.JSONDecodeError as error:
+            yield error.lineno, ImportRowError(
+                error.lineno, f"некорректный JSON: {error.msg}"
+            )
+            return
+        for index, row in enumerate(rows, start=1):
+            yield index, row
+
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "да", "+")
+
+
+def _parse_answers(row, line):
+    """Возвращает список (текст, правильный) из записи любого формата"""
+    if row.get("answers"):
+        answers = row["answers"]
+        if isinstance(answers, str):
+            try:
+                answers = json.loads(answers)
+            except json.JSONDecodeError as error:
+                raise ImportRowError(line, f"некорректный JSON ответов: {error.msg}")
+        if not isinstance(answers, list):
+            raise ImportRowError(line, "answers должен быть списком")
+        parsed = []
+        for answer in answers:
+            if isinstance(answer, str):
+                parsed.append((answer, False))
+            elif isinstance(answer, dict):
+                parsed.append(
+                    (
+                        str(answer.get("text") or ""),
+                        _parse_bool(answer.get("is_correct")),
+                    )
+                )
+            else:
+                raise ImportRowError(line, f"некорректный вариант ответа: {answer!r}")
+    else:
+        texts = []
+        number = 1
+        while f"answer_{number}" in row:
+            texts.append(row[f"answer_{number}"] or "")
+            number += 1
+        correct = {
+            int(value)
+            for value in str(row.get("correct") or "").replace(",", ";").split(";")
+            if value.strip().isdigit()
+        }
+        parsed = [(text, i in correct) for i, text in enumerate(texts, start=1)]
+
+    parsed = [(text.strip(), is_correct) for text, is_correct in parsed if text.strip()]
+    if len(parsed) < 2:
+        raise ImportRowError(line, "нужно минимум 2 варианта ответа")
+    if not any(is_correct for _, is_correct in parsed):
+        raise ImportRowError(line, "нет правильного ответа")
+    return parsed
+
+
+def validate_row(line, row):
+    """Проверяет и нормализует одну запись"""
+    if not isinstance(row, dict):
+        raise ImportRowError(line, "запись должна быть объектом")
+
+    themes = [
+        title.strip()
+        for title in str(row.get("theme") or row.get("themes") or "").split(";")
+        if title.strip()
+    ]
+    ticket = str(row.get("ticket") or "").strip()
+    text = str(row.get("text") or row.get("question") or "").strip()
+    if not themes:
+        raise ImportRowError(line, "не указана тема")
+    if not ticket:
+        raise ImportRowError(line, "не указан билет")
+    if not text:
+        raise ImportRowError(line, "пустой текст вопроса")
+
+    image = str(row.get("image") or "").strip()
+    if image:
+        if image.rsplit(".", 1)[-1].lower() not in ALLOWED_IMAGE_EXTENSIONS:
+            raise ImportRowError(line, f"недопустимый формат изображения: {image}")
+        try:
+            found = default_storage.exists(image)
+        except SuspiciousFileOperation:
+            # Например, "../x": путь за пределами MEDIA_ROOT
+            raise ImportRowError(line, f"недопустимый путь к изображению: {image}")
+        if not found:
+            raise ImportRowError(line, f"изображение не найдено: {image}")
+
+    order = row.get("order")
+    if order in (None, ""):
+        order = None
+    else:
+        try:
+            order = int(order)
+        except (TypeError, ValueError):
+            raise ImportRowError(line, f"некорректный порядок: {order}")
+
+    return {
+        "line": line,
+        "themes": themes,
+        "ticket": ticket,
+        "text": text,
+        "image": image or None,
+        "order": order,
+        "answers": _parse_answers(row, line),
+    }
+
+
+class QuestionImporter:
+    """Импортирует вопросы пачками через bulk_create"""
+
+    def __init__(self, user, batch_size=500, dry_run=False):
+        self.user = user
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.theme_ids = {}
+        self.ticket_ids = {}
+        self.next_order = {}
+        self.stored_images = {}
+        # dry-run: (билет, текст) вопросов, которые уже были бы созданы
+        self.planned_questions = set()
+
+    def run(self, rows):
+        """Импортирует записи (пары номер строки, словарь)"""
+        report = ImportReport(dry_run=self.dry_run)
+        started = time.monotonic()
+        rows = iter(rows)
+
+        while True:
+            chunk = list(islice(rows, self.batch_size))
+            if not chunk:
+                break
+            report.rows += len(chunk)
+
+            valid = []
+            for line, row in chunk:
+                if isinstance(row, ImportRowError):
+                    report.errors.append(str(row))
+                    continue
+                try:
+                    valid.append(validate_row(line, row))
+                except (ImportRowError, ValueError) as error:
+                    report.errors.append(str(error))
+
+            if self.dry_run:
+                self._count_new(valid, report)
+            elif valid:
+                with transaction.atomic():
+                    self._write(valid, report)
+
+        report.elapsed = time.monotonic() - started
+        return report
+
+    def _count_new(self, rows, report):
+        """Подсчитывает, что было бы создано, ничего не записывая"""
+        themes = {title for row in rows for title in row["themes"]}
+        themes -= set(self.theme_ids)
+        existing = set(
+            Theme.objects.filter(title__in=themes).values_list("title", flat=True)
+        )
+        report.themes += len(themes - existing)
+        self.theme_ids.update(dict.fromkeys(themes))
+
+        tickets = {row["ticket"] for row in rows} - set(self.ticket_ids)
+        existing = set(
+            Ticket.objects.filter(title__in=tickets, is_temporary=False).values_list(
+                "title", flat=True
+            )
+        )
+        report.tickets += len(tickets - existing)
+        self.ticket_ids.update(dict.fromkeys(tickets))
+
+        # Дубли считаются так же, как при записи: вопрос с тем же текстом
+        # в билете с тем же названием пропускается
+        existing = set(
+            TicketQuestion.objects.filter(
+                ticket__title__in={row["ticket"] for row in rows},
+                ticket__is_temporary=False,
+                question__text__in={row["text"] for row in rows},
+            ).values_list("ticket__title", "question__text")
+        )
+        for row in rows:
+            key = (row["ticket"], row["text"])
+            if key in existing or key in self.planned_questions:
+                report.skipped += 1
+                continue
+            self.planned_questions.add(key)
+            report.questions += 1
+            report.answers += len(row["answers"])
+
+    def _resolve_themes(self, rows, report):
+        titles = {title for row in rows for title in row["themes"]}
+        missing = titles - set(self.theme_ids)
+        if not missing:
+            return
+        for theme in Theme.objects.filter(title__in=missing).order_by("id"):
+            self.theme_ids.setdefault(theme.title, theme.id)
+        to_create = [
+            Theme(title=title, created_by=self.user)
+            for title in sorted(missing - set(self.theme_ids))
+        ]
+        for theme in Theme.objects.bulk_create(to_create):
+            self.theme_ids[theme.title] = theme.id
+        report.themes += len(to_create)
+
+    def _resolve_tickets(self, rows, report):
+        titles = {row["ticket"] for row in rows}
+        missing = titles - set(self.ticket_ids)
+        if missing:
+            for ticket in Ticket.objects.filter(
+                title__in=missing, is_temporary=False
+            ).order_by("id"):
+                self.ticket_ids.setdefault(ticket.title, ticket.id)
+            to_create = [
+                Ticket(title=title, created_by=self.user)
+                for title in sorted(missing - set(self.ticket_ids))
+            ]
+            for ticket in Ticket.objects.bulk_create(to_create):
+                self.ticket_ids[ticket.title] = ticket.id
+            report.tickets += len(to_create)
+
+            ticket_ids = [self.ticket_ids[title] for title in missing]
+            orders = (
+                TicketQuestion.objects.filter(ticket_id__in=ticket_ids)
+                .values("ticket_id")
+                .annotate(last=Max("order"))
+            )
+            last_orders = {item["ticket_id"]: item["last"] for item in orders}
+            for ticket_id in ticket_ids:
+                last = last_orders.get(ticket_id)
+                self.next_order[ticket_id] = 0 if last is None else last + 1
+
+        Ticket.themes.through.objects.bulk_create(
+            [
+                Ticket.themes.through(
+                    ticket_id=self.ticket_ids[row["ticket"]],
+                    theme_id=self.theme_ids[title],
+                )
+                for row in rows
+                for title in row["themes"]
+            ],
+            ignore_conflicts=True,
+        )
+
+    def _store_image(self, name):
+        """Копия файла в хранилище изображений под именем по хэшу"""
+        if name not in self.stored_images:
+            self.stored_images[name] = IMAGE_STORAGE.adopt(name, UPLOAD_DIR)
+        return self.stored_images[name]
+
+    def _write(self, rows, report):
+        self._resolve_themes(rows, report)
+        self._resolve_tickets(rows, report)
+
+        # Вопросы, которые уже есть в билете с тем же текстом, пропускаем
+        existing = set(
+            TicketQuestion.objects.filter(
+                ticket_id__in={self.ticket_ids[row["ticket"]] for row in rows},
+                question__text__in={row["text"] for row in rows},
+            ).values_list("ticket_id", "question__text")
+        )
+        new_rows = []
+        for row in rows:
+            key = (self.ticket_ids[row["ticket"]], row["text"])
+            if key in existing:
+                report.skipped += 1
+                continue
+            existing.add(key)
+            new_rows.append(row)
+        if not new_rows:
+            return
+
+        questions = Question.objects.bulk_create(
+            [
+                Question(
+                    text=row["text"],
+                    image=row["image"] and self._store_image(row["image"]),
+                    order=row["order"] or 0,
+                    created_by=self.user,
+                )
+                for row in new_rows
+            ]
+        )
+
+        answers = []
+        links = []
+        for row, question in zip(new_rows, questions):
+            for order, (text, is_correct) in enumerate(row["answers"]):
+                answers.append(
+                    Answer(
+                        question=question,
+                        text=text,
+                        is_correct=is_correct,
+                        order=order,
+                    )
+                )
+
+            ticket_id = self.ticket_ids[row["ticket"]]
+            if row["order"] is None:
+                order = self.next_order[ticket_id]
+                self.next_order[ticket_id] = order + 1
+            else:
+                order = row["order"]
+                self.next_order[ticket_id] = max(self.next_order[ticket_id], order + 1)
+            links.append(
+                TicketQuestion(ticket_id=ticket_id, question=question, order=order)
+            )
+
+        Answer.objects.bulk_create(answers)
+        TicketQuestion.objects.bulk_create(links)
+
+        # bulk_create не шлет сигналов, поэтому кэш страниц и ETag билетов
+        # и тем обновляются здесь, по одному разу на пачку
+        touch(Ticket, pk__in={link.ticket_id for link in links})
+        titles = {title for row in new_rows for title in row["themes"]}
+        touch(Theme, pk__in={self.theme_ids[title] for title in titles})
+        transaction.on_commit(bump_content_version)
+
+        # Копии изображений создаются в фоне, после фиксации транзакции
+        image_ids = [question.pk for question in questions if question.image]
+        if image_ids:
+            transaction.on_commit(partial(WORKER.enqueue, image_ids))
+
+        report.questions += len(questions)
+        report.answers += len(answers)
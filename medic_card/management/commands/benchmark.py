@@ -0,0 +1,119 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from medic_card.benchmark import SCENARIOS, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Нагрузочный прогон: N пользователей параллельно ходят по сайту "
+        "и решают билеты, по каждому представлению выводятся RPS, "
+        "перцентили времени ответа и число SQL-запросов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument(
+            "--user-prefix",
+            default="gen_user_",
+            help="Префикс имен пользователей (см. generate_dataset)",
+        )
+        parser.add_argument(
+            "--scenario",
+            choices=SCENARIOS,
+            action="append",
+            help="Сценарий (можно несколько, по умолчанию все)",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=30.0, help="Длительность, секунд"
+        )
+        parser.add_argument(
+            "--iterations",
+            type=int,
+            default=0,
+            help="Число повторов сценариев на пользователя (0 - до конца времени)",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument(
+            "--with-ratelimit",
+            action="store_true",
+            help="Не отключать ограничение частоты запросов",
+        )
+        parser.add_argument(
+            "--write-behind",
+            action="store_true",
+            help="Писать ответы через поток-писатель (ANSWER_WRITE_BEHIND)",
+        )
+        parser.add_argument("--output", help="Файл для результатов в JSON")
+        parser.add_argument(
+            "--compare", help="JSON предыдущего прогона для сравнения"
+        )
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(
+                username__startswith=options["user_prefix"], is_active=True
+            ).order_by("id")[: options["users"]]
+        )
+        if len(users) < options["users"]:
+            raise CommandError(
+                f"Найдено пользователей: {len(users)}, нужно {options['users']}. "
+                "Создайте их командой generate_dataset"
+            )
+
+        overrides = {} if options["with_ratelimit"] else {"RATELIMIT_ENABLE": False}
+        if options["write_behind"]:
+            overrides["ANSWER_WRITE_BEHIND"] = True
+        with override_settings(**overrides):
+            try:
+                result = run_benchmark(
+                    users,
+                    scenarios=options["scenario"] or SCENARIOS,
+                    duration=options["duration"],
+                    iterations=options["iterations"],
+                    seed=options["seed"],
+                )
+            except ValueError as error:
+                raise CommandError(str(error))
+        result["started_at"] = timezone.now().isoformat()
+
+        previous = None
+        if options["compare"]:
+            with open(options["compare"], encoding="utf-8") as stream:
+                previous = json.load(stream)
+        self.print_table(result, previous)
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                json.dump(result, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+    def print_table(self, result, previous=None):
+        header = (
+            f"{'view':<22}{'req':>7}{'err':>5}{'rps':>9}"
+            f"{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'q/req':>7}{'qmax':>6}"
+        )
+        self.stdout.write(header)
+        old_views = (previous or {}).get("views", {})
+        for name, view in result["views"].items():
+            line = (
+                f"{name:<22}{view['requests']:>7}{view['errors']:>5}"
+                f"{view['rps']:>9.1f}{view['p50_ms']:>9.1f}{view['p95_ms']:>9.1f}"
+                f"{view['p99_ms']:>9.1f}{view['queries_avg']:>7.1f}"
+                f"{view['queries_max']:>6}"
+            )
+            old = old_views.get(name)
+            if old and old["p95_ms"]:
+                change = (view["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100
+                line += f"  p95 {change:+.0f}%, q/req {old['queries_avg']:.1f}"
+            self.stdout.write(line)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Всего: {result['requests']} запросов за {result['duration_s']} с, "
+                f"{result['rps']} RPS, ошибок: {result['errors']}"
+            )
+        )
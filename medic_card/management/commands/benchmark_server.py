@@ -0,0 +1,209 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from medic_card.benchmark import percentile
+from medic_card.models import Question, Theme, Ticket
+
+SERVERS = ("runserver", "serve")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def fetch(url):
+    """Код ответа; ошибки соединения - None"""
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает runserver и serve (gunicorn) под одинаковой HTTP-нагрузкой "
+        "на публичные страницы: время запуска, RPS, перцентили, остановка"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--server",
+            choices=SERVERS,
+            action="append",
+            help="Сервер (можно несколько, по умолчанию оба)",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=16, help="Параллельных клиентов"
+        )
+        parser.add_argument(
+            "--duration", type=float, default=15.0, help="Длительность, секунд"
+        )
+        parser.add_argument("--workers", type=int, default=settings.SERVE_WORKERS)
+        parser.add_argument("--threads", type=int, default=settings.SERVE_THREADS)
+        parser.add_argument(
+            "--no-page-cache",
+            action="store_true",
+            help="Отключить кэш страниц (PAGE_CACHE_ENABLED=0): мерить отрисовку",
+        )
+        parser.add_argument(
+            "--with-ratelimit",
+            action="store_true",
+            help="Не отключать ограничение частоты запросов",
+        )
+        parser.add_argument("--output", help="Файл для результатов в JSON")
+
+    def handle(self, *args, **options):
+        paths = self.paths()
+        env = dict(os.environ)
+        if not options["with_ratelimit"]:
+            env["RATELIMIT_ENABLE"] = "0"
+        if options["no_page_cache"]:
+            env["PAGE_CACHE_ENABLED"] = "0"
+
+        results = {}
+        for server in options["server"] or SERVERS:
+            port = free_port()
+            command = [sys.executable, str(settings.BASE_DIR / "manage.py")]
+            if server == "runserver":
+                command += ["runserver", f"127.0.0.1:{port}", "--noreload"]
+            else:
+                command += [
+                    "serve",
+                    "--bind",
+                    f"127.0.0.1:{port}",
+                    "--workers",
+                    str(options["workers"]),
+                    "--threads",
+                    str(options["threads"]),
+                ]
+            results[server] = self.measure(
+                command,
+                env,
+                f"http://127.0.0.1:{port}",
+                paths,
+                options["concurrency"],
+                options["duration"],
+            )
+
+        self.stdout.write(
+            f"{'server':<11}{'start s':>8}{'req':>8}{'err':>6}{'rps':>9}"
+            f"{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'stop s':>8}"
+        )
+        for server, result in results.items():
+            self.stdout.write(
+                f"{server:<11}{result['startup_s']:>8.1f}{result['requests']:>8}"
+                f"{result['errors']:>6}{result['rps']:>9.1f}{result['p50_ms']:>9.1f}"
+                f"{result['p95_ms']:>9.1f}{result['p99_ms']:>9.1f}"
+                f"{result['shutdown_s']:>8.1f}"
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as stream:
+                json.dump(results, stream, ensure_ascii=False, indent=2)
+            self.stdout.write(f"Результаты записаны в {options['output']}")
+
+    def paths(self):
+        """Главная и несколько страниц тем, билетов и вопросов"""
+        paths = [reverse("medic_card:home")]
+        for model, name in (
+            (Theme, "medic_card:theme_detail"),
+            (Ticket, "medic_card:ticket_detail"),
+            (Question, "medic_card:question_detail"),
+        ):
+            ids = model.objects.filter(is_active=True)
+            if model is Ticket:
+                ids = ids.filter(is_temporary=False)
+            for pk in ids.order_by("id").values_list("id", flat=True)[:10]:
+                paths.append(reverse(name, args=[pk]))
+        return paths
+
+    def measure(self, command, env, base_url, paths, concurrency, duration):
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            command,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            while fetch(base_url + paths[0]) is None:
+                if process.poll() is not None:
+                    raise CommandError(f"Сервер завершился: {' '.join(command)}")
+                if time.perf_counter() - started > 120:
+                    raise CommandError(f"Сервер не запустился: {' '.join(command)}")
+                time.sleep(0.1)
+            startup = time.perf_counter() - started
+            latencies, errors, elapsed = self.load(
+                base_url, paths, concurrency, duration
+            )
+        finally:
+            stopping = time.perf_counter()
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            shutdown = time.perf_counter() - stopping
+
+        latencies.sort()
+        return {
+            "startup_s": round(startup, 2),
+            "requests": len(latencies),
+            "errors": errors,
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "shutdown_s": round(shutdown, 2),
+        }
+
+    def load(self, base_url, paths, concurrency, duration):
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + duration
+
+        def client(offset):
+            local_latencies = []
+            local_errors = 0
+            number = offset
+            while time.perf_counter() < deadline:
+                path = paths[number % len(paths)]
+                number += 1
+                request_started = time.perf_counter()
+                status = fetch(base_url + path)
+                local_latencies.append(time.perf_counter() - request_started)
+                if status is None or status >= 400:
+                    local_errors += 1
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        started = time.perf_counter()
+        pool = [
+            threading.Thread(target=client, args=(offset,))
+            for offset in range(concurrency)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return latencies, sum(errors), time.perf_counter() - started
@@ -0,0 +1,141 @@
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections
+
+# Штатная конфигурация Django и настроенная (medic_card.db.sqlite3)
+CONFIGURATIONS = {
+    "stock": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "CONN_MAX_AGE": 0,
+        "OPTIONS": {},
+    },
+    "tuned": {
+        "ENGINE": "medic_card.db.sqlite3",
+        "CONN_MAX_AGE": None,
+        "OPTIONS": {},
+    },
+}
+
+SCHEMA = (
+    "CREATE TABLE answer (id INTEGER PRIMARY KEY, user_id INTEGER, "
+    "question_id INTEGER, is_correct BOOLEAN)",
+    "CREATE TABLE progress (user_id INTEGER PRIMARY KEY, answered INTEGER)",
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнивает пропускную способность записи в SQLite со штатными "
+        "настройками Django и с medic_card.db.sqlite3 (WAL, BEGIN IMMEDIATE, "
+        "постоянные соединения) на временной базе"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument(
+            "--writes", type=int, default=200, help="Записей на поток"
+        )
+
+    def handle(self, *args, **options):
+        directory = tempfile.mkdtemp(prefix="medic_card_sqlite_bench_")
+        try:
+            for label, config in CONFIGURATIONS.items():
+                path = os.path.join(directory, f"{label}.sqlite3")
+                result = self.run(
+                    path, config, options["threads"], options["writes"]
+                )
+                self.stdout.write(
+                    f"{label:>6}: {result['rate']:8.0f} записей/с, "
+                    f"ошибок блокировки {result['errors']}, "
+                    f"p50 {result['p50']:.1f} мс, p95 {result['p95']:.1f} мс"
+                )
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    def connect(self, path, config):
+        settings_dict = connections.configure_settings(
+            {"default": {**config, "NAME": path}}
+        )["default"]
+        backend = import_module(f"{config['ENGINE']}.base")
+        return backend.DatabaseWrapper(settings_dict, alias="bench")
+
+    def run(self, path, config, threads, writes):
+        setup = self.connect(path, config)
+        with setup.cursor() as cursor:
+            for statement in SCHEMA:
+                cursor.execute(statement)
+        setup.close()
+
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(user_id):
+            wrapper = None
+            local_latencies = []
+            local_errors = 0
+            for number in range(writes):
+                if wrapper is None:
+                    wrapper = self.connect(path, config)
+                started = time.perf_counter()
+                try:
+                    self.submit_answer(wrapper, user_id, number)
+                except OperationalError:
+                    wrapper.rollback()
+                    local_errors += 1
+                local_latencies.append((time.perf_counter() - started) * 1000)
+                # CONN_MAX_AGE = 0: соединение закрывается после каждого запроса
+                if config["CONN_MAX_AGE"] == 0:
+                    wrapper.close()
+                    wrapper = None
+            if wrapper is not None:
+                wrapper.close()
+            with lock:
+                latencies.extend(local_latencies)
+                errors.append(local_errors)
+
+        started = time.perf_counter()
+        pool = [
+            threading.Thread(target=worker, args=(user_id,))
+            for user_id in range(threads)
+        ]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(latencies, n=20)
+        return {
+            "rate": (len(latencies) - sum(errors)) / elapsed,
+            "errors": sum(errors),
+            "p50": statistics.median(latencies),
+            "p95": quantiles[-1],
+        }
+
+    def submit_answer(self, wrapper, user_id, question_id):
+        """Чтение и две записи в одной транзакции, как при ответе на вопрос"""
+        wrapper.ensure_connection()
+        wrapper._start_transaction_under_autocommit()
+        with wrapper.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM answer WHERE user_id = %s", [user_id]
+            )
+            answered = cursor.fetchone()[0]
+            cursor.execute(
+                "INSERT INTO answer (user_id, question_id, is_correct) "
+                "VALUES (%s, %s, %s)",
+                [user_id, question_id, question_id % 2 == 0],
+            )
+            cursor.execute(
+                "INSERT OR REPLACE INTO progress (user_id, answered) VALUES (%s, %s)",
+                [user_id, answered + 1],
+            )
+        wrapper.commit()
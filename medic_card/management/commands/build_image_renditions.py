@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from medic_card.images import IMAGE_ERRORS, build_renditions
+from medic_card.models import Question
+from medic_card.pagecache import bump_content_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Создает уменьшенные копии (WebP/JPEG) и размеры для уже загруженных "
+        "изображений вопросов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Пересоздать копии и для вопросов, где они уже есть",
+        )
+
+    def handle(self, *args, **options):
+        questions = Question.objects.exclude(image="").exclude(image__isnull=True)
+        if not options["force"]:
+            questions = questions.filter(image_renditions=[])
+
+        done = failed = 0
+        for question in questions.order_by("id").iterator(chunk_size=200):
+            try:
+                build_renditions(question, force=options["force"])
+            except IMAGE_ERRORS as error:
+                failed += 1
+                self.stderr.write(
+                    f"Вопрос {question.pk} ({question.image.name}): {error}"
+                )
+                continue
+            done += 1
+            if done % 100 == 0:
+                self.stdout.write(f"Обработано изображений: {done}")
+
+        if done:
+            bump_content_version()
+        self.stdout.write(
+            self.style.SUCCESS(f"Готово: {done} изображений, ошибок: {failed}")
+        )
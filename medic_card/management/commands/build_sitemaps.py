@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from medic_card_project.sitemap import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = "Отрисовывает sitemap.xml и его страницы в SITEMAP_ROOT"
+
+    def handle(self, *args, **options):
+        total = build_sitemaps()
+        self.stdout.write(
+            self.style.SUCCESS(f"Sitemap: {total} URL в {settings.SITEMAP_ROOT}")
+        )
@@ -76,18 +76,21 @@ class Command(BaseCommand):
 
         tickets = []
         for ticket_data in tickets_data:
-            ticket, created = Ticket.objects.get_or_create(
+            ticket = Ticket.objects.filter(
                 title=ticket_data["title"],
-                theme=ticket_data["theme"],
-                defaults={
-                    "description": ticket_data["description"],
-                    "created_by": admin,
-                    "is_active": True,
-                },
-            )
-            tickets.append(ticket)
-            if created:
+                themes=ticket_data["theme"],
+                is_temporary=False,
+            ).first()
+            if ticket is None:
+                ticket = Ticket.objects.create(
+                    title=ticket_data["title"],
+                    description=ticket_data["description"],
+                    created_by=admin,
+                    is_active=True,
+                )
+                ticket.themes.add(ticket_data["theme"])
                 self.stdout.write(f"Создан билет: {ticket.title}")
+            tickets.append(ticket)
 
         # Создаем вопросы
         questions_data = [
@@ -147,13 +150,15 @@ class Command(BaseCommand):
         ]
 
         for question_data in questions_data:
-            question, created = Question.objects.get_or_create(
-                text=question_data["text"],
-                ticket=question_data["ticket"],
-                defaults={"created_by": admin, "is_active": True},
-            )
+            question = Question.objects.filter(
+                text=question_data["text"], tickets=question_data["ticket"]
+            ).first()
 
-            if created:
+            if question is None:
+                question = Question.objects.create(
+                    text=question_data["text"], created_by=admin, is_active=True
+                )
+                question_data["ticket"].add_questions([question])
                 self.stdout.write(f"Создан вопрос: {question.text[:50]}...")
 
                 # Создаем ответы для вопроса
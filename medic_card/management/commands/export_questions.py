@@ -0,0 +1,27 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from medic_card.exporters import FORMATS, stream_questions
+
+
+class Command(BaseCommand):
+    help = "Выгружает вопросы и ответы (по теме или билету) в CSV / JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument("--theme", type=int, help="ID темы")
+        parser.add_argument("--ticket", type=int, help="ID билета")
+        parser.add_argument(
+            "--output", help="Путь к файлу (по умолчанию стандартный вывод)"
+        )
+
+    def handle(self, *args, **options):
+        lines = stream_questions(
+            options["format"], theme_id=options["theme"], ticket_id=options["ticket"]
+        )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
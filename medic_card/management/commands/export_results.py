@@ -0,0 +1,32 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from medic_card.exporters import FORMATS, select_users, stream_results
+
+
+class Command(BaseCommand):
+    help = "Выгружает ответы или прогресс пользователей (или когорты) в CSV / JSONL"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["answers", "progress"])
+        parser.add_argument("--format", choices=FORMATS, default="csv")
+        parser.add_argument(
+            "--user",
+            action="append",
+            dest="users",
+            help="Имя пользователя (можно указать несколько раз)",
+        )
+        parser.add_argument("--group", help="Группа пользователей (когорта)")
+        parser.add_argument(
+            "--output", help="Путь к файлу (по умолчанию стандартный вывод)"
+        )
+
+    def handle(self, *args, **options):
+        users = select_users(usernames=options["users"], group=options["group"])
+        lines = stream_results(options["format"], options["kind"], users)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8", newline="") as output:
+                output.writelines(lines)
+        else:
+            sys.stdout.writelines(lines)
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from medic_card.images import unreferenced_files
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет изображения вопросов, на которые не ссылается ни один вопрос, "
+        "и их уменьшенные копии"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=24,
+            help="Не трогать файлы моложе указанного числа часов (по умолчанию 24)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено",
+        )
+
+    def handle(self, *args, **options):
+        names = unreferenced_files(timedelta(hours=options["min_age"]))
+        freed = 0
+        for name in names:
+            freed += default_storage.size(name)
+            if options["dry_run"]:
+                self.stdout.write(name)
+            else:
+                default_storage.delete(name)
+
+        prefix = "[dry-run] " if options["dry_run"] else ""
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{prefix}Удалено файлов: {len(names)}, "
+                f"освобождено {freed / 1024 / 1024:.1f} МБ"
+            )
+        )
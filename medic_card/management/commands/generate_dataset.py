@@ -0,0 +1,325 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from medic_auth.models import UserProfile
+from medic_card.models import (
+    Answer,
+    Question,
+    Theme,
+    Ticket,
+    TicketProgress,
+    TicketQuestion,
+    UserAnswer,
+)
+from medic_card.pagecache import bump_content_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Генерирует воспроизводимый синтетический набор данных "
+        "для нагрузочного тестирования"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--themes", type=int, default=10)
+        parser.add_argument(
+            "--tickets", type=int, default=20, help="Билетов в каждой теме"
+        )
+        parser.add_argument(
+            "--questions", type=int, default=25, help="Вопросов в каждом билете"
+        )
+        parser.add_argument(
+            "--answers", type=int, default=4, help="Вариантов ответа у вопроса"
+        )
+        parser.add_argument("--users", type=int, default=100)
+        parser.add_argument(
+            "--tickets-per-user",
+            type=int,
+            default=10,
+            help="Сколько билетов прорешал каждый пользователь (история ответов)",
+        )
+        parser.add_argument(
+            "--shared-ratio",
+            type=float,
+            default=0.1,
+            help="Доля вопросов, дополнительно включенных в другой билет",
+        )
+        parser.add_argument(
+            "--correct-ratio",
+            type=float,
+            default=0.7,
+            help="Доля правильных ответов пользователей",
+        )
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument(
+            "--prefix", default="gen", help="Префикс имен пользователей и контента"
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.prefix = options["prefix"]
+        started = time.monotonic()
+
+        if User.objects.filter(username__startswith=f"{self.prefix}_user_").exists():
+            raise CommandError(
+                f"Набор с префиксом '{self.prefix}' уже существует, укажите --prefix"
+            )
+
+        author = self._author()
+        ticket_ids, question_ids = self._content(author, options)
+        answers_by_question = self._answers(question_ids, options["answers"])
+        self._share_questions(ticket_ids, question_ids, options["shared_ratio"])
+        user_ids = self._users(options["users"])
+        total = self._history(
+            user_ids,
+            ticket_ids,
+            answers_by_question,
+            options["tickets_per_user"],
+            options["correct_ratio"],
+        )
+        # bulk_create не шлет сигналов: страницы в кэше устарели
+        bump_content_version()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Создано: тем {options['themes']}, билетов {len(ticket_ids)}, "
+                f"вопросов {len(question_ids)}, пользователей {len(user_ids)}, "
+                f"ответов пользователей {total} за {elapsed:.1f} с"
+            )
+        )
+
+    def _bulk_create(self, model, objects):
+        created = []
+        for start in range(0, len(objects), self.batch_size):
+            with transaction.atomic():
+                created.extend(
+                    model.objects.bulk_create(
+                        objects[start:start + self.batch_size]
+                    )
+                )
+        return created
+
+    def _author(self):
+        author, _ = User.objects.get_or_create(
+            username=f"{self.prefix}_staff",
+            defaults={"is_staff": True, "password": make_password(None)},
+        )
+        return author
+
+    def _content(self, author, options):
+        themes = self._bulk_create(
+            Theme,
+            [
+                Theme(
+                    title=f"{self.prefix} тема {number}",
+                    description=f"Синтетическая тема {number}",
+                    created_by=author,
+                    order=number,
+                )
+                for number in range(1, options["themes"] + 1)
+            ],
+        )
+
+        tickets = self._bulk_create(
+            Ticket,
+            [
+                Ticket(
+                    title=f"{self.prefix} билет {theme_number}.{number}",
+                    created_by=author,
+                    order=number,
+                )
+                for theme_number in range(1, len(themes) + 1)
+                for number in range(1, options["tickets"] + 1)
+            ],
+        )
+        self._bulk_create(
+            Ticket.themes.through,
+            [
+                Ticket.themes.through(
+                    ticket_id=ticket.id,
+                    theme_id=themes[index // options["tickets"]].id,
+                )
+                for index, ticket in enumerate(tickets)
+            ],
+        )
+
+        questions = self._bulk_create(
+            Question,
+            [
+                Question(
+                    text=(
+                        f"{self.prefix} вопрос {ticket.id}.{number}: "
+                        f"{self.rng.randint(0, 10 ** 9)}"
+                    ),
+                    created_by=author,
+                    order=number,
+                )
+                for ticket in tickets
+                for number in range(options["questions"])
+            ],
+        )
+        self._bulk_create(
+            TicketQuestion,
+            [
+                TicketQuestion(
+                    ticket_id=tickets[index // options["questions"]].id,
+                    question_id=question.id,
+                    order=index % options["questions"],
+                )
+                for index, question in enumerate(questions)
+            ],
+        )
+        return (
+            [ticket.id for ticket in tickets],
+            [question.id for question in questions],
+        )
+
+    def _answers(self, question_ids, answers_count):
+        answers = []
+        for question_id in question_ids:
+            correct = self.rng.randrange(answers_count)
+            answers.extend(
+                Answer(
+                    question_id=question_id,
+                    text=f"Вариант {number + 1}",
+                    is_correct=number == correct,
+                    order=number,
+                )
+                for number in range(answers_count)
+            )
+        answers_by_question = {}
+        for answer in self._bulk_create(Answer, answers):
+            answers_by_question.setdefault(answer.question_id, []).append(
+                (answer.id, answer.is_correct)
+            )
+        return answers_by_question
+
+    def _share_questions(self, ticket_ids, question_ids, ratio):
+        if ratio <= 0 or len(ticket_ids) < 2:
+            return
+        links = {}
+        for question_id in self.rng.sample(
+            question_ids, int(len(question_ids) * min(ratio, 1))
+        ):
+            links[(self.rng.choice(ticket_ids), question_id)] = None
+        links = [
+            TicketQuestion(ticket_id=ticket_id, question_id=question_id, order=10 ** 6)
+            for ticket_id, question_id in links
+        ]
+        for start in range(0, len(links), self.batch_size):
+            TicketQuestion.objects.bulk_create(
+                links[start:start + self.batch_size], ignore_conflicts=True
+            )
+
+    def _users(self, count):
+        password = make_password(f"{self.prefix}-password1")
+        users = self._bulk_create(
+            User,
+            [
+                User(username=f"{self.prefix}_user_{number:06d}", password=password)
+                for number in range(1, count + 1)
+            ],
+        )
+        # bulk_create не вызывает post_save, профили создаем сами
+        self._bulk_create(
+            UserProfile, [UserProfile(user_id=user.id) for user in users]
+        )
+        return [user.id for user in users]
+
+    def _history(
+        self, user_ids, ticket_ids, answers_by_question, tickets_per_user, ratio
+    ):
+        """История ответов: каждый пользователь прорешивает несколько билетов.
+
+        Даты ответов и начала билетов выставляются auto_now_add при вставке,
+        поэтому вся история получается "сегодняшней".
+        """
+        questions_by_ticket = {}
+        for ticket_id, question_id in TicketQuestion.objects.filter(
+            ticket_id__in=ticket_ids
+        ).values_list("ticket_id", "question_id").order_by("ticket_id", "order", "id"):
+            questions_by_ticket.setdefault(ticket_id, []).append(question_id)
+
+        now = timezone.now()
+        through = UserAnswer.selected_answers.through
+        total = 0
+        pending_answers, pending_selected, pending_progress = [], [], []
+
+        def flush():
+            with transaction.atomic():
+                created = UserAnswer.objects.bulk_create(pending_answers)
+                through.objects.bulk_create(
+                    [
+                        through(useranswer_id=user_answer.id, answer_id=answer_id)
+                        for user_answer, answer_id in zip(created, pending_selected)
+                    ]
+                )
+                TicketProgress.objects.bulk_create(pending_progress)
+            pending_answers.clear()
+            pending_selected.clear()
+            pending_progress.clear()
+
+        for user_id in user_ids:
+            answered = {}
+            for ticket_id in self.rng.sample(
+                ticket_ids, min(tickets_per_user, len(ticket_ids))
+            ):
+                correct_count = 0
+                question_order = questions_by_ticket.get(ticket_id, [])
+                for question_id in question_order:
+                    if question_id in answered:
+                        # Общий вопрос уже отвечен в другом билете
+                        correct_count += answered[question_id]
+                        continue
+                    options = answers_by_question[question_id]
+                    is_correct = self.rng.random() < ratio
+                    if is_correct:
+                        answer_id = next(id_ for id_, correct in options if correct)
+                    else:
+                        answer_id = self.rng.choice(
+                            [id_ for id_, correct in options if not correct]
+                            or [options[0][0]]
+                        )
+                    answered[question_id] = is_correct
+                    correct_count += is_correct
+                    pending_answers.append(
+                        UserAnswer(
+                            user_id=user_id,
+                            question_id=question_id,
+                            is_correct=is_correct,
+                        )
+                    )
+                    pending_selected.append(answer_id)
+
+                time_spent = timedelta(seconds=self.rng.randint(60, 3600))
+                pending_progress.append(
+                    TicketProgress(
+                        user_id=user_id,
+                        ticket_id=ticket_id,
+                        current_question_index=len(question_order),
+                        is_completed=True,
+                        completed_at=now,
+                        time_spent=time_spent,
+                        correct_answers=correct_count,
+                        total_questions=len(question_order),
+                        question_order=question_order,
+                    )
+                )
+
+            if len(pending_answers) >= self.batch_size:
+                total += len(pending_answers)
+                flush()
+
+        total += len(pending_answers)
+        flush()
+        return total
@@ -0,0 +1,62 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from medic_card.images import WORKER
+from medic_card.importers import QuestionImporter, detect_format, read_rows
+
+
+class Command(BaseCommand):
+    help = "Импортирует темы, билеты, вопросы и ответы из файла CSV / JSONL / JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Путь к файлу импорта")
+        parser.add_argument(
+            "--format",
+            choices=["csv", "jsonl", "json"],
+            help="Формат файла (по умолчанию определяется по расширению)",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Количество записей в одной транзакции",
+        )
+        parser.add_argument(
+            "--user",
+            help="Имя сотрудника, от которого создается контент "
+            "(по умолчанию первый суперпользователь)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только проверить файл, ничего не записывая",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"]:
+            user = User.objects.filter(
+                username=options["user"], is_staff=True
+            ).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by("id").first()
+        if user is None:
+            raise CommandError("Не найден сотрудник для создания контента")
+
+        try:
+            fmt = options["format"] or detect_format(options["path"])
+        except ValueError as error:
+            raise CommandError(str(error))
+
+        importer = QuestionImporter(
+            user, batch_size=options["batch_size"], dry_run=options["dry_run"]
+        )
+        with open(options["path"], "rb") as stream:
+            report = importer.run(read_rows(stream, fmt))
+
+        for error in report.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(report.summary()))
+
+        if WORKER.queue.unfinished_tasks:
+            self.stdout.write("Создание уменьшенных копий изображений...")
+            WORKER.wait()
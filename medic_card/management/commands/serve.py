@@ -0,0 +1,104 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from gunicorn.app.base import BaseApplication
+
+from medic_card import answerwriter, metrics, warmup
+
+
+def post_worker_init(worker):
+    # После fork, но до первого запроса воркера. Запросы прогрева не
+    # расходуют ведра ограничения частоты (см. warmup._fetch_pages)
+    warmup.run(warmup.WORKER_STEPS)
+
+
+def worker_exit(server, worker):
+    # Ответы, еще стоящие в очереди писателя, записываются до выхода
+    answerwriter.WRITER.stop(settings.ANSWER_WRITE_TIMEOUT)
+    metrics.REGISTRY.flush()
+    connections.close_all()
+
+
+class Server(BaseApplication):
+    """gunicorn с настройками из аргументов команды"""
+
+    def __init__(self, options, warm_up=True):
+        self.options = options
+        self.warm_up = warm_up
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+        if self.warm_up:
+            self.cfg.set("post_worker_init", post_worker_init)
+        self.cfg.set("worker_exit", worker_exit)
+
+    def load(self):
+        # С preload_app вызывается в главном процессе один раз до fork
+        application = get_wsgi_application()
+        if self.warm_up:
+            warmup.run(warmup.PROCESS_STEPS)
+        connections.close_all()
+        return application
+
+
+class Command(BaseCommand):
+    help = (
+        "Запускает сайт под gunicorn: приложение загружается и прогревается "
+        "до fork воркеров, каждый воркер прогревается до первого запроса, "
+        "SIGTERM завершает работу после текущих запросов"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bind", default=settings.SERVE_BIND)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.SERVE_WORKERS,
+            help="Число процессов-воркеров",
+        )
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=settings.SERVE_THREADS,
+            help="Потоков в воркере (больше 1 - воркеры gthread)",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=int,
+            default=settings.SERVE_TIMEOUT,
+            help="Воркер, молчащий дольше, перезапускается",
+        )
+        parser.add_argument(
+            "--graceful-timeout",
+            type=int,
+            default=settings.SERVE_GRACEFUL_TIMEOUT,
+            help="Сколько секунд ждать текущие запросы при остановке",
+        )
+        parser.add_argument(
+            "--max-requests",
+            type=int,
+            default=0,
+            help="Перезапуск воркера после N запросов (0 - без перезапуска)",
+        )
+        parser.add_argument(
+            "--no-warmup", action="store_true", help="Не прогревать процессы"
+        )
+
+    def handle(self, *args, **options):
+        Server(
+            {
+                "bind": options["bind"],
+                "workers": options["workers"],
+                "threads": options["threads"],
+                "timeout": options["timeout"],
+                "graceful_timeout": options["graceful_timeout"],
+                "max_requests": options["max_requests"],
+                "max_requests_jitter": options["max_requests"] // 10,
+                "preload_app": True,
+                "accesslog": "-",
+            },
+            warm_up=not options["no_warmup"],
+        ).run()
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from medic_card.warmup import CACHE_STEPS, warm_caches
+
+
+class Command(BaseCommand):
+    help = (
+        "Прогревает общие кэши после деплоя или импорта: файлы sitemap и "
+        "кэш страниц (главная, темы, билеты) в параллельных потоках"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--cache",
+            choices=[name for name, _ in CACHE_STEPS],
+            action="append",
+            help="Кэш (можно несколько, по умолчанию все)",
+        )
+        parser.add_argument(
+            "--workers", type=int, default=settings.WARM_CACHES_WORKERS
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        results = warm_caches(options["cache"], options["workers"])
+        failed = []
+        for name, elapsed, result in results:
+            if isinstance(result, Exception):
+                failed.append(name)
+                self.stdout.write(
+                    self.style.ERROR(f"{name:<10}{elapsed:>8.2f} с  ошибка: {result}")
+                )
+            else:
+                self.stdout.write(f"{name:<10}{elapsed:>8.2f} с  {result}")
+        self.stdout.write(
+            f"Всего: {time.perf_counter() - started:.2f} с, "
+            f"потоков: {options['workers']}"
+        )
+        if failed:
+            raise CommandError(f"Не прогреты: {', '.join(failed)}")
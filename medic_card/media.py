@@ -0,0 +1,166 @@
+"""Отдача загруженных файлов (MEDIA_ROOT) с проверкой доступа.
+
+Django только проверяет, можно ли отдать файл, а сами байты отдает
+обратный прокси: при заданном MEDIA_ACCEL_REDIRECT_PREFIX ответ
+содержит заголовок X-Accel-Redirect с внутренним путем, который Caddy
+(handle_response) или nginx (internal location) отдает с диска. Без
+прокси файл отдается FileResponse кусками, с поддержкой Range.
+
+Файлы с хэшем содержимого в имени никогда не меняются, поэтому
+кэшируются на год с immutable; остальные - на MEDIA_CACHE_MAX_AGE.
+"""
+
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+# Хэш содержимого в имени: "<hex16+>.<расш.>", "<имя>.<hex16+>.<расш.>" или
+# копия изображения "<hex16+>-<ширина>w.<расш.>" (см. storage.py, images.py)
+HASHED_NAME_RE = re.compile(r"(^|[._-])[0-9a-f]{16,}(-\d+w)?\.[A-Za-z0-9]+$")
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+# Диапазон разобран, но лежит за пределами файла: ответ 416
+UNSATISFIABLE = object()
+
+
+def is_public(path):
+    return path.startswith(tuple(settings.MEDIA_PUBLIC_PREFIXES))
+
+
+def is_hashed(path):
+    return bool(HASHED_NAME_RE.search(os.path.basename(path)))
+
+
+def _parse_range(header, size):
+    """(начало, конец включительно) для одного диапазона.
+
+    None - заголовок не разобран или диапазонов несколько: такой Range
+    игнорируется, и файл отдается целиком (RFC 9110, 14.2).
+    UNSATISFIABLE - диапазон не пересекается с файлом.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or not any(match.groups()):
+        return None
+    start, end = match.groups()
+    if not start:
+        # bytes=-N: последние N байт
+        length = int(end)
+        if not length or not size:
+            return UNSATISFIABLE
+        return max(size - length, 0), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        return UNSATISFIABLE
+    return start, min(int(end), size - 1) if end else size - 1
+
+
+class FileRange:
+    """Файл, читаемый только в пределах [start, start + length)"""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b""
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _cache_headers(response, path):
+    if is_hashed(path):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True
+        )
+    elif is_public(path):
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, max_age=0)
+
+
+def serve_media(request, path):
+    """Отдает файл из MEDIA_ROOT после проверки доступа"""
+    # "questions/../private/x" не должен пройти проверку префикса
+    path = posixpath.normpath(path).lstrip("/")
+    if not is_public(path) and not request.user.is_staff:
+        raise Http404
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or "application/octet-stream"
+    etag = quote_etag(f"{stat.st_mtime_ns:x}-{stat.st_size:x}")
+    last_modified = int(stat.st_mtime)
+
+    prefix = settings.MEDIA_ACCEL_REDIRECT_PREFIX
+    if prefix:
+        # Прокси сам отвечает на Range и условные запросы
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + quote(path)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        _cache_headers(response, path)
+        return response
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = _file_response(request, full_path, stat.st_size, content_type, etag)
+        if encoding:
+            response["Content-Encoding"] = encoding
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(last_modified)
+    _cache_headers(response, path)
+    return response
+
+
+def _file_response(request, full_path, size, content_type, etag):
+    byte_range = None
+    header = request.headers.get("Range")
+    # If-Range: диапазон отдается только для той же версии файла
+    if header and request.headers.get("If-Range", etag) == etag:
+        byte_range = _parse_range(header, size)
+        if byte_range is UNSATISFIABLE:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = f"bytes */{size}"
+            return response
+
+    file = open(full_path, "rb")
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            FileRange(file, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response["Content-Length"] = end - start + 1
+        response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    response["Accept-Ranges"] = "bytes"
+    return response
@@ -0,0 +1,344 @@
+"""Метрики приложения в формате Prometheus (text exposition).
+
+Каждый процесс копит значения в памяти и периодически сбрасывает свои
+накопленные итоги в общий файл SQLite (строка на серию и процесс). При
+выгрузке /metrics значения всех процессов суммируются, поэтому один
+запрос видит весь инстанс независимо от того, какой воркер его принял.
+
+Процесс определяется парой pid и время запуска: pid после перезапуска
+воркера может достаться новому процессу, и без времени запуска тот
+перезаписал бы итоги завершившегося, а счетчики пошли бы назад. Строки
+завершившихся процессов при запуске каждого процесса сливаются в одну
+строку EXITED на серию, поэтому таблица не растет с каждым перезапуском.
+Файл метрик должен быть локальным для хоста: процесс считается живым по
+os.kill(pid, 0).
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _sort_key(sample):
+    # Корзины гистограммы - по возрастанию границы, +Inf в конце
+    labels, _ = sample
+    return [
+        (key, float(value) if key == "le" else 0.0, value) for key, value in labels
+    ]
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+EXITED = "exited"
+
+
+def _is_alive(process):
+    pid = int(process.split(":", 1)[0])
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Процесс есть, но принадлежит другому пользователю
+        return True
+    return True
+
+
+class SQLiteStore:
+    """Общее для процессов хранилище итогов: (серия, метки, процесс) -> значение"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.local = threading.local()
+
+    def connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS process_samples ("
+                "name TEXT NOT NULL, labels TEXT NOT NULL, process TEXT NOT NULL, "
+                "value REAL NOT NULL, PRIMARY KEY (name, labels, process))"
+            )
+            self.local.conn = conn
+        return conn
+
+    def write(self, process, rows):
+        conn = self.connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO process_samples (name, labels, process, value) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (name, labels, process) "
+                "DO UPDATE SET value = excluded.value",
+                [
+                    (name, json.dumps(labels), process, value)
+                    for (name, labels), value in rows
+                ],
+            )
+
+    def compact(self):
+        """Сливает строки завершившихся процессов, не меняя сумм"""
+        conn = self.connect()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            processes = [
+                process
+                for (process,) in conn.execute(
+                    "SELECT DISTINCT process FROM process_samples WHERE process != ?",
+                    (EXITED,),
+                )
+            ]
+            exited = [process for process in processes if not _is_alive(process)]
+            if not exited:
+                return 0
+            placeholders = ", ".join("?" * len(exited))
+            conn.execute(
+                "INSERT INTO process_samples (name, labels, process, value) "
+                "SELECT name, labels, ?, SUM(value) FROM process_samples "
+                f"WHERE process IN ({placeholders}) GROUP BY name, labels "
+                "ON CONFLICT (name, labels, process) "
+                "DO UPDATE SET value = value + excluded.value",
+                [EXITED, *exited],
+            )
+            conn.execute(
+                f"DELETE FROM process_samples WHERE process IN ({placeholders})",
+                exited,
+            )
+        return len(exited)
+
+    def read(self):
+        rows = self.connect().execute(
+            "SELECT name, labels, SUM(value) FROM process_samples "
+            "GROUP BY name, labels"
+        )
+        return {
+            (name, tuple(tuple(pair) for pair in json.loads(labels))): value
+            for name, labels, value in rows
+        }
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def series_names(self):
+        return [self.name]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self.registry.add((self.name, _labels_key(labels)), amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, registry)
+
+    def series_names(self):
+        return [f"{self.name}_bucket", f"{self.name}_sum", f"{self.name}_count"]
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        updates = [
+            ((f"{self.name}_bucket", key + (("le", repr(bound)),)), 1)
+            for bound in self.buckets
+            if value <= bound
+        ]
+        updates += [
+            ((f"{self.name}_bucket", key + (("le", "+Inf"),)), 1),
+            ((f"{self.name}_sum", key), value),
+            ((f"{self.name}_count", key), 1),
+        ]
+        self.registry.add_many(updates)
+
+
+class Registry:
+    """Метрики процесса с периодическим сбросом в общее хранилище"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.values = defaultdict(float)
+        self.dirty = set()
+        self.last_flush = 0.0
+        self._store = None
+        self.compacted = False
+        self.process = self._process_key()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    @staticmethod
+    def _process_key():
+        """Ключ процесса в хранилище: pid и время запуска"""
+        return f"{os.getpid()}:{time.time_ns()}"
+
+    def _after_fork(self):
+        # Итоги родителя сбрасывает сам родитель, воркер начинает с нуля
+        self.lock = threading.Lock()
+        self.values = defaultdict(float)
+        self.dirty = set()
+        self._store = None
+        self.compacted = False
+        self.process = self._process_key()
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = SQLiteStore(settings.METRICS_DB)
+        return self._store
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def add(self, key, amount):
+        with self.lock:
+            self.values[key] += amount
+            self.dirty.add(key)
+
+    def add_many(self, updates):
+        with self.lock:
+            for key, amount in updates:
+                self.values[key] += amount
+                self.dirty.add(key)
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows = [(key, self.values[key]) for key in self.dirty]
+            self.dirty.clear()
+            self.last_flush = time.monotonic()
+        if rows:
+            try:
+                self.store.write(self.process, rows)
+                if not self.compacted:
+                    # Один раз за жизнь процесса: убрать строки завершившихся
+                    self.compacted = True
+                    self.store.compact()
+            except sqlite3.Error:
+                # Метрики не должны ронять запросы; попробуем в следующий раз
+                with self.lock:
+                    self.dirty.update(key for key, _ in rows)
+
+    def collect(self):
+        """Суммарные значения всех процессов"""
+        self.flush()
+        return self.store.read()
+
+    def exposition(self):
+        """Текст в формате Prometheus text exposition 0.0.4"""
+        samples = defaultdict(list)
+        for (name, labels), value in self.collect().items():
+            samples[name].append((labels, value))
+
+        lines = []
+        for metric in sorted(self.metrics.values(), key=lambda item: item.name):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for series in metric.series_names():
+                for labels, value in sorted(samples.get(series, []), key=_sort_key):
+                    lines.append(f"{series}{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+REQUEST_LATENCY = Histogram(
+    "medic_http_request_duration_seconds",
+    "Время обработки HTTP-запроса по имени URL",
+)
+REQUESTS = Counter(
+    "medic_http_requests_total", "HTTP-запросы по имени URL и классу статуса"
+)
+DB_QUERIES = Counter("medic_db_queries_total", "SQL-запросы по имени URL")
+CACHE_LOOKUPS = Counter(
+    "medic_cache_lookups_total", "Обращения к кэшу: result=hit|miss"
+)
+RATELIMITED = Counter(
+    "medic_ratelimit_rejections_total", "Запросы, отклоненные ограничением частоты"
+)
+COUNTER_STORE_LATENCY = Histogram(
+    "medic_counter_store_duration_seconds",
+    "Операции хранилища счетчиков ограничения частоты: op=add|incr|get|take|...",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05, 0.25),
+)
+COUNTER_STORE_ERRORS = Counter(
+    "medic_counter_store_errors_total", "Ошибки SQLite в хранилище счетчиков"
+)
+ANSWERS_GRADED = Counter(
+    "medic_quiz_answers_total", "Проверенные ответы: result=correct|wrong"
+)
+ANSWER_WRITE_BATCH = Histogram(
+    "medic_quiz_answer_write_batch_size",
+    "Число ответов в одной транзакции потока-писателя (ANSWER_WRITE_BEHIND)",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200),
+)
+TICKETS_COMPLETED = Counter(
+    "medic_quiz_tickets_completed_total",
+    "Завершенные билеты: kind=ticket|retake|errors_work",
+)
+
+
+class MetricsMiddleware:
+    """Записывает метрики запроса; ставится перед TimingMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else "unmatched"
+        REQUEST_LATENCY.observe(elapsed, view=view)
+        REQUESTS.inc(view=view, status=f"{response.status_code // 100}xx")
+        # medic_card.ratelimit отмечает отклоненные запросы флагом request.limited
+        if getattr(request, "limited", False):
+            RATELIMITED.inc(view=view)
+
+        timings = getattr(request, "timings", None)
+        if timings is not None:
+            DB_QUERIES.inc(timings.db_queries, view=view)
+            if timings.cache_hits:
+                CACHE_LOOKUPS.inc(timings.cache_hits, result="hit")
+            if timings.cache_misses:
+                CACHE_LOOKUPS.inc(timings.cache_misses, result="miss")
+
+        REGISTRY.maybe_flush()
+        return response
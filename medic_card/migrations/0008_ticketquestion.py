@@ -0,0 +1,177 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def collapse_question_copies(apps, schema_editor):
+    """Переносит вопросы в таблицу вхождений и схлопывает семейства копий.
+
+    Каждая копия (по цепочке original_question) заменяется корневым
+    вопросом: вхождение в билет переходит на оригинал, ответы
+    пользователей переносятся (при конфликте остается более поздний),
+    выбранные варианты сопоставляются по позиции, а сама копия удаляется.
+    """
+    Answer = apps.get_model("medic_card", "Answer")
+    Question = apps.get_model("medic_card", "Question")
+    TicketProgress = apps.get_model("medic_card", "TicketProgress")
+    TicketQuestion = apps.get_model("medic_card", "TicketQuestion")
+    UserAnswer = apps.get_model("medic_card", "UserAnswer")
+
+    parents = dict(Question.objects.values_list("id", "original_question_id"))
+
+    def find_root(question_id):
+        seen = set()
+        while parents.get(question_id) and question_id not in seen:
+            seen.add(question_id)
+            question_id = parents[question_id]
+        return question_id
+
+    roots = {question_id: find_root(question_id) for question_id in parents}
+
+    # Вхождения вопросов в билеты (порядок берется из самого вопроса)
+    links = {}
+    for question_id, ticket_id, order in Question.objects.values_list(
+        "id", "ticket_id", "order"
+    ).order_by("id"):
+        links.setdefault((ticket_id, roots[question_id]), order)
+    TicketQuestion.objects.bulk_create(
+        [
+            TicketQuestion(ticket_id=ticket_id, question_id=question_id, order=order)
+            for (ticket_id, question_id), order in links.items()
+        ],
+        batch_size=500,
+    )
+
+    copies = {
+        question_id: root_id
+        for question_id, root_id in roots.items()
+        if question_id != root_id
+    }
+    if not copies:
+        return
+
+    # Сопоставление вариантов ответа копии и оригинала по позиции
+    answers_by_question = {}
+    for answer_id, question_id in (
+        Answer.objects.filter(question_id__in=set(copies) | set(copies.values()))
+        .order_by("question_id", "order", "id")
+        .values_list("id", "question_id")
+    ):
+        answers_by_question.setdefault(question_id, []).append(answer_id)
+
+    answer_map = {}
+    for copy_id, root_id in copies.items():
+        root_answers = answers_by_question.get(root_id, [])
+        for position, answer_id in enumerate(answers_by_question.get(copy_id, [])):
+            if position < len(root_answers):
+                answer_map[answer_id] = root_answers[position]
+
+    # Ответы пользователей переносим на оригинал
+    for user_answer in UserAnswer.objects.filter(question_id__in=copies).order_by(
+        "answered_at"
+    ):
+        root_id = copies[user_answer.question_id]
+        existing = UserAnswer.objects.filter(
+            user_id=user_answer.user_id, question_id=root_id
+        ).first()
+        if existing and existing.answered_at >= user_answer.answered_at:
+            continue
+        if existing:
+            existing.delete()
+
+        selected = [
+            answer_map[answer_id]
+            for answer_id in user_answer.selected_answers.values_list("id", flat=True)
+            if answer_id in answer_map
+        ]
+        user_answer.question_id = root_id
+        user_answer.save(update_fields=["question"])
+        user_answer.selected_answers.set(selected)
+
+    # Сохраненный порядок вопросов в прогрессе ссылается на оригиналы
+    for progress in TicketProgress.objects.exclude(question_order=None):
+        question_order = []
+        for question_id in progress.question_order:
+            question_id = copies.get(question_id, question_id)
+            if question_id not in question_order:
+                question_order.append(question_id)
+        if question_order != progress.question_order:
+            progress.question_order = question_order
+            progress.save(update_fields=["question_order"])
+
+    Question.objects.filter(id__in=copies).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("medic_card", "0007_question_original_question"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TicketQuestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "order",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Порядок в билете"
+                    ),
+                ),
+                (
+                    "question",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="ticket_links",
+                        to="medic_card.question",
+                        verbose_name="Вопрос",
+                    ),
+                ),
+                (
+                    "ticket",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="question_links",
+                        to="medic_card.ticket",
+                        verbose_name="Билет",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Вопрос билета",
+                "verbose_name_plural": "Вопросы билета",
+                "ordering": ["order", "id"],
+                "unique_together": {("ticket", "question")},
+            },
+        ),
+        # Обратно копии не восстанавливаются; откат возможен на пустой базе
+        migrations.RunPython(collapse_question_copies, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="question",
+            name="original_question",
+        ),
+        migrations.RemoveField(
+            model_name="question",
+            name="ticket",
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="questions",
+            field=models.ManyToManyField(
+                blank=True,
+                related_name="tickets",
+                through="medic_card.TicketQuestion",
+                to="medic_card.question",
+                verbose_name="Вопросы",
+            ),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:33
+
+from django.db import migrations, models
+
+
+def fill_updated_at(apps, schema_editor):
+    """Для существующих записей дата изменения равна дате создания"""
+    for model_name in ("Theme", "Ticket", "Question"):
+        model = apps.get_model("medic_card", model_name)
+        model.objects.update(updated_at=models.F("created_at"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("medic_card", "0008_ticketquestion"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+        migrations.AddField(
+            model_name="theme",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+        migrations.AddField(
+            model_name="ticket",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Дата изменения"),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("medic_card", "0009_content_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="question",
+            name="image_height",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Высота изображения"
+            ),
+        ),
+        migrations.AddField(
+            model_name="question",
+            name="image_renditions",
+            field=models.JSONField(
+                blank=True, default=list, editable=False, verbose_name="Ширины копий"
+            ),
+        ),
+        migrations.AddField(
+            model_name="question",
+            name="image_width",
+            field=models.PositiveIntegerField(
+                blank=True, editable=False, null=True, verbose_name="Ширина изображения"
+            ),
+        ),
+    ]
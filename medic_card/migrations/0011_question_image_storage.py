@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:43
+
+import django.core.validators
+from django.db import migrations, models
+
+import medic_card.storage
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("medic_card", "0010_question_image_renditions"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="question",
+            name="image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=medic_card.storage.ContentAddressedStorage(),
+                upload_to="questions/images/",
+                validators=[
+                    django.core.validators.FileExtensionValidator(
+                        allowed_extensions=["png", "jpg", "jpeg", "gif"]
+                    )
+                ],
+                verbose_name="Изображение",
+            ),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.7 on 2026-10-19 06:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("medic_card", "0011_question_image_storage"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ErrorsWorkAttempt",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "ticket_id",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Временный билет"
+                    ),
+                ),
+                (
+                    "initial_errors_count",
+                    models.PositiveIntegerField(
+                        default=0, verbose_name="Ошибок в начале"
+                    ),
+                ),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="errors_work_attempt",
+                        to=settings.AUTH_USER_MODEL,
+                        verbose_name="Пользователь",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Работа над ошибками",
+                "verbose_name_plural": "Работа над ошибками",
+            },
+        ),
+    ]
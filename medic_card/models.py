@@ -4,6 +4,34 @@ from django.contrib.contenttypes.models import ContentType
 from django.core.validators import FileExtensionValidator
 from django.db import models
 
+from .storage import ContentAddressedStorage
+
+
+def cached_for_user(obj, name, user, compute):
+    """Кэширует значение, зависящее от пользователя, на экземпляре модели.
+
+    Шаблонные фильтры вызывают методы прогресса и избранного по
+    нескольку раз для одного объекта; списки заполняют этот кэш заранее
+    (см. preload_user_state), чтобы не делать запрос на каждую карточку.
+    """
+    cache = obj.__dict__.setdefault("_user_cache", {})
+    key = (name, user.pk)
+    if key not in cache:
+        cache[key] = compute()
+    return cache[key]
+
+
+def _progress_stats(total_questions, correct_answers, **extra):
+    return {
+        "total_questions": total_questions,
+        "correct_answers": correct_answers,
+        "mistakes": total_questions - correct_answers,
+        "accuracy": (correct_answers / total_questions * 100)
+        if total_questions > 0
+        else 0,
+        **extra,
+    }
+
 
 class Theme(models.Model):
     """Модель темы - может создавать только персонал"""
@@ -17,6 +45,7 @@ class Theme(models.Model):
         limit_choices_to={"is_staff": True},
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     is_active = models.BooleanField(default=True, verbose_name="Активна")
     order = models.PositiveIntegerField(default=0, verbose_name="Порядок сортировки")
 
@@ -28,7 +57,51 @@ class Theme(models.Model):
     def __str__(self):
         return self.title
 
+    @classmethod
+    def with_counts(cls, queryset=None):
+        """Темы с количеством активных билетов (для get_tickets_count)"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            active_tickets_count=models.Count(
+                "tickets",
+                filter=models.Q(
+                    tickets__is_active=True, tickets__is_temporary=False
+                ),
+                distinct=True,
+            )
+        )
+
+    @classmethod
+    def preload_user_state(cls, themes, user):
+        """Загружает прогресс и избранное пользователя для списка тем"""
+        themes = list(themes)
+        Favorites.preload(user, themes)
+        if not user.is_authenticated or not themes:
+            return themes
+
+        totals = (
+            TicketProgress.objects.filter(
+                user=user,
+                ticket__is_active=True,
+                ticket__is_temporary=False,
+                ticket__themes__in=themes,
+            )
+            .values("ticket__themes")
+            .annotate(
+                total=models.Sum("total_questions"),
+                correct=models.Sum("correct_answers"),
+            )
+        )
+        totals = {row["ticket__themes"]: row for row in totals}
+        for theme in themes:
+            row = totals.get(theme.id, {})
+            stats = _progress_stats(row.get("total") or 0, row.get("correct") or 0)
+            cached_for_user(theme, "progress_stats", user, lambda: stats)
+        return themes
+
     def get_tickets_count(self):
+        if hasattr(self, "active_tickets_count"):
+            return self.active_tickets_count
         return self.tickets.filter(is_active=True, is_temporary=False).count()
 
     def get_user_progress_stats(self, user):
@@ -36,28 +109,19 @@ class Theme(models.Model):
         if not user.is_authenticated:
             return None
 
-        tickets = self.tickets.filter(is_active=True, is_temporary=False)
-        total_questions = 0
-        correct_answers = 0
-        mistakes = 0
+        def compute():
+            totals = TicketProgress.objects.filter(
+                user=user,
+                ticket__themes=self,
+                ticket__is_active=True,
+                ticket__is_temporary=False,
+            ).aggregate(
+                total=models.Sum("total_questions"),
+                correct=models.Sum("correct_answers"),
+            )
+            return _progress_stats(totals["total"] or 0, totals["correct"] or 0)
 
-        for ticket in tickets:
-            try:
-                progress = TicketProgress.objects.get(user=user, ticket=ticket)
-                total_questions += progress.total_questions
-                correct_answers += progress.correct_answers
-                mistakes += progress.total_questions - progress.correct_answers
-            except TicketProgress.DoesNotExist:
-                pass
-
-        return {
-            "total_questions": total_questions,
-            "correct_answers": correct_answers,
-            "mistakes": mistakes,
-            "accuracy": (correct_answers / total_questions * 100)
-            if total_questions > 0
-            else 0,
-        }
+        return cached_for_user(self, "progress_stats", user, compute)
 
     def get_progress_color(self, user):
         """Возвращает цвет рамки на основе количества ошибок"""
@@ -92,6 +156,7 @@ class Ticket(models.Model):
         limit_choices_to={"is_staff": True},
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     order = models.PositiveIntegerField(default=0, verbose_name="Порядок сортировки")
     is_temporary = models.BooleanField(default=False, verbose_name="Временный билет")
@@ -102,6 +167,13 @@ class Ticket(models.Model):
         blank=True,
         verbose_name="Оригинальный билет",
     )
+    questions = models.ManyToManyField(
+        "Question",
+        through="TicketQuestion",
+        related_name="tickets",
+        blank=True,
+        verbose_name="Вопросы",
+    )
 
     class Meta:
         verbose_name = "Билет"
@@ -115,33 +187,83 @@ class Ticket(models.Model):
             theme_titles += "..."
         return f"{self.title} ({theme_titles})"
 
+    @classmethod
+    def with_counts(cls, queryset=None):
+        """Билеты с количеством активных вопросов (для get_questions_count)"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            active_questions_count=models.Count(
+                "questions",
+                filter=models.Q(questions__is_active=True),
+                distinct=True,
+            )
+        )
+
+    @classmethod
+    def preload_user_state(cls, tickets, user):
+        """Загружает прогресс и избранное пользователя для списка билетов"""
+        tickets = list(tickets)
+        Favorites.preload(user, tickets)
+        if not user.is_authenticated or not tickets:
+            return tickets
+
+        progress_by_ticket = {
+            progress.ticket_id: progress
+            for progress in TicketProgress.objects.filter(user=user, ticket__in=tickets)
+        }
+        for ticket in tickets:
+            progress = progress_by_ticket.get(ticket.id)
+            stats = ticket._stats_from_progress(progress)
+            cached_for_user(ticket, "progress_stats", user, lambda: stats)
+        return tickets
+
     def get_questions_count(self):
+        if hasattr(self, "active_questions_count"):
+            return self.active_questions_count
         return self.questions.filter(is_active=True).count()
 
+    def get_questions(self):
+        """Возвращает активные вопросы билета в порядке внутри билета"""
+        return Question.objects.filter(
+            ticket_links__ticket=self, is_active=True
+        ).order_by("ticket_links__order", "ticket_links__id")
+
+    def add_questions(self, questions):
+        """Добавляет вопросы в конец билета, пропуская уже добавленные"""
+        last_order = self.question_links.aggregate(models.Max("order"))["order__max"]
+        start = 0 if last_order is None else last_order + 1
+        TicketQuestion.objects.bulk_create(
+            [
+                TicketQuestion(ticket=self, question=question, order=start + i)
+                for i, question in enumerate(questions)
+            ],
+            ignore_conflicts=True,
+        )
+
     def get_user_progress_stats(self, user):
         """Возвращает статистику прогресса пользователя по билету"""
         if not user.is_authenticated:
             return None
 
-        try:
-            progress = TicketProgress.objects.get(user=user, ticket=self)
-            return {
-                "total_questions": progress.total_questions,
-                "correct_answers": progress.correct_answers,
-                "mistakes": progress.total_questions - progress.correct_answers,
-                "accuracy": (progress.correct_answers / progress.total_questions * 100)
-                if progress.total_questions > 0
-                else 0,
-                "is_completed": progress.is_completed,
-            }
-        except TicketProgress.DoesNotExist:
-            return {
-                "total_questions": self.get_questions_count(),
-                "correct_answers": 0,
-                "mistakes": 0,
-                "accuracy": 0,
-                "is_completed": False,
-            }
+        return cached_for_user(
+            self,
+            "progress_stats",
+            user,
+            lambda: self._stats_from_progress(
+                TicketProgress.objects.filter(user=user, ticket=self).first()
+            ),
+        )
+
+    def _stats_from_progress(self, progress):
+        if progress is None:
+            return _progress_stats(
+                self.get_questions_count(), 0, is_completed=False
+            )
+        return _progress_stats(
+            progress.total_questions,
+            progress.correct_answers,
+            is_completed=progress.is_completed,
+        )
 
     def get_progress_color(self, user):
         """Возвращает цвет рамки на основе количества ошибок"""
@@ -176,24 +298,8 @@ class Ticket(models.Model):
 
         temp_ticket.themes.set(self.themes.all())
 
-        for question in wrong_questions:
-            new_question = Question.objects.create(
-                ticket=temp_ticket,
-                text=question.text,
-                image=question.image,
-                created_by=user,
-                is_active=True,
-            )
-
-            # Копируем ответы
-            for answer in question.answers.filter(is_active=True):
-                Answer.objects.create(
-                    question=new_question,
-                    text=answer.text,
-                    is_correct=answer.is_correct,
-                    is_active=True,
-                    order=answer.order,
-                )
+        # Вопросы не копируются: временный билет ссылается на те же вопросы
+        temp_ticket.add_questions(wrong_questions)
 
         return temp_ticket
 
@@ -205,12 +311,11 @@ class Ticket(models.Model):
 class Question(models.Model):
     """Модель вопроса - может создавать только персонал"""
 
-    ticket = models.ForeignKey(
-        Ticket, on_delete=models.CASCADE, related_name="questions", verbose_name="Билет"
-    )
     text = models.TextField(verbose_name="Текст вопроса")
     image = models.ImageField(
         upload_to="questions/images/",
+        # Имена по хэшу содержимого: одинаковые загрузки не дублируются
+        storage=ContentAddressedStorage(),
         blank=True,
         null=True,
         validators=[
@@ -218,6 +323,17 @@ class Question(models.Model):
         ],
         verbose_name="Изображение",
     )
+    # Заполняются medic_card.images при загрузке изображения (не через
+    # width_field/height_field: те читают файл при каждой загрузке модели)
+    image_width = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Ширина изображения"
+    )
+    image_height = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Высота изображения"
+    )
+    image_renditions = models.JSONField(
+        default=list, blank=True, editable=False, verbose_name="Ширины копий"
+    )
     created_by = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -225,17 +341,9 @@ class Question(models.Model):
         limit_choices_to={"is_staff": True},
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата изменения")
     is_active = models.BooleanField(default=True, verbose_name="Активен")
     order = models.PositiveIntegerField(default=0, verbose_name="Порядок сортировки")
-    original_question = models.ForeignKey(
-        'self',
-        on_delete=models.CASCADE,
-        null=True,
-        blank=True,
-        default=None,
-        related_name='question_copies',
-        verbose_name="Оригинальный вопрос"
-    )
 
     class Meta:
         verbose_name = "Вопрос"
@@ -243,14 +351,60 @@ class Question(models.Model):
         ordering = ["order", "created_at"]
 
     def __str__(self):
-        return f"{self.ticket.title} - {self.text[:50]}..."
+        return f"{self.text[:50]}..."
 
     def get_correct_answers(self):
         return self.answers.filter(is_correct=True)
 
+    @classmethod
+    def with_counts(cls, queryset=None):
+        """Вопросы с количеством активных ответов (для get_answers_count)"""
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.annotate(
+            active_answers_count=models.Count(
+                "answers", filter=models.Q(answers__is_active=True), distinct=True
+            )
+        )
+
     def get_answers_count(self):
+        if hasattr(self, "active_answers_count"):
+            return self.active_answers_count
         return self.answers.filter(is_active=True).count()
 
+    def get_primary_ticket(self):
+        """Возвращает основной (первый постоянный) билет вопроса"""
+        for ticket in self.tickets.all():
+            if ticket.is_active and not ticket.is_temporary:
+                return ticket
+        return None
+
+
+class TicketQuestion(models.Model):
+    """Вхождение вопроса в билет с порядком внутри билета"""
+
+    ticket = models.ForeignKey(
+        Ticket,
+        on_delete=models.CASCADE,
+        related_name="question_links",
+        verbose_name="Билет",
+    )
+    question = models.ForeignKey(
+        Question,
+        on_delete=models.CASCADE,
+        related_name="ticket_links",
+        verbose_name="Вопрос",
+    )
+    order = models.PositiveIntegerField(default=0, verbose_name="Порядок в билете")
+
+    class Meta:
+        verbose_name = "Вопрос билета"
+        verbose_name_plural = "Вопросы билета"
+        ordering = ["order", "id"]
+        unique_together = ["ticket", "question"]
+
+    def __str__(self):
+        return f"{self.ticket.title} - {self.question.text[:50]}..."
+
 
 class Answer(models.Model):
     """Модель варианта ответа"""
@@ -339,9 +493,7 @@ class TicketProgress(models.Model):
 
     def get_current_question(self):
         """Возвращает текущий вопрос"""
-        questions = self.ticket.questions.filter(is_active=True).order_by(
-            "order", "created_at"
-        )
+        questions = self.ticket.get_questions()
         if self.current_question_index < questions.count():
             return questions[self.current_question_index]
         return None
@@ -386,22 +538,18 @@ class TicketProgress(models.Model):
     def get_questions_in_order(self):
         """Возвращает вопросы в сохраненном порядке"""
         if self.question_order:
-            # Получаем вопросы в сохраненном порядке
-            questions = []
-            for question_id in self.question_order:
-                try:
-                    question = Question.objects.get(id=question_id, is_active=True)
-                    questions.append(question)
-                except Question.DoesNotExist:
-                    continue
-            return questions
-        else:
-            # Если порядок не сохранен, возвращаем в обычном порядке
-            return list(
-                self.ticket.questions.filter(is_active=True).order_by(
-                    "order", "created_at"
-                )
+            # Получаем вопросы в сохраненном порядке одним запросом
+            questions = Question.objects.filter(is_active=True).in_bulk(
+                self.question_order
             )
+            return [
+                questions[question_id]
+                for question_id in self.question_order
+                if question_id in questions
+            ]
+        else:
+            # Если порядок не сохранен, возвращаем в порядке билета
+            return list(self.ticket.get_questions())
 
     def set_questions_order(self, questions):
         """Сохраняет порядок вопросов"""
@@ -409,6 +557,54 @@ class TicketProgress(models.Model):
         self.save()
 
 
+class ErrorsWorkAttempt(models.Model):
+    """Текущая работа над ошибками пользователя.
+
+    Одна короткая строка на пользователя вместо ключей в сессии: сессия
+    не переписывается при каждом шаге работы над ошибками.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name="errors_work_attempt",
+        verbose_name="Пользователь",
+    )
+    # Не внешний ключ: временный билет удаляется по завершении, а его id
+    # нужен, чтобы перенаправить на результаты
+    ticket_id = models.PositiveIntegerField(
+        null=True, blank=True, verbose_name="Временный билет"
+    )
+    initial_errors_count = models.PositiveIntegerField(
+        default=0, verbose_name="Ошибок в начале"
+    )
+
+    class Meta:
+        verbose_name = "Работа над ошибками"
+        verbose_name_plural = "Работа над ошибками"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.initial_errors_count}"
+
+    @classmethod
+    def initial_count(cls, user):
+        return (
+            cls.objects.filter(user=user)
+            .values_list("initial_errors_count", flat=True)
+            .first()
+        ) or 0
+
+    @classmethod
+    def remember(cls, user, **fields):
+        """Обновляет поля попытки пользователя (создает ее при необходимости)"""
+        if not cls.objects.filter(user=user).update(**fields):
+            cls.objects.get_or_create(user=user, defaults=fields)
+
+    @classmethod
+    def is_attempt_ticket(cls, user, ticket_id):
+        return cls.objects.filter(user=user, ticket_id=ticket_id).exists()
+
+
 class Favorites(models.Model):
     """Модель для хранения избранных тем и билетов"""
 
@@ -434,11 +630,32 @@ class Favorites(models.Model):
         """Проверяет, добавлен ли объект в избранное"""
         if not user.is_authenticated:
             return False
-        return cls.objects.filter(
-            user=user,
-            content_type=ContentType.objects.get_for_model(obj),
-            object_id=obj.id,
-        ).exists()
+        return cached_for_user(
+            obj,
+            "is_favorite",
+            user,
+            lambda: cls.objects.filter(
+                user=user,
+                content_type=ContentType.objects.get_for_model(obj),
+                object_id=obj.id,
+            ).exists(),
+        )
+
+    @classmethod
+    def preload(cls, user, objects):
+        """Одним запросом отмечает, какие объекты списка в избранном"""
+        if not user.is_authenticated or not objects:
+            return
+        favorite_ids = set(
+            cls.objects.filter(
+                user=user,
+                content_type=ContentType.objects.get_for_model(objects[0]),
+                object_id__in=[obj.id for obj in objects],
+            ).values_list("object_id", flat=True)
+        )
+        for obj in objects:
+            is_favorite = obj.id in favorite_ids
+            cached_for_user(obj, "is_favorite", user, lambda: is_favorite)
 
     @classmethod
     def toggle_favorite(cls, user, obj):
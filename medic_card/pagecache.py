@@ -0,0 +1,195 @@
+"""Кэш целых страниц для анонимных пользователей.
+
+Публичные страницы (главная, тема, билет, вопрос) для анонимов
+одинаковы, поэтому готовый ответ кладется в общий кэш по ключу из URL
+и версии контента. Версия меняется при любом изменении тем, билетов,
+вопросов и ответов (сигналы ниже), так что правка в админке сразу
+делает старые записи недостижимыми - удалять их не нужно. bulk_create
+сигналов не шлет, поэтому массовые записи (импорт, generate_dataset)
+вызывают bump_content_version сами.
+
+Ответ отдается с Cache-Control: public, max-age=PAGE_CACHE_MAX_AGE и
+Vary: Cookie, поэтому его может переиспользовать и Caddy, и браузер;
+вошедшие пользователи (с cookie сессии) получают private-ответы.
+
+Те же сигналы поддерживают updated_at тем, билетов и вопросов, по
+которой считаются ETag и Last-Modified (см. conditional.py).
+"""
+
+import hashlib
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import parse_http_date_safe
+
+from .models import Answer, Question, Theme, Ticket, TicketQuestion
+
+VERSION_KEY = "medic_card:pagecache:version"
+
+
+# Отправляется после каждого изменения контента (например, для sitemap)
+content_changed = Signal()
+
+
+def _new_version():
+    # Время, а не incr: инкремент файлового кэша не атомарен между процессами
+    version = time.time_ns()
+    cache.set(VERSION_KEY, version, None)
+    return version
+
+
+def get_content_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = _new_version()
+    return version
+
+
+def bump_content_version():
+    """Новая версия контента; прежние страницы в кэше больше не читаются"""
+    version = _new_version()
+    content_changed.send(sender=None, version=version)
+    return version
+
+
+def fragment_cache_context():
+    """Переменные для {% cache %} вокруг общих для всех сеток карточек"""
+    return {
+        "content_version": get_content_version(),
+        "fragment_cache_timeout": settings.PAGE_CACHE_TIMEOUT,
+    }
+
+
+def page_key(request, version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"medic_card:page:{version}:{path}"
+
+
+def is_cacheable_request(request):
+    if not settings.PAGE_CACHE_ENABLED or request.method not in ("GET", "HEAD"):
+        return False
+    if request.user.is_authenticated:
+        return False
+    # Страница с сообщениями (например, после выхода) у каждого своя
+    return not len(messages.get_messages(request))
+
+
+def anonymous_page_cache(view):
+    """Кэширует ответ представления для анонимных GET-запросов.
+
+    Ставится поверх @rate_limit: попадание в кэш не стоит ни одного
+    SQL-запроса, поэтому лимит считается только для промахов.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not is_cacheable_request(request):
+            response = view(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            patch_vary_headers(response, ["Cookie"])
+            return response
+
+        key = page_key(request, get_content_version())
+        response = cache.get(key)
+        if response is not None:
+            response["X-Page-Cache"] = "HIT"
+            # Валидаторы сохранены вместе с ответом: 304 без обращения к БД
+            return get_conditional_response(
+                request,
+                etag=response.get("ETag"),
+                last_modified=parse_http_date_safe(response.get("Last-Modified")),
+                response=response,
+            )
+
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200 or response.cookies:
+            return response
+        patch_cache_control(
+            response, public=True, max_age=settings.PAGE_CACHE_MAX_AGE
+        )
+        patch_vary_headers(response, ["Cookie"])
+        if request.method == "GET":
+            cache.set(key, response, settings.PAGE_CACHE_TIMEOUT)
+        response["X-Page-Cache"] = "MISS"
+        return response
+
+    return wrapper
+
+
+@lru_cache(maxsize=1024)
+def _is_temporary_ticket(ticket_id):
+    # Признак временного билета не меняется, поэтому его можно запомнить
+    return Ticket.objects.filter(pk=ticket_id, is_temporary=True).exists()
+
+
+def touch(model, **filters):
+    """Обновляет updated_at без сигналов save (update не вызывает их)"""
+    model.objects.filter(**filters).update(updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Theme)
+@receiver([post_save, post_delete], sender=Question)
+def theme_or_question_changed(sender, **kwargs):
+    bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Answer)
+def answer_changed(sender, instance, **kwargs):
+    # Варианты ответа - часть страницы вопроса
+    touch(Question, pk=instance.question_id)
+    bump_content_version()
+
+
+@receiver([post_save, post_delete], sender=Ticket)
+def ticket_changed(sender, instance, **kwargs):
+    # Временные билеты работы над ошибками на публичных страницах не видны
+    if not instance.is_temporary:
+        bump_content_version()
+
+
+@receiver(pre_delete, sender=Ticket)
+def ticket_deleted(sender, instance, **kwargs):
+    # Без билета дата изменения его тем и вопросов не должна уменьшиться
+    if not instance.is_temporary:
+        touch(Theme, tickets=instance)
+        touch(Question, tickets=instance)
+
+
+@receiver(pre_delete, sender=Question)
+def question_deleted(sender, instance, **kwargs):
+    touch(Ticket, questions=instance, is_temporary=False)
+
+
+@receiver([post_save, post_delete], sender=TicketQuestion)
+def ticket_question_changed(sender, instance, **kwargs):
+    if not _is_temporary_ticket(instance.ticket_id):
+        touch(Ticket, pk=instance.ticket_id)
+        touch(Question, pk=instance.question_id)
+        bump_content_version()
+
+
+@receiver(m2m_changed, sender=Ticket.themes.through)
+@receiver(m2m_changed, sender=TicketQuestion)
+def ticket_membership_changed(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    if not action.startswith("post_"):
+        return
+    if not reverse and instance.is_temporary:
+        return
+    # Меняются страницы по обе стороны связи: instance и объекты из pk_set
+    touch(type(instance), pk=instance.pk)
+    if pk_set:
+        touch(model, pk__in=pk_set)
+    bump_content_version()
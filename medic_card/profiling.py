@@ -0,0 +1,255 @@
+"""Профилирование медленных запросов.
+
+Два режима:
+
+* выборочный: фоновый поток раз в PROFILER_SAMPLE_INTERVAL секунд
+  снимает стеки запросов, которые идут дольше PROFILER_THRESHOLD, и
+  сохраняет их в формате speedscope (https://www.speedscope.app);
+* по заголовку: запрос сотрудника с заголовком "X-Profile: 1"
+  целиком выполняется под cProfile и сохраняется в формате pstats.
+
+Профили складываются в PROFILER_DIR, хранится не больше
+PROFILER_MAX_FILES последних файлов (кольцевой буфер).
+"""
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+PROFILE_EXTENSIONS = (".speedscope.json", ".pstats")
+FILENAME_RE = re.compile(
+    r"^(?P<stamp>\d{8}T\d{6}_\d{6})_(?P<view>[\w.-]+)_(?P<ms>\d+)ms"
+    r"(?P<ext>\.speedscope\.json|\.pstats)$"
+)
+
+
+@dataclass
+class ProfileFile:
+    """Сохраненный профиль (метаданные берутся из имени файла)"""
+
+    name: str
+    created_at: datetime
+    view: str
+    duration_ms: int
+    kind: str
+    size: int
+
+
+def profiles_dir():
+    path = Path(settings.PROFILER_DIR)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def list_profiles():
+    """Профили от новых к старым"""
+    profiles = []
+    for path in profiles_dir().iterdir():
+        match = FILENAME_RE.match(path.name)
+        if not match:
+            continue
+        profiles.append(
+            ProfileFile(
+                name=path.name,
+                created_at=datetime.strptime(match["stamp"], "%Y%m%dT%H%M%S_%f"),
+                view=match["view"].replace("-", ":"),
+                duration_ms=int(match["ms"]),
+                kind="pstats" if match["ext"] == ".pstats" else "speedscope",
+                size=path.stat().st_size,
+            )
+        )
+    return sorted(profiles, key=lambda profile: profile.name, reverse=True)
+
+
+def get_profile_path(name):
+    """Путь к профилю по имени файла или None (имена проверяются)"""
+    if not FILENAME_RE.match(name):
+        return None
+    path = profiles_dir() / name
+    return path if path.is_file() else None
+
+
+def _save(view, duration, extension, write):
+    stamp = datetime.now().strftime("%Y%m%dT%H%M%S_%f")
+    view = re.sub(r"[^\w.-]", "-", view or "unmatched")
+    path = profiles_dir() / f"{stamp}_{view}_{int(duration * 1000)}ms{extension}"
+    write(path)
+    _trim()
+    return path
+
+
+def _trim():
+    """Оставляет не больше PROFILER_MAX_FILES последних профилей"""
+    files = sorted(
+        path
+        for path in profiles_dir().iterdir()
+        if path.name.endswith(PROFILE_EXTENSIONS)
+    )
+    for path in files[: max(len(files) - settings.PROFILER_MAX_FILES, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def speedscope_document(name, samples, interval):
+    """Профиль speedscope типа "sampled" из списка стеков (корень первым)"""
+    frames = []
+    frame_index = {}
+    stacks = []
+    for stack in samples:
+        indexes = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                function, file, line = frame
+                frames.append({"name": function, "file": file, "line": line})
+            indexes.append(frame_index[frame])
+        stacks.append(indexes)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "medic_card.profiling",
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": len(stacks) * interval,
+                "samples": stacks,
+                "weights": [interval] * len(stacks),
+            }
+        ],
+    }
+
+
+class _ActiveRequest:
+    def __init__(self, started):
+        self.started = started
+        self.samples = []
+
+
+class StackSampler:
+    """Фоновый поток, снимающий стеки долгих запросов"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.thread = None
+
+    def ensure_started(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(
+                        target=self.run, name="medic-card-profiler", daemon=True
+                    )
+                    self.thread.start()
+
+    def begin(self, thread_id):
+        self.ensure_started()
+        with self.lock:
+            self.active[thread_id] = _ActiveRequest(time.monotonic())
+
+    def end(self, thread_id):
+        with self.lock:
+            return self.active.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            interval = settings.PROFILER_SAMPLE_INTERVAL
+            time.sleep(interval)
+            now = time.monotonic()
+            with self.lock:
+                slow = {
+                    thread_id: request
+                    for thread_id, request in self.active.items()
+                    if now - request.started >= settings.PROFILER_THRESHOLD
+                }
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for thread_id, request in slow.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    request.samples.append(_stack(frame))
+
+
+def _stack(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, frame.f_lineno))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+SAMPLER = StackSampler()
+
+
+class ProfilerMiddleware:
+    """Профилирует медленные запросы и запросы сотрудников с X-Profile.
+
+    Ставится после AuthenticationMiddleware: заголовок учитывается только
+    для сотрудников.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.PROFILER_ENABLED:
+            return self.get_response(request)
+        if request.headers.get("X-Profile") == "1" and request.user.is_staff:
+            return self.profile_request(request)
+
+        thread_id = threading.get_ident()
+        SAMPLER.begin(thread_id)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            active = SAMPLER.end(thread_id)
+        duration = time.perf_counter() - started
+        if active is not None and active.samples:
+            view = _view_name(request)
+            document = speedscope_document(
+                f"{request.method} {request.path} ({view})",
+                active.samples,
+                settings.PROFILER_SAMPLE_INTERVAL,
+            )
+            _save(
+                view,
+                duration,
+                ".speedscope.json",
+                lambda path: path.write_text(json.dumps(document), encoding="utf-8"),
+            )
+        return response
+
+    def profile_request(self, request):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(self.get_response, request)
+        duration = time.perf_counter() - started
+        path = _save(
+            _view_name(request),
+            duration,
+            ".pstats",
+            lambda path: profiler.dump_stats(os.fspath(path)),
+        )
+        response["X-Profile-File"] = path.name
+        return response
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match else "unmatched"
@@ -0,0 +1,125 @@
+"""Бюджеты SQL-запросов по представлениям и поиск N+1.
+
+Для каждого запроса считаются SQL-запросы и их "формы" (текст SQL без
+параметров, списки IN (...) схлопываются). Превышение бюджета из
+settings.QUERY_BUDGETS или повторение одной формы больше
+settings.QUERY_BUDGET_MAX_REPEATS раз считается нарушением: в тестах
+(QUERY_BUDGET_RAISE = True) это исключение, в работе - запись в лог.
+"""
+
+import logging
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.urls import URLPattern, URLResolver, get_resolver
+
+from .db.routers import execute_wrapper_all
+
+logger = logging.getLogger("medic_card.query_budget")
+
+IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Запрос превысил бюджет SQL-запросов или содержит N+1"""
+
+
+def sql_shape(sql):
+    """Форма запроса: SQL без параметров, IN (...) любой длины совпадают"""
+    return IN_LIST_RE.sub("IN (...)", WHITESPACE_RE.sub(" ", sql.strip()))
+
+
+@dataclass
+class QueryReport:
+    """Запросы, выполненные при обработке одного HTTP-запроса"""
+
+    url_name: str = None
+    shapes: Counter = field(default_factory=Counter)
+
+    @property
+    def count(self):
+        return sum(self.shapes.values())
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: запоминаем форму и выполняем запрос как обычно
+        self.shapes[sql_shape(sql)] += 1
+        return execute(sql, params, many, context)
+
+    @property
+    def budget(self):
+        return get_budgets().get(self.url_name)
+
+    def repeated(self):
+        """Формы, повторенные больше допустимого (кандидаты в N+1)"""
+        limit = settings.QUERY_BUDGET_MAX_REPEATS
+        return [
+            (shape, times)
+            for shape, times in self.shapes.most_common()
+            if times > limit
+        ]
+
+    def violations(self):
+        problems = []
+        budget = self.budget
+        if budget is not None and self.count > budget:
+            problems.append(f"{self.count} SQL-запросов при бюджете {budget}")
+        for shape, times in self.repeated():
+            problems.append(f"N+1: {times} x {shape[:200]}")
+        return problems
+
+
+def get_budgets():
+    return getattr(settings, "QUERY_BUDGETS", {})
+
+
+def is_checked(url_name):
+    namespace = (url_name or "").partition(":")[0]
+    return url_name is not None and namespace in settings.QUERY_BUDGET_NAMESPACES
+
+
+def iter_url_names(resolver=None, namespace=None):
+    """Все имена URL проекта в виде "namespace:name" """
+    resolver = resolver or get_resolver()
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            inner = pattern.namespace or namespace
+            if namespace and pattern.namespace:
+                inner = f"{namespace}:{pattern.namespace}"
+            yield from iter_url_names(pattern, inner)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield f"{namespace}:{pattern.name}" if namespace else pattern.name
+
+
+def uncovered_url_names():
+    """Проверяемые имена URL, для которых не объявлен бюджет"""
+    budgets = get_budgets()
+    return sorted(
+        {name for name in iter_url_names() if is_checked(name) and name not in budgets}
+    )
+
+
+class QueryBudgetMiddleware:
+    """Считает SQL-запросы каждого запроса и проверяет бюджет его URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        report = QueryReport()
+        request.query_report = report
+        with execute_wrapper_all(report):
+            response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        report.url_name = match.view_name if match else None
+        if is_checked(report.url_name):
+            problems = report.violations()
+            if problems:
+                message = f"{report.url_name} ({request.path}): " + "; ".join(problems)
+                if settings.QUERY_BUDGET_RAISE:
+                    raise QueryBudgetExceeded(message)
+                logger.warning("Бюджет SQL-запросов нарушен: %s", message)
+        return response
@@ -0,0 +1,126 @@
+"""Ограничение частоты запросов по политикам с запасом на всплеск.
+
+Политика из settings.RATELIMIT_POLICIES - это ведро токенов: rate задает
+устойчивую скорость ("600/h"), burst - сколько запросов можно сделать
+подряд. У каждого вошедшего пользователя свое ведро на политику, у
+анонимов - общее на IP, поэтому класс за одним школьным NAT не делит
+один лимит на всех. Ведра хранятся в общем для воркеров кэше
+RATELIMIT_USE_CACHE (SQLiteCounterCache.take).
+
+Отказ - короткий ответ 429 с Retry-After, без отрисовки шаблонов и
+запросов к базе. request.limited отмечает отказ для метрик.
+
+bypass() снимает ограничение только в текущем потоке (контексте): так
+прогрев запрашивает сотни страниц с одного адреса, не трогая ведра и
+не отключая ограничение для запросов, идущих в других потоках.
+"""
+
+import math
+import re
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.utils.cache import add_never_cache_headers
+
+RATE_RE = re.compile(r"^(\d+)/(\d*)([smhd])$")
+PERIODS = {"s": 1, "m": 60, "h": 60 * 60, "d": 24 * 60 * 60}
+
+_bypassed = ContextVar("medic_card_ratelimit_bypassed", default=False)
+
+
+@contextmanager
+def bypass():
+    """Запросы внутри блока не ограничиваются (только в этом потоке)"""
+    token = _bypassed.set(True)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+
+def is_enabled():
+    return getattr(settings, "RATELIMIT_ENABLE", True) and not _bypassed.get()
+
+
+def parse_rate(rate):
+    """Разбирает частоту: "600/h" -> (600, 3600), "10/5m" -> (10, 300)"""
+    match = RATE_RE.match(rate)
+    if not match:
+        raise ImproperlyConfigured(f"Некорректная частота: {rate}")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * PERIODS[unit]
+
+
+def get_policy(name):
+    """(емкость ведра, пополнение в токенах в секунду) политики"""
+    try:
+        policy = settings.RATELIMIT_POLICIES[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Не объявлена политика ограничения: {name}")
+    count, period = parse_rate(policy["rate"])
+    return policy.get("burst", count), count / period
+
+
+def client_ip(request):
+    """IP клиента; за Caddy - последний адрес из X-Forwarded-For"""
+    if settings.RATELIMIT_TRUST_X_FORWARDED_FOR:
+        forwarded = request.META.get("HTTP_X_FORWARDED_FOR", "")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.META.get("REMOTE_ADDR", "")
+
+
+def client_key(request):
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"ip:{client_ip(request)}"
+
+
+def check_rate(request, policy):
+    """None, если запрос разрешен, иначе секунды до следующей попытки"""
+    capacity, refill_rate = get_policy(policy)
+    store = caches[settings.RATELIMIT_USE_CACHE]
+    try:
+        allowed, retry_after = store.take(
+            f"rl:{policy}:{client_key(request)}", capacity, refill_rate
+        )
+    except sqlite3.Error:
+        if settings.RATELIMIT_FAIL_OPEN:
+            return None
+        allowed, retry_after = False, 1 / refill_rate
+    return None if allowed else retry_after
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        "Слишком много запросов, попробуйте позже.\n",
+        status=429,
+        content_type="text/plain; charset=utf-8",
+    )
+    response["Retry-After"] = str(max(math.ceil(retry_after), 1))
+    add_never_cache_headers(response)
+    return response
+
+
+def rate_limit(policy):
+    """Декоратор представления: запрос расходует токен из ведра политики"""
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if is_enabled():
+                retry_after = check_rate(request, policy)
+                if retry_after is not None:
+                    request.limited = True
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,59 @@
+"""Хранилище изображений вопросов с именами по хэшу содержимого.
+
+Файл сохраняется как "<каталог>/<sha256[:32]>.<расширение>": повторная
+загрузка той же картинки (в другой вопрос или билет) не создает копию, а
+возвращает уже существующее имя. Содержимое файла по имени никогда не
+меняется, поэтому media отдается с Cache-Control immutable (см. media.py).
+
+Файлы при удалении вопросов не удаляются - один файл может принадлежать
+нескольким вопросам. Число ссылок считается по Question.image
+(images.image_references), а файлы без ссылок и их копии удаляет команда
+gc_media.
+"""
+
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_LENGTH = 32
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage, дающий файлам имена по хэшу содержимого"""
+
+    def hashed_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, f"{digest}{extension}")
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content_hash(content))
+        if self.exists(name):
+            # Такой файл уже загружен - имя и есть ссылка на него. Время
+            # изменения обновляется: иначе gc_media --min-age может счесть
+            # файл старым и удалить его до сохранения нового вопроса
+            os.utime(self.path(name))
+            return name
+        # При гонке двух одинаковых загрузок FileSystemStorage добавит к
+        # имени суффикс: файл продублируется, но ссылки останутся верными
+        return super()._save(name, content)
+
+    def adopt(self, name, directory):
+        """Сохраняет лежащий в MEDIA_ROOT файл в directory под именем по хэшу"""
+        with self.open(name, "rb") as file:
+            return self.save(posixpath.join(directory, posixpath.basename(name)), file)
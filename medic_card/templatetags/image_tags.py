@@ -0,0 +1,62 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from ..images import rendition_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def question_image(
+    question, max_width=800, css_class="", style="", alt="Изображение к вопросу"
+):
+    """Изображение вопроса: WebP/JPEG копии в srcset, размеры, loading="lazy".
+
+    max_width - наибольшая ширина на странице в CSS-пикселях; по ней
+    строится sizes, чтобы браузер не качал копию крупнее нужной.
+    """
+    if not question.image:
+        return ""
+    dimensions = ""
+    if question.image_width and question.image_height:
+        dimensions = format_html(
+            ' width="{}" height="{}"', question.image_width, question.image_height
+        )
+    widths = question.image_renditions
+    if not widths:
+        # Копии еще не готовы (например, импорт обрабатывается в фоне)
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" style="{}"{} loading="lazy" '
+            'decoding="async">',
+            question.image.url,
+            alt,
+            css_class,
+            style,
+            dimensions,
+        )
+
+    name = question.image.name
+    slot = min(int(max_width), widths[-1])
+    sizes = f"(max-width: {slot}px) 100vw, {slot}px"
+
+    def srcset(extension):
+        return format_html_join(
+            ", ",
+            "{} {}w",
+            ((rendition_url(name, width, extension), width) for width in widths),
+        )
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" style="{}"{} '
+        'loading="lazy" decoding="async"></picture>',
+        srcset("webp"),
+        sizes,
+        rendition_url(name, widths[-1], "jpg"),
+        srcset("jpg"),
+        sizes,
+        alt,
+        css_class,
+        style,
+        dimensions,
+    )
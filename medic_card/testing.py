@@ -0,0 +1,48 @@
+"""Помощники для тестов: бюджеты SQL-запросов и поиск N+1.
+
+    class HomeTests(QueryBudgetTestMixin, TestCase):
+        def test_home(self):
+            response = self.client.get(reverse("medic_card:home"))
+            self.assertQueryBudget(response)
+
+Пока примесь подключена, QueryBudgetMiddleware выбрасывает
+QueryBudgetExceeded на любом запросе тестового клиента, нарушившем
+бюджет своего URL, так что тест падает даже без явной проверки.
+"""
+
+from django.test.utils import override_settings
+
+from .querybudget import uncovered_url_names
+
+
+class QueryBudgetTestMixin:
+    """Примесь к TestCase, включающая строгую проверку бюджетов"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._query_budget_override = override_settings(
+            QUERY_BUDGET_RAISE=True, RATELIMIT_ENABLE=False
+        )
+        cls._query_budget_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._query_budget_override.disable()
+        super().tearDownClass()
+
+    def assertQueryBudget(self, response, budget=None):
+        """Проверяет число запросов ответа (по умолчанию - бюджет его URL)"""
+        report = response.wsgi_request.query_report
+        budget = report.budget if budget is None else budget
+        if budget is not None:
+            self.assertLessEqual(
+                report.count,
+                budget,
+                f"{report.url_name}: {report.count} SQL-запросов при бюджете {budget}",
+            )
+        self.assertEqual(report.repeated(), [], f"{report.url_name}: N+1")
+        return report
+
+    def assertAllViewsBudgeted(self):
+        self.assertEqual(uncovered_url_names(), [])
@@ -0,0 +1,1311 @@
+import io
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from pathlib import Path
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from medic_card_project import sitemap
+
+from . import images, metrics, profiling, ratelimit, warmup
+from .answerwriter import AnswerWrite, AnswerWriter
+from .cache import SQLiteCounterCache
+from .db.routers import use_primary
+from .db.sqlite3.base import DatabaseWrapper
+from .importers import IMAGE_STORAGE, QuestionImporter, read_rows
+from .models import (
+    Answer,
+    Question,
+    Theme,
+    Ticket,
+    TicketProgress,
+    TicketQuestion,
+    UserAnswer,
+)
+from .ratelimit import rate_limit
+from .testing import QueryBudgetTestMixin
+
+
+def create_content(staff, tickets=1, questions=2, theme=None):
+    """Тема с билетами; у каждого вопроса один верный и один неверный ответ"""
+    theme = theme or Theme.objects.create(title="Анатомия", created_by=staff)
+    result = []
+    for ticket_number in range(tickets):
+        ticket = Ticket.objects.create(
+            title=f"Билет {ticket_number + 1}", created_by=staff
+        )
+        ticket.themes.add(theme)
+        for order in range(questions):
+            question = Question.objects.create(
+                text=f"Вопрос {ticket_number + 1}.{order + 1}", created_by=staff
+            )
+            Answer.objects.create(question=question, text="Да", is_correct=True)
+            Answer.objects.create(question=question, text="Нет", is_correct=False)
+            TicketQuestion.objects.create(ticket=ticket, question=question, order=order)
+        result.append(ticket)
+    return theme, result
+
+
+def png(width=500, height=250, color="red"):
+    """Файл PNG в памяти"""
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "PNG")
+    return ContentFile(buffer.getvalue(), name="image.png")
+
+
+class TemporaryMediaMixin:
+    """MEDIA_ROOT во временном каталоге на время теста"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = Path(directory.name)
+        media_override = override_settings(MEDIA_ROOT=directory.name)
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+
+
+class TicketQuestionMigrationTests(TransactionTestCase):
+    """0008: копии вопросов схлопываются в один вопрос в нескольких билетах"""
+
+    # Вне транзакции чтения идут через псевдоним readonly
+    databases = {"default", "readonly"}
+    migrate_from = [("medic_card", "0007_question_original_question")]
+    migrate_to = [("medic_card", "0008_ticketquestion")]
+
+    def tearDown(self):
+        # Следующие тесты ждут актуальную схему
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(executor.loader.graph.leaf_nodes())
+        super().tearDown()
+
+    def test_copies_collapse_into_root_question(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+
+        OldUser = old_apps.get_model("auth", "User")
+        OldTicket = old_apps.get_model("medic_card", "Ticket")
+        OldQuestion = old_apps.get_model("medic_card", "Question")
+        OldAnswer = old_apps.get_model("medic_card", "Answer")
+        OldUserAnswer = old_apps.get_model("medic_card", "UserAnswer")
+
+        staff = OldUser.objects.create(username="staff", is_staff=True)
+        student = OldUser.objects.create(username="student")
+        first = OldTicket.objects.create(title="Билет 1", created_by=staff)
+        second = OldTicket.objects.create(title="Билет 2", created_by=staff)
+        root = OldQuestion.objects.create(
+            ticket=first, text="Вопрос", created_by=staff, order=3
+        )
+        copy = OldQuestion.objects.create(
+            ticket=second,
+            text="Вопрос",
+            created_by=staff,
+            order=5,
+            original_question=root,
+        )
+        OldAnswer.objects.create(question=root, text="Да", is_correct=True)
+        copy_answer = OldAnswer.objects.create(
+            question=copy, text="Да", is_correct=True
+        )
+        user_answer = OldUserAnswer.objects.create(
+            user=student, question=copy, is_correct=True
+        )
+        user_answer.selected_answers.set([copy_answer])
+
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.migrate_to)
+        new_apps = executor.loader.project_state(self.migrate_to).apps
+        NewQuestion = new_apps.get_model("medic_card", "Question")
+        NewTicketQuestion = new_apps.get_model("medic_card", "TicketQuestion")
+        NewUserAnswer = new_apps.get_model("medic_card", "UserAnswer")
+
+        self.assertEqual(
+            list(NewQuestion.objects.values_list("id", flat=True)), [root.id]
+        )
+        self.assertEqual(
+            set(
+                NewTicketQuestion.objects.values_list(
+                    "ticket_id", "question_id", "order"
+                )
+            ),
+            {(first.id, root.id, 3), (second.id, root.id, 5)},
+        )
+        moved = NewUserAnswer.objects.get(user_id=student.id)
+        self.assertEqual(moved.question_id, root.id)
+        self.assertEqual(
+            list(moved.selected_answers.values_list("question_id", flat=True)),
+            [root.id],
+        )
+
+
+@override_settings(RATELIMIT_ENABLE=False, PAGE_CACHE_ENABLED=False)
+class RetakeTicketTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.user = User.objects.create_user("student", password="x")
+        _, (self.ticket, self.other) = create_content(self.staff, tickets=2)
+        # Общий вопрос: входит и во второй билет
+        self.shared = self.ticket.get_questions()[0]
+        TicketQuestion.objects.create(ticket=self.other, question=self.shared, order=9)
+        self.client.force_login(self.user)
+
+    def test_retake_all_keeps_answers_to_shared_questions(self):
+        answer = UserAnswer.objects.create(
+            user=self.user, question=self.shared, is_correct=True
+        )
+        TicketProgress.objects.create(
+            user=self.user,
+            ticket=self.ticket,
+            total_questions=2,
+            correct_answers=2,
+            is_completed=True,
+            completed_at=timezone.now(),
+        )
+
+        response = self.client.get(
+            reverse("medic_card:retake_ticket", args=[self.ticket.id, "all"])
+        )
+
+        self.assertRedirects(
+            response,
+            reverse("medic_card:start_ticket", args=[self.ticket.id]),
+            fetch_redirect_response=False,
+        )
+        self.assertTrue(UserAnswer.objects.filter(pk=answer.pk).exists())
+        progress = TicketProgress.objects.get(user=self.user, ticket=self.ticket)
+        self.assertFalse(progress.is_completed)
+        self.assertEqual(progress.correct_answers, 0)
+        # Старый ответ не считается ответом новой попытки
+        self.assertLess(answer.answered_at, progress.started_at)
+
+
+def jsonl(*rows):
+    """Файл JSONL в памяти; строки-не словари пишутся как есть"""
+    lines = [row if isinstance(row, str) else json.dumps(row) for row in rows]
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def import_row(text, ticket="Билет 1"):
+    return {
+        "theme": "Анатомия",
+        "ticket": ticket,
+        "text": text,
+        "answers": [
+            {"text": "Да", "is_correct": True},
+            {"text": "Нет", "is_correct": False},
+        ],
+    }
+
+
+class QuestionImporterTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+
+    def test_malformed_jsonl_line_is_reported_and_skipped(self):
+        stream = jsonl(import_row("Вопрос 1"), "{не json", import_row("Вопрос 2"))
+
+        report = QuestionImporter(self.staff).run(read_rows(stream, "jsonl"))
+
+        self.assertEqual(report.questions, 2)
+        self.assertEqual(len(report.errors), 1)
+        self.assertTrue(report.errors[0].startswith("Строка 2:"))
+        self.assertEqual(
+            set(Question.objects.values_list("text", flat=True)),
+            {"Вопрос 1", "Вопрос 2"},
+        )
+
+    def test_invalid_values_are_row_errors(self):
+        bad_rows = [
+            {**import_row("Картинка"), "image": "../x.png"},
+            {**import_row("Число"), "answers": [1, {"text": "Да", "is_correct": 1}]},
+            {**import_row("Список"), "answers": [["Да", True], "Нет"]},
+            {**import_row("Не список"), "answers": 5},
+            {**import_row("Строка"), "answers": "[не json"},
+        ]
+        stream = jsonl(*bad_rows, import_row("Вопрос"))
+
+        report = QuestionImporter(self.staff).run(read_rows(stream, "jsonl"))
+
+        self.assertEqual(report.questions, 1)
+        self.assertEqual(
+            [error.split(":")[0] for error in report.errors],
+            [f"Строка {line}" for line in range(1, 6)],
+        )
+        self.assertIn("недопустимый путь", report.errors[0])
+
+    def test_import_skips_duplicates_in_ticket(self):
+        _, (ticket,) = create_content(self.staff)
+        stream = jsonl(
+            import_row("Вопрос 1.1"), import_row("Новый"), import_row("Новый")
+        )
+
+        report = QuestionImporter(self.staff).run(read_rows(stream, "jsonl"))
+
+        self.assertEqual((report.questions, report.skipped), (1, 2))
+        self.assertEqual(ticket.question_links.count(), 3)
+
+    def test_dry_run_counts_after_dedupe(self):
+        create_content(self.staff)
+        stream = jsonl(
+            import_row("Вопрос 1.1"),
+            import_row("Новый"),
+            import_row("Новый"),
+            import_row("Новый", ticket="Билет 2"),
+        )
+
+        report = QuestionImporter(self.staff, batch_size=2, dry_run=True).run(
+            read_rows(stream, "jsonl")
+        )
+
+        self.assertEqual(report.questions, 2)
+        self.assertEqual(report.answers, 4)
+        self.assertEqual(report.skipped, 2)
+        self.assertEqual(report.tickets, 1)
+        self.assertEqual(Question.objects.count(), 2)
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class ExportQuestionsTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        _, (self.ticket, self.other) = create_content(self.staff, tickets=2)
+        self.client.force_login(self.staff)
+
+    def export(self, fmt, **params):
+        response = self.client.get(
+            reverse("medic_card:export_questions", args=[fmt]), params
+        )
+        return response, b"".join(response.streaming_content).decode()
+
+    def test_jsonl_export_filtered_by_ticket(self):
+        response, content = self.export("jsonl", ticket=self.ticket.id)
+
+        self.assertEqual(response.status_code, 200)
+        records = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [(record["ticket"], record["text"]) for record in records],
+            [("Билет 1", "Вопрос 1.1"), ("Билет 1", "Вопрос 1.2")],
+        )
+        self.assertEqual(
+            records[0]["answers"],
+            [{"text": "Да", "is_correct": True}, {"text": "Нет", "is_correct": False}],
+        )
+
+    def test_csv_export_can_be_imported_back(self):
+        _, content = self.export("csv")
+        Question.objects.all().delete()
+        Ticket.objects.all().delete()
+
+        report = QuestionImporter(self.staff).run(
+            read_rows(io.BytesIO(content.encode()), "csv")
+        )
+
+        self.assertEqual(report.errors, [])
+        self.assertEqual(report.questions, 4)
+        self.assertEqual(
+            Answer.objects.filter(is_correct=True).count(), report.questions
+        )
+
+    def test_invalid_filter_is_bad_request(self):
+        for params in ({"theme": "abc"}, {"ticket": "1.5"}):
+            response = self.client.get(
+                reverse("medic_card:export_questions", args=["csv"]), params
+            )
+            self.assertEqual(response.status_code, 400)
+
+
+@override_settings(PAGE_CACHE_ENABLED=False)
+class QueryBudgetTests(QueryBudgetTestMixin, TestCase):
+    """Каждое представление с бюджетом укладывается в него на живых данных"""
+
+    STAFF_URLS = {
+        "medic_card:metrics",
+        "medic_card:profiles",
+        "medic_card:profile_download",
+        "medic_card:export_questions",
+        "medic_card:export_results",
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        cls.user = User.objects.create_user("student", password="x")
+        # Вопросов больше QUERY_BUDGET_MAX_REPEATS: N+1 не пройдет незамеченным
+        cls.theme, cls.tickets = create_content(cls.staff, tickets=3, questions=12)
+        cls.ticket = cls.tickets[0]
+        cls.question = cls.ticket.get_questions()[0]
+        for question in cls.ticket.get_questions():
+            wrong = question.answers.get(is_correct=False)
+            UserAnswer.objects.create(
+                user=cls.user, question=question, is_correct=False
+            ).selected_answers.set([wrong])
+
+    def requests(self):
+        """(имя URL, метод, аргументы, данные) для каждого бюджета"""
+        ticket, theme, question = self.ticket.id, self.theme.id, self.question.id
+        return [
+            ("medic_card:home", "get", [], {}),
+            ("medic_card:search", "get", [], {"q": "Вопрос"}),
+            ("medic_card:theme_detail", "get", [theme], {}),
+            ("medic_card:ticket_detail", "get", [ticket], {}),
+            ("medic_card:question_detail", "get", [question], {}),
+            ("medic_card:start_ticket", "get", [ticket], {}),
+            ("medic_card:take_question", "get", [ticket, 1], {}),
+            (
+                "medic_card:submit_answer",
+                "post",
+                [ticket, 1],
+                {"answers": [self.question.answers.get(is_correct=True).id]},
+            ),
+            ("medic_card:next_question", "get", [ticket, 1], {}),
+            ("medic_card:ticket_result", "get", [ticket], {}),
+            ("medic_card:retake_ticket", "get", [ticket, "all"], {}),
+            ("medic_card:favorites", "get", [], {}),
+            (
+                "medic_card:toggle_favorite",
+                "post",
+                [],
+                {
+                    "content_type_id": ContentType.objects.get_for_model(Ticket).id,
+                    "object_id": ticket,
+                },
+            ),
+            ("medic_card:get_errors_count", "get", [], {}),
+            (
+                "medic_card:user_overlays",
+                "get",
+                [],
+                {
+                    "themes": str(theme),
+                    "tickets": ",".join(str(item.id) for item in self.tickets),
+                },
+            ),
+            ("medic_card:errors_work", "get", [], {}),
+            ("medic_card:errors_work_result", "get", [], {}),
+            ("medic_card:metrics", "get", [], {}),
+            ("medic_card:profiles", "get", [], {}),
+            ("medic_card:profile_download", "get", ["missing.prof"], {}),
+            ("medic_card:export_questions", "get", ["csv"], {"theme": theme}),
+            ("medic_card:export_results", "get", ["answers", "jsonl"], {}),
+            ("medic_auth:profile", "get", [], {}),
+            ("medic_auth:change_password", "get", [], {}),
+            ("medic_auth:change_password_hint", "get", [], {}),
+            ("medic_auth:logout", "get", [], {}),
+            ("medic_auth:register", "get", [], {}),
+            ("medic_auth:login", "get", [], {}),
+        ]
+
+    def test_all_views_budgeted(self):
+        self.assertAllViewsBudgeted()
+
+    def test_views_within_budget(self):
+        requests = self.requests()
+        self.assertEqual(
+            sorted(name for name, *_ in requests), sorted(settings.QUERY_BUDGETS)
+        )
+        for name, method, args, data in requests:
+            # Служебные страницы - под персоналом, остальные - под студентом
+            user = self.staff if name in self.STAFF_URLS else self.user
+            self.client.force_login(user)
+            with self.subTest(name):
+                response = getattr(self.client, method)(reverse(name, args=args), data)
+                self.assertLess(response.status_code, 500)
+                self.assertQueryBudget(response)
+
+
+class MetricsStoreTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings_override = override_settings(
+            METRICS_DB=str(Path(directory.name) / "metrics.sqlite3")
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_restarted_process_with_same_pid_keeps_old_totals(self):
+        first = metrics.Registry()
+        counter = metrics.Counter("test_total", "Тест", registry=first)
+        counter.inc(5)
+        first.flush()
+
+        # Новый процесс с тем же pid (например, после перезапуска воркера)
+        second = metrics.Registry()
+        metrics.Counter("test_total", "Тест", registry=second).inc(2)
+        second.flush()
+
+        self.assertEqual(second.collect(), {("test_total", ()): 7})
+
+    def test_rows_of_exited_processes_are_merged(self):
+        exited = subprocess.Popen(["true"])
+        exited.wait()
+        store = metrics.SQLiteStore(settings.METRICS_DB)
+        rows = [(("test_total", ()), 3), (("test_seconds", (("le", "1"),)), 1)]
+        store.write(f"{exited.pid}:1", rows)
+        store.write(f"{exited.pid}:2", rows)
+
+        registry = metrics.Registry()
+        metrics.Counter("test_total", "Тест", registry=registry).inc(2)
+        registry.flush()
+
+        self.assertEqual(
+            registry.collect(),
+            {("test_total", ()): 8, ("test_seconds", (("le", "1"),)): 2},
+        )
+        processes = store.connect().execute(
+            "SELECT DISTINCT process FROM process_samples ORDER BY process"
+        )
+        self.assertEqual(
+            sorted(process for (process,) in processes),
+            sorted([metrics.EXITED, registry.process]),
+        )
+        # Повторное слияние не меняет сумм
+        store.write(f"{exited.pid}:3", rows)
+        store.compact()
+        self.assertEqual(registry.collect()[("test_total", ())], 11)
+
+
+@override_settings(METRICS_TOKEN="secret")
+class MetricsViewTests(TestCase):
+    def test_token_or_staff_required(self):
+        url = reverse("medic_card:metrics")
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.assertEqual(
+            self.client.get(url, HTTP_AUTHORIZATION="Bearer wrong").status_code, 403
+        )
+        response = self.client.get(url, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"# TYPE medic_http_requests_total counter", response.content)
+
+
+LOCMEM_CACHES = {
+    **settings.CACHES,
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False, SITEMAP_REBUILD_DELAY=None
+)
+class PageCacheInvalidationTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        _, (self.ticket,) = create_content(self.staff)
+        self.url = reverse("medic_card:ticket_detail", args=[self.ticket.id])
+
+    def test_repeated_anonymous_request_is_served_from_cache(self):
+        self.assertEqual(self.client.get(self.url)["X-Page-Cache"], "MISS")
+        self.assertEqual(self.client.get(self.url)["X-Page-Cache"], "HIT")
+
+    def test_model_save_invalidates_cached_page(self):
+        self.client.get(self.url)
+        question = self.ticket.get_questions()[0]
+        question.text = "Исправленный вопрос"
+        question.save()
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "Исправленный вопрос")
+
+    def test_bulk_import_invalidates_cached_page(self):
+        self.client.get(self.url)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            QuestionImporter(self.staff).run(
+                read_rows(jsonl(import_row("Импортированный вопрос")), "jsonl")
+            )
+        response = self.client.get(self.url)
+
+        self.assertEqual(response["X-Page-Cache"], "MISS")
+        self.assertContains(response, "Импортированный вопрос")
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHES, RATELIMIT_ENABLE=False, SITEMAP_REBUILD_DELAY=None
+)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.user = User.objects.create_user("student", password="x")
+        self.theme, (self.ticket,) = create_content(self.staff)
+        self.url = reverse("medic_card:theme_detail", args=[self.theme.id])
+
+    def test_matching_etag_returns_not_modified(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+    def test_content_change_invalidates_etag(self):
+        self.client.force_login(self.user)
+        etag = self.client.get(self.url)["ETag"]
+        self.ticket.title = "Переименованный билет"
+        self.ticket.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_is_per_user(self):
+        anonymous_etag = self.client.get(self.url)["ETag"]
+        self.client.force_login(self.user)
+
+        self.assertNotEqual(self.client.get(self.url)["ETag"], anonymous_etag)
+
+    def test_cached_page_answers_conditional_request(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        # Ответ из кэша страниц: валидаторы сохранены, база не нужна
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.wsgi_request.query_report.count, 0)
+
+
+class TokenBucketTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "ratelimit.sqlite3")
+        self.store = SQLiteCounterCache(self.path, {})
+        self.now = 1_000_000.0
+        patcher = mock.patch("medic_card.cache.time.time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_allowed_then_rejected(self):
+        results = [self.store.take("bucket", 3, 0.5) for _ in range(4)]
+
+        self.assertEqual([allowed for allowed, _ in results], [True] * 3 + [False])
+        # Токен пополняется за 1 / 0.5 секунды
+        self.assertEqual(results[-1][1], 2.0)
+
+    def test_bucket_refills_over_time(self):
+        for _ in range(3):
+            self.store.take("bucket", 3, 0.5)
+        self.now += 2
+
+        self.assertEqual(self.store.take("bucket", 3, 0.5), (True, 0.0))
+        self.assertFalse(self.store.take("bucket", 3, 0.5)[0])
+
+    def test_bucket_is_shared_between_processes(self):
+        # Отдельный экземпляр - отдельное соединение, как у другого воркера
+        other = SQLiteCounterCache(self.path, {})
+        for _ in range(2):
+            self.store.take("bucket", 3, 0.5)
+
+        self.assertTrue(other.take("bucket", 3, 0.5)[0])
+        self.assertFalse(self.store.take("bucket", 3, 0.5)[0])
+
+    def test_incr_is_shared_between_processes(self):
+        other = SQLiteCounterCache(self.path, {})
+        self.store.add("counter", 1)
+        other.incr("counter")
+
+        self.assertEqual(self.store.incr("counter", 5), 7)
+
+
+@rate_limit("test")
+def limited_view(request):
+    return HttpResponse("ok")
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = {
+            **settings.CACHES,
+            "ratelimit": {
+                "BACKEND": "medic_card.cache.SQLiteCounterCache",
+                "LOCATION": str(Path(directory.name) / "ratelimit.sqlite3"),
+            },
+        }
+        self.settings_override = override_settings(
+            CACHES=caches,
+            RATELIMIT_ENABLE=True,
+            RATELIMIT_POLICIES={"test": {"rate": "60/h", "burst": 2}},
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.factory = RequestFactory()
+
+    def request(self, ip="10.0.0.1", user=None):
+        request = self.factory.get("/", REMOTE_ADDR=ip)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_over_burst_gets_429_with_retry_after(self):
+        statuses = [limited_view(self.request()).status_code for _ in range(2)]
+        request = self.request()
+        response = limited_view(request)
+
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(response.status_code, 429)
+        # 60/h - один токен в минуту
+        self.assertEqual(response["Retry-After"], "60")
+        self.assertTrue(request.limited)
+
+    def test_buckets_are_per_ip_and_per_user(self):
+        user = User.objects.create_user("student", password="x")
+        for _ in range(2):
+            limited_view(self.request())
+
+        self.assertEqual(limited_view(self.request("10.0.0.2")).status_code, 200)
+        # Вошедший пользователь за тем же NAT не делит ведро с анонимами
+        self.assertEqual(limited_view(self.request(user=user)).status_code, 200)
+
+    @override_settings(RATELIMIT_ENABLE=False)
+    def test_disabled_limit_lets_everything_through(self):
+        statuses = {limited_view(self.request()).status_code for _ in range(5)}
+
+        self.assertEqual(statuses, {200})
+
+    def test_bypass_is_local_to_the_thread(self):
+        with ratelimit.bypass():
+            statuses = {limited_view(self.request()).status_code for _ in range(5)}
+            # Другой поток (обычный запрос) по-прежнему ограничивается
+            with ThreadPoolExecutor(1) as executor:
+                other = executor.submit(
+                    lambda: [limited_view(self.request()).status_code for _ in range(3)]
+                ).result()
+
+        self.assertEqual(statuses, {200})
+        self.assertEqual(other, [200, 200, 429])
+        self.assertEqual(limited_view(self.request()).status_code, 429)
+
+
+@override_settings(RATELIMIT_ENABLE=False, PAGE_CACHE_ENABLED=False)
+class ServerTimingTests(TestCase):
+    HEADER_RE = (
+        r'^db;dur=\d+\.\d;desc="\d+ queries", '
+        r'tpl;dur=\d+\.\d;desc="templates", '
+        r'view;dur=\d+\.\d;desc="view without templates", '
+        r'total;dur=\d+\.\d;desc="total", '
+        r'cache;desc="hits=\d+ misses=\d+"$'
+    )
+
+    def setUp(self):
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        create_content(self.staff)
+        self.url = reverse("medic_card:home")
+
+    def durations(self, header):
+        return {
+            part.split(";")[0]: float(part.split("dur=")[1].split(";")[0])
+            for part in header.split(", ")
+            if "dur=" in part
+        }
+
+    def test_header_format_for_staff(self):
+        self.client.force_login(self.staff)
+
+        header = self.client.get(self.url)["Server-Timing"]
+
+        self.assertRegex(header, self.HEADER_RE)
+        durations = self.durations(header)
+        self.assertGreater(durations["view"], 0)
+        self.assertLessEqual(durations["view"], durations["total"])
+
+    def test_hidden_from_other_users(self):
+        self.assertNotIn("Server-Timing", self.client.get(self.url))
+        self.client.force_login(User.objects.create_user("student", password="x"))
+        self.assertNotIn("Server-Timing", self.client.get(self.url))
+
+    @override_settings(SERVER_TIMING_HEADER=True)
+    def test_header_for_everyone_when_enabled(self):
+        self.assertRegex(self.client.get(self.url)["Server-Timing"], self.HEADER_RE)
+
+
+class ProfilerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        self.settings_override = override_settings(
+            PROFILER_ENABLED=True,
+            PROFILER_DIR=directory.name,
+            PROFILER_THRESHOLD=0.05,
+            PROFILER_SAMPLE_INTERVAL=0.005,
+            PROFILER_MAX_FILES=3,
+            RATELIMIT_ENABLE=False,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.user = User.objects.create_user("student", password="x")
+
+    def run_middleware(self, delay=0.0, user=None, **headers):
+        def view(request):
+            time.sleep(delay)
+            return HttpResponse("ok")
+
+        request = RequestFactory().get("/", **headers)
+        request.user = user or AnonymousUser()
+        return profiling.ProfilerMiddleware(view)(request)
+
+    def files(self, extension):
+        return sorted(path.name for path in self.directory.glob(f"*{extension}"))
+
+    def test_slow_request_saves_speedscope_profile(self):
+        self.run_middleware(delay=0.01)
+        self.assertEqual(self.files(".speedscope.json"), [])
+
+        self.run_middleware(delay=0.2)
+
+        (name,) = self.files(".speedscope.json")
+        document = json.loads((self.directory / name).read_text(encoding="utf-8"))
+        self.assertEqual(document["profiles"][0]["type"], "sampled")
+        self.assertTrue(document["profiles"][0]["samples"])
+
+    def test_x_profile_only_for_staff(self):
+        response = self.run_middleware(user=self.user, HTTP_X_PROFILE="1")
+        self.assertNotIn("X-Profile-File", response)
+        self.assertEqual(self.files(".pstats"), [])
+
+        response = self.run_middleware(user=self.staff, HTTP_X_PROFILE="1")
+        self.assertEqual(self.files(".pstats"), [response["X-Profile-File"]])
+
+    def test_only_last_files_are_kept(self):
+        paths = []
+        for duration in range(1, 6):
+            paths.append(
+                profiling._save("view", duration, ".pstats", lambda path: path.touch())
+            )
+
+        # Имена начинаются с времени создания: остаются три последних
+        self.assertEqual(self.files(".pstats"), sorted(path.name for path in paths)[2:])
+
+    def test_profiles_page_is_staff_only(self):
+        url = reverse("medic_card:profiles")
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        profiling._save("view", 1.5, ".pstats", lambda path: path.touch())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        (name,) = self.files(".pstats")
+        self.assertContains(response, name)
+
+
+@override_settings(SITEMAP_REBUILD_DELAY=None)
+class SitemapTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.settings_override = override_settings(SITEMAP_ROOT=directory.name)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        create_content(self.staff, tickets=1, questions=3)
+
+    def locations(self, name):
+        content = (self.root / name).read_text(encoding="utf-8")
+        return re.findall(r"<loc>(.*?)</loc>", content)
+
+    def test_build_splits_sections_and_writes_index(self):
+        (self.root / "sitemap-questions-9.xml").write_text("", encoding="utf-8")
+
+        with mock.patch.object(sitemap.QuestionSitemap, "limit", 2):
+            total = sitemap.build_sitemaps()
+
+        pages = {
+            "sitemap-static-1.xml": 3,
+            "sitemap-themes-1.xml": 1,
+            "sitemap-tickets-1.xml": 1,
+            "sitemap-questions-1.xml": 2,
+            "sitemap-questions-2.xml": 1,
+        }
+        self.assertEqual(
+            {path.name for path in self.root.glob("sitemap-*.xml")}, set(pages)
+        )
+        for name, count in pages.items():
+            self.assertEqual(len(self.locations(name)), count, name)
+        self.assertEqual(total, sum(pages.values()))
+        self.assertEqual(
+            sorted(self.locations("sitemap.xml")),
+            sorted(f"https://{sitemap.Site.domain}/{name}" for name in pages),
+        )
+
+    def test_files_are_served(self):
+        # Первый запрос собирает файлы сам
+        response = self.client.get(reverse("sitemap"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"sitemap-questions-1.xml", b"".join(response.streaming_content))
+
+        response = self.client.get("/sitemap-questions-1.xml")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/sitemap-questions-7.xml").status_code, 404)
+
+    def test_content_change_schedules_one_rebuild(self):
+        scheduler = sitemap.RebuildScheduler()
+        build = mock.patch.object(sitemap, "build_sitemaps").start()
+        self.addCleanup(mock.patch.stopall)
+        mock.patch.object(sitemap, "SCHEDULER", scheduler).start()
+
+        with override_settings(SITEMAP_REBUILD_DELAY=0.05):
+            with self.captureOnCommitCallbacks(execute=True):
+                Theme.objects.create(title="Новая тема", created_by=self.staff)
+                Theme.objects.create(title="Еще тема", created_by=self.staff)
+            scheduler.timer.join()
+
+        build.assert_called_once_with()
+
+
+@override_settings(SITEMAP_REBUILD_DELAY=None)
+class ImageRenditionTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        _, (ticket,) = create_content(self.staff, questions=1)
+        self.question = ticket.get_questions()[0]
+
+    def test_upload_builds_renditions(self):
+        self.question.image = png(500, 250)
+        self.question.save()
+
+        self.question.refresh_from_db()
+        self.assertEqual(
+            (self.question.image_width, self.question.image_height), (500, 250)
+        )
+        # Копии не шире оригинала
+        self.assertEqual(self.question.image_renditions, [200, 400, 500])
+        name = self.question.image.name
+        for width, extension in [(200, "webp"), (400, "jpg"), (500, "webp")]:
+            path = self.media_root / images.rendition_name(name, width, extension)
+            with Image.open(path) as rendition:
+                self.assertEqual(rendition.width, width)
+                self.assertEqual(rendition.height, width // 2)
+        self.assertFalse(
+            (self.media_root / images.rendition_name(name, 800, "jpg")).exists()
+        )
+
+    def test_adopt_stores_file_under_content_hash(self):
+        source = self.media_root / "incoming" / "photo.PNG"
+        source.parent.mkdir()
+        source.write_bytes(png().read())
+
+        name = IMAGE_STORAGE.adopt("incoming/photo.PNG", images.UPLOAD_DIR)
+
+        self.assertRegex(name, rf"^{images.UPLOAD_DIR}/[0-9a-f]{{32}}\.png$")
+        self.assertEqual((self.media_root / name).read_bytes(), source.read_bytes())
+        # Повторное принятие того же файла возвращает то же имя
+        self.assertEqual(
+            IMAGE_STORAGE.adopt("incoming/photo.PNG", images.UPLOAD_DIR), name
+        )
+
+
+@override_settings(SITEMAP_REBUILD_DELAY=None, RATELIMIT_ENABLE=False)
+class ImportedImageRenditionTests(TemporaryMediaMixin, TransactionTestCase):
+    """Копии импортированных изображений строит фоновый WORKER после commit"""
+
+    databases = {"default", "readonly"}
+
+    def test_import_enqueues_renditions_after_commit(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        (self.media_root / "incoming").mkdir()
+        (self.media_root / "incoming" / "photo.png").write_bytes(png(300, 300).read())
+
+        report = QuestionImporter(staff).run(
+            read_rows(
+                jsonl({**import_row("С картинкой"), "image": "incoming/photo.png"}),
+                "jsonl",
+            )
+        )
+        images.WORKER.wait()
+
+        self.assertEqual(report.errors, [])
+        question = Question.objects.get(text="С картинкой")
+        self.assertEqual(question.image_renditions, [200, 300])
+        self.assertTrue(
+            (
+                self.media_root
+                / images.rendition_name(question.image.name, 300, "webp")
+            ).exists()
+        )
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT_PREFIX="", MEDIA_PUBLIC_PREFIXES=["questions/"])
+class ServeMediaTests(TemporaryMediaMixin, TestCase):
+    CONTENT = b"0123456789"
+
+    def setUp(self):
+        super().setUp()
+        for path in ("questions/file.txt", "private/file.txt"):
+            (self.media_root / path).parent.mkdir(parents=True)
+            (self.media_root / path).write_bytes(self.CONTENT)
+
+    def get(self, path="questions/file.txt", **headers):
+        response = self.client.get(f"/media/{path}", **headers)
+        if response.streaming:
+            response.body = b"".join(response.streaming_content)
+        return response
+
+    def test_private_files_are_staff_only(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get("private/file.txt").status_code, 404)
+        self.assertEqual(self.get("questions/../private/file.txt").status_code, 404)
+
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.get("private/file.txt").body, self.CONTENT)
+
+    def test_single_range(self):
+        response = self.get(HTTP_RANGE="bytes=2-5")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.body, b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+        self.assertEqual(self.get(HTTP_RANGE="bytes=-3").body, b"789")
+        self.assertEqual(self.get(HTTP_RANGE="bytes=8-100").body, b"89")
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE="bytes=10-")
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_unsupported_range_is_ignored(self):
+        for header in ("bytes=0-1,5-6", "bytes=5-2", "items=0-1"):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(
+                (response.status_code, response.body), (200, self.CONTENT), header
+            )
+
+    def test_if_range(self):
+        etag = self.get()["ETag"]
+
+        response = self.get(HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, response.body), (206, b"01"))
+        response = self.get(HTTP_RANGE="bytes=0-1", HTTP_IF_RANGE='"old"')
+        self.assertEqual((response.status_code, response.body), (200, self.CONTENT))
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/")
+    def test_accel_redirect(self):
+        response = self.get("questions/file.txt")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response["X-Accel-Redirect"], "/protected-media/questions/file.txt"
+        )
+        self.assertEqual(response.content, b"")
+        self.assertIn("ETag", response)
+        self.assertEqual(self.get("private/file.txt").status_code, 404)
+
+
+@override_settings(SITEMAP_REBUILD_DELAY=None)
+class MediaGarbageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user("staff", password="x", is_staff=True)
+        _, (ticket,) = create_content(self.staff, questions=2)
+        self.first, self.second = ticket.get_questions()
+
+    def age(self, name, days=2):
+        path = self.media_root / name
+        timestamp = time.time() - days * 24 * 60 * 60
+        os.utime(path, (timestamp, timestamp))
+
+    def test_same_upload_is_stored_once(self):
+        self.first.image = png()
+        self.first.save()
+        self.second.image = png()
+        self.second.save()
+
+        self.assertEqual(self.first.image.name, self.second.image.name)
+        uploads = (self.media_root / images.UPLOAD_DIR).iterdir()
+        self.assertEqual(len([path for path in uploads if path.is_file()]), 1)
+
+    def test_unreferenced_files_and_their_renditions(self):
+        self.first.image = png(color="red")
+        self.first.save()
+        self.second.image = png(color="blue")
+        self.second.save()
+        orphan = self.second.image.name
+        self.second.image = None
+        self.second.save()
+
+        garbage = images.unreferenced_files()
+
+        kept = self.first.image.name
+        self.assertIn(orphan, garbage)
+        self.assertIn(images.rendition_name(orphan, 200, "webp"), garbage)
+        self.assertNotIn(kept, garbage)
+        self.assertNotIn(images.rendition_name(kept, 200, "webp"), garbage)
+
+    def test_gc_media_keeps_young_and_referenced_files(self):
+        self.first.image = png(color="red")
+        self.first.save()
+        kept = self.first.image.name
+        orphan = IMAGE_STORAGE.save(f"{images.UPLOAD_DIR}/x.png", png(color="blue"))
+        young = IMAGE_STORAGE.save(f"{images.UPLOAD_DIR}/x.png", png(color="green"))
+        for name in (kept, orphan):
+            self.age(name)
+
+        call_command("gc_media", "--min-age", "24", stdout=io.StringIO())
+
+        self.assertTrue((self.media_root / kept).exists())
+        self.assertTrue((self.media_root / young).exists())
+        self.assertFalse((self.media_root / orphan).exists())
+
+    def test_reupload_of_old_orphan_protects_it_from_gc(self):
+        # Гонка: файл без ссылок давно лежит, и его же загружают в вопрос,
+        # который еще не сохранен, пока работает gc_media
+        orphan = IMAGE_STORAGE.save(f"{images.UPLOAD_DIR}/x.png", png())
+        self.age(orphan)
+
+        self.assertEqual(
+            IMAGE_STORAGE.save(f"{images.UPLOAD_DIR}/y.png", png()), orphan
+        )
+        call_command("gc_media", "--min-age", "24", stdout=io.StringIO())
+
+        self.assertTrue((self.media_root / orphan).exists())
+
+
+class DatabaseRoutingTests(TransactionTestCase):
+    """Разделение чтений и записей; вне TestCase, где все идет в atomic"""
+
+    databases = {"default", "readonly"}
+
+    def capture(self):
+        stack = ExitStack()
+        self.addCleanup(stack.close)
+        return (
+            stack.enter_context(CaptureQueriesContext(connections["default"])),
+            stack.enter_context(CaptureQueriesContext(connections["readonly"])),
+        )
+
+    def sql(self, context):
+        return [query["sql"] for query in context.captured_queries]
+
+    def test_reads_go_to_readonly_outside_transaction(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        default, readonly = self.capture()
+
+        Theme.objects.create(title="Анатомия", created_by=staff)
+        titles = list(Theme.objects.values_list("title", flat=True))
+
+        self.assertEqual(titles, ["Анатомия"])
+        self.assertEqual(Theme.objects.all().db, "readonly")
+        self.assertTrue(any("INSERT" in sql for sql in self.sql(default)))
+        self.assertFalse(any("SELECT" in sql for sql in self.sql(default)))
+        self.assertTrue(any("SELECT" in sql for sql in self.sql(readonly)))
+
+    def test_reads_inside_atomic_go_to_default(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        default, readonly = self.capture()
+
+        with transaction.atomic():
+            Theme.objects.create(title="Анатомия", created_by=staff)
+            self.assertEqual(Theme.objects.all().db, "default")
+            # Незафиксированная запись видна чтению той же транзакции
+            self.assertTrue(Theme.objects.filter(title="Анатомия").exists())
+        with use_primary():
+            self.assertEqual(Theme.objects.all().db, "default")
+
+        self.assertEqual(self.sql(readonly), [])
+        # atomic() берет блокировку записи сразу (transaction_mode)
+        self.assertEqual(self.sql(default)[0], "BEGIN IMMEDIATE")
+
+
+class SQLiteBackendTests(TestCase):
+    def test_pragmas_and_read_only_connection(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {
+            **connections["default"].settings_dict,
+            "NAME": str(Path(directory.name) / "db.sqlite3"),
+            "OPTIONS": {"pragmas": {"busy_timeout": 1234}},
+        }
+        writer = DatabaseWrapper(settings_dict, alias="writer")
+        self.addCleanup(writer.close)
+        with writer.cursor() as cursor:
+            cursor.execute("CREATE TABLE item (id INTEGER)")
+            cursor.execute("PRAGMA journal_mode")
+            self.assertEqual(cursor.fetchone()[0], "wal")
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 1234)
+
+        reader = DatabaseWrapper(
+            {**settings_dict, "OPTIONS": {"read_only": True}}, alias="reader"
+        )
+        self.addCleanup(reader.close)
+        with reader.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM item")
+            self.assertEqual(cursor.fetchone()[0], 0)
+            with self.assertRaises(OperationalError):
+                cursor.execute("INSERT INTO item VALUES (1)")
+
+
+class AnswerWriterTests(TransactionTestCase):
+    """Поток-писатель пишет в своем соединении, поэтому вне TestCase"""
+
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        _, (self.ticket,) = create_content(staff)
+        self.user = User.objects.create_user("student", password="x")
+        self.progress = TicketProgress.objects.create(
+            user=self.user, ticket=self.ticket, total_questions=2
+        )
+        self.writer = AnswerWriter()
+        self.addCleanup(self.writer.stop, 5)
+
+    def answer(self, question, is_correct, progress_id=None):
+        correct = question.answers.get(is_correct=is_correct)
+        return AnswerWrite(
+            user_id=self.user.pk,
+            question_id=question.pk,
+            progress_id=progress_id or self.progress.pk,
+            answer_ids=[correct.pk],
+            is_correct=is_correct,
+        )
+
+    def enqueue(self, *writes):
+        self.writer.ensure_started()
+        for write in writes:
+            self.writer.queue.put(write)
+
+    @override_settings(ANSWER_WRITE_BATCH_WINDOW=60)
+    def test_stop_writes_queued_answers(self):
+        first, second = self.ticket.questions.order_by("pk")
+        writes = [self.answer(first, True), self.answer(second, False)]
+        self.enqueue(*writes)
+
+        self.writer.stop(5)
+
+        self.assertFalse(self.writer.thread.is_alive())
+        self.assertTrue(all(write.done.is_set() for write in writes))
+        self.assertEqual(UserAnswer.objects.filter(user=self.user).count(), 2)
+        self.progress.refresh_from_db()
+        self.assertEqual(self.progress.correct_answers, 1)
+
+    def test_answers_of_one_user_are_written_in_order(self):
+        question = self.ticket.questions.order_by("pk").first()
+        for batch_size in (1, 100):
+            with self.subTest(batch_size=batch_size), override_settings(
+                ANSWER_WRITE_BATCH_SIZE=batch_size
+            ):
+                writes = [
+                    self.answer(question, is_correct)
+                    for is_correct in (True, False, True, False)
+                ]
+                self.enqueue(*writes)
+                for write in writes:
+                    self.assertTrue(write.done.wait(5))
+
+                user_answer = UserAnswer.objects.get(user=self.user)
+                self.assertFalse(user_answer.is_correct)
+                self.assertEqual(
+                    list(user_answer.selected_answers.values_list("pk", flat=True)),
+                    writes[-1].answer_ids,
+                )
+                self.progress.refresh_from_db()
+                self.assertEqual(self.progress.correct_answers, 0)
+
+    @override_settings(ANSWER_WRITE_BATCH_WINDOW=60, ANSWER_WRITE_BATCH_SIZE=2)
+    def test_failed_answer_does_not_roll_back_its_batch(self):
+        first, second = self.ticket.questions.order_by("pk")
+        broken = self.answer(first, True, progress_id=self.progress.pk + 1000)
+        good = self.answer(second, True)
+        self.enqueue(broken, good)
+
+        self.assertTrue(good.done.wait(5))
+        self.assertTrue(broken.done.wait(5))
+        self.assertIsInstance(broken.error, TicketProgress.DoesNotExist)
+        self.assertIsNone(good.error)
+        self.assertEqual(
+            list(UserAnswer.objects.values_list("question", flat=True)), [second.pk]
+        )
+
+    def test_failed_batch_is_reported_to_every_submitter(self):
+        question = self.ticket.questions.order_by("pk").first()
+        locked = OperationalError("database is locked")
+        with mock.patch.object(self.writer, "write", side_effect=locked):
+            with self.assertRaises(OperationalError), self.assertLogs(
+                "medic_card.answerwriter", "ERROR"
+            ):
+                self.writer.submit(self.answer(question, True))
+        self.assertFalse(UserAnswer.objects.exists())
+
+        # Поток пережил ошибку, повторная отправка записывается
+        self.writer.submit(self.answer(question, True))
+
+        self.assertTrue(UserAnswer.objects.get(user=self.user).is_correct)
+
+
+class WarmCachesTests(TransactionTestCase):
+    """Прогрев идет в своих потоках и соединениях, поэтому вне TestCase"""
+
+    databases = {"default", "readonly"}
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        caches = {
+            **LOCMEM_CACHES,
+            "ratelimit": {
+                "BACKEND": "medic_card.cache.SQLiteCounterCache",
+                "LOCATION": str(Path(directory.name) / "ratelimit.sqlite3"),
+            },
+        }
+        settings_override = override_settings(
+            CACHES=caches,
+            RATELIMIT_ENABLE=True,
+            RATELIMIT_POLICIES={
+                **settings.RATELIMIT_POLICIES,
+                "read": {"rate": "60/h", "burst": 1},
+            },
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        staff = User.objects.create_user("staff", password="x", is_staff=True)
+        self.theme, _ = create_content(staff)
+
+    def test_pages_are_cached_without_spending_rate_limit(self):
+        results = warmup.warm_caches(["home", "themes"], workers=2)
+
+        self.assertEqual(
+            [(name, result) for name, _, result in results],
+            [("home", 1), ("themes", 1)],
+        )
+        url = reverse("medic_card:theme_detail", args=[self.theme.id])
+        self.assertEqual(self.client.get(url)["X-Page-Cache"], "HIT")
+        # Два запроса прогрева не тронули ведро адреса (burst 1)
+        request = RequestFactory().get("/", REMOTE_ADDR="127.0.0.1")
+        request.user = AnonymousUser()
+        self.assertIsNone(ratelimit.check_rate(request, "read"))
+        self.assertIsNotNone(ratelimit.check_rate(request, "read"))
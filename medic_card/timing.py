@@ -0,0 +1,183 @@
+"""Замеры времени обработки запроса: БД, шаблоны, представление, кэш.
+
+TimingMiddleware собирает замеры в RequestTimings (через contextvar,
+поэтому их видят шаблонный бэкенд и кэш без доступа к request),
+отдает их в заголовке Server-Timing и с вероятностью
+SERVER_TIMING_LOG_SAMPLE_RATE пишет строкой JSON в лог
+medic_card.timing. Заголовок получает персонал, а при
+SERVER_TIMING_HEADER = True - все: замеры раскрывают устройство сайта.
+
+Время представления замеряет ViewTimingMiddleware, последний в
+MIDDLEWARE: внутри него выполняется только само представление (и
+отрисовка TemplateResponse), без обработки ответа другими middleware.
+"""
+
+import json
+import logging
+import random
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates, Template
+
+from .db.routers import execute_wrapper_all
+
+logger = logging.getLogger("medic_card.timing")
+
+_current = ContextVar("request_timings", default=None)
+
+
+@dataclass
+class RequestTimings:
+    """Замеры одного запроса, время в секундах"""
+
+    db_time: float = 0.0
+    db_queries: int = 0
+    template_time: float = 0.0
+    cache_hits: int = 0
+    cache_misses: int = 0
+    view_started: float = None
+    view_time: float = 0.0
+    total_time: float = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: время и количество SQL-запросов
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.db_queries += 1
+
+    def server_timing(self):
+        """Значение заголовка Server-Timing (длительности в мс)"""
+        return ", ".join(
+            [
+                f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+                f'tpl;dur={self.template_time * 1000:.1f};desc="templates"',
+                f'view;dur={self.view_time * 1000:.1f};desc="view without templates"',
+                f'total;dur={self.total_time * 1000:.1f};desc="total"',
+                f'cache;desc="hits={self.cache_hits} misses={self.cache_misses}"',
+            ]
+        )
+
+    def as_log(self, request, response):
+        match = getattr(request, "resolver_match", None)
+        return {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(self.total_time * 1000, 2),
+            "view_ms": round(self.view_time * 1000, 2),
+            "db_ms": round(self.db_time * 1000, 2),
+            "db_queries": self.db_queries,
+            "template_ms": round(self.template_time * 1000, 2),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "user_id": getattr(getattr(request, "user", None), "pk", None),
+        }
+
+
+def current_timings():
+    """Замеры текущего запроса или None вне запроса"""
+    return _current.get()
+
+
+def record_cache_lookup(hits, misses=0):
+    timings = _current.get()
+    if timings is not None:
+        timings.cache_hits += hits
+        timings.cache_misses += misses
+
+
+class TimedTemplate(Template):
+    """Шаблон, время отрисовки которого попадает в замеры запроса"""
+
+    def render(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Стандартный бэкенд шаблонов Django с замером времени отрисовки.
+
+    Вложенные {% include %} отрисовываются внутри шаблона верхнего
+    уровня, поэтому время не суммируется дважды.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def show_server_timing(request):
+    if settings.SERVER_TIMING_HEADER:
+        return True
+    # request.user нет, если ответ вернул middleware до аутентификации
+    user = getattr(request, "user", None)
+    return user is not None and user.is_staff
+
+
+class TimingMiddleware:
+    """Добавляет Server-Timing и пишет выборочный лог замеров"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        request.timings = timings
+        token = _current.set(timings)
+        started = time.perf_counter()
+        try:
+            with execute_wrapper_all(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        timings.total_time = time.perf_counter() - started
+
+        if show_server_timing(request):
+            response["Server-Timing"] = timings.server_timing()
+        rate = settings.SERVER_TIMING_LOG_SAMPLE_RATE
+        if rate and random.random() < rate:
+            logger.info(
+                json.dumps(timings.as_log(request, response), ensure_ascii=False)
+            )
+        return response
+
+
+class ViewTimingMiddleware:
+    """Замеряет время представления; ставится последним в MIDDLEWARE"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        timings = _current.get()
+        if timings is not None and timings.view_started is not None:
+            # Время представления без отрисовки шаблонов
+            timings.view_time = max(
+                time.perf_counter() - timings.view_started - timings.template_time,
+                0.0,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Вызывается последним из process_view, прямо перед представлением
+        timings = _current.get()
+        if timings is not None:
+            timings.view_started = time.perf_counter()
+        return None
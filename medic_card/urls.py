@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 
 from . import views
 
@@ -38,6 +38,7 @@ urlpatterns = [
     path("toggle-favorite/", views.toggle_favorite, name="toggle_favorite"),
     # AJAX эндпоинты
     path("get-errors-count/", views.get_errors_count, name="get_errors_count"),
+    path("overlays/", views.user_overlays, name="user_overlays"),
     # Работа над ошибками
     path("errors-work/", views.errors_work, name="errors_work"),
     path(
@@ -45,4 +46,24 @@ urlpatterns = [
         views.errors_work_result,
         name="errors_work_result",
     ),
+    # Метрики (Prometheus)
+    path("metrics", views.metrics_view, name="metrics"),
+    # Профили медленных запросов
+    path("staff/profiles/", views.profiles_list, name="profiles"),
+    path(
+        "staff/profiles/<str:name>",
+        views.profile_download,
+        name="profile_download",
+    ),
+    # Выгрузки для персонала
+    re_path(
+        r"^export/questions\.(?P<fmt>csv|jsonl)$",
+        views.export_questions,
+        name="export_questions",
+    ),
+    re_path(
+        r"^export/(?P<kind>answers|progress)\.(?P<fmt>csv|jsonl)$",
+        views.export_results,
+        name="export_results",
+    ),
 ]
@@ -1,19 +1,31 @@
+import hmac
 import random
 
-from django.contrib import messages
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.contenttypes.models import ContentType
-from django.http import JsonResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
-from django.views.decorators.cache import cache_page
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_http_methods
-from django_ratelimit.decorators import ratelimit
 
 from medic_auth.models import UserProfile
 
+from . import conditional, metrics, profiling
+from .answerwriter import AnswerWrite, AnswerWriteTimeout, record_answer
+from .exporters import select_users, stream_questions, stream_results
 from .models import (
     Answer,
+    ErrorsWorkAttempt,
     Favorites,
     Question,
     Theme,
@@ -21,6 +33,8 @@ from .models import (
     TicketProgress,
     UserAnswer,
 )
+from .pagecache import anonymous_page_cache, fragment_cache_context
+from .ratelimit import rate_limit
 
 # medic_card/views.py
 from django.db.models import Q
@@ -28,6 +42,12 @@ from django.shortcuts import render
 from django.http import JsonResponse
 from .models import Theme, Ticket, Question, Answer
 
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "jsonl": "application/x-ndjson; charset=utf-8",
+}
+
+
 def update_user_profile(user, progress):
     """Обновляет профиль пользователя после завершения билета"""
     try:
@@ -43,6 +63,17 @@ def update_user_profile(user, progress):
     profile.save()
 
 
+def record_ticket_completed(ticket):
+    """Учитывает завершение билета в метриках"""
+    if not ticket.is_temporary:
+        kind = "ticket"
+    elif ticket.original_ticket_id:
+        kind = "retake"
+    else:
+        kind = "errors_work"
+    metrics.TICKETS_COMPLETED.inc(kind=kind)
+
+
 def update_original_ticket_from_temp(user, temp_ticket, temp_progress):
     """Обновляет оригинальный билет результатами из временного билета"""
     original_ticket = temp_ticket.original_ticket
@@ -55,37 +86,8 @@ def update_original_ticket_from_temp(user, temp_ticket, temp_progress):
     except TicketProgress.DoesNotExist:
         return
 
-    # Обновляем ответы в оригинальном билете
-    temp_questions = temp_ticket.questions.filter(is_active=True)
-    for temp_question in temp_questions:
-        # Находим соответствующий вопрос в оригинальном билете
-        original_question = original_ticket.questions.filter(
-            text=temp_question.text
-        ).first()
-
-        if original_question:
-            # Получаем ответы пользователя на временный вопрос
-            temp_user_answer = UserAnswer.objects.filter(
-                user=user, question=temp_question
-            ).first()
-
-            if temp_user_answer:
-                # Обновляем или создаем ответ в оригинальном билете
-                original_user_answer, created = UserAnswer.objects.get_or_create(
-                    user=user,
-                    question=original_question,
-                    defaults={"is_correct": temp_user_answer.is_correct},
-                )
-
-                if not created:
-                    original_user_answer.is_correct = temp_user_answer.is_correct
-                    original_user_answer.answered_at = temp_user_answer.answered_at
-                    original_user_answer.save()
-
-                # Обновляем выбранные ответы
-                original_user_answer.selected_answers.set(
-                    temp_user_answer.selected_answers.all()
-                )
+    # Временный билет ссылается на те же вопросы, поэтому ответы пользователя
+    # уже записаны на вопросы оригинального билета
 
     # Пересчитываем статистику оригинального билета
     original_questions = original_ticket.questions.filter(is_active=True)
@@ -98,34 +100,43 @@ def update_original_ticket_from_temp(user, temp_ticket, temp_progress):
     original_progress.total_questions = original_questions.count()
     original_progress.save()
 
-@ratelimit(key="ip", rate="100/h")
+@anonymous_page_cache
+@rate_limit("read")
 def home(request):
     """Главная страница со списком тем"""
-    themes = Theme.objects.filter(is_active=True).order_by("order", "created_at")
-    context = {"themes": themes}
+    # Сетка тем одинакова для всех и кэшируется во фрагменте шаблона;
+    # избранное и прогресс дорисовывает user_overlays
+    themes = Theme.with_counts(Theme.objects.filter(is_active=True)).order_by(
+        "order", "created_at"
+    )
+    context = {"themes": themes, **fragment_cache_context()}
     return render(request, "medic_card/home.html", context)
 
-@ratelimit(key="ip", rate="100/h")
+@anonymous_page_cache
+@conditional.content_condition(conditional.theme_last_modified)
+@rate_limit("read")
 def theme_detail(request, theme_id):
     """Страница темы со списком билетов"""
     theme = get_object_or_404(Theme, id=theme_id, is_active=True)
     # Исправлено: используем related_name "tickets" из ManyToManyField
-    tickets = theme.tickets.filter(is_active=True, is_temporary=False).order_by(
-        "order", "created_at"
-    )
-    context = {"theme": theme, "tickets": tickets}
+    tickets = Ticket.with_counts(
+        theme.tickets.filter(is_active=True, is_temporary=False)
+    ).order_by("order", "created_at")
+    context = {"theme": theme, "tickets": tickets, **fragment_cache_context()}
     return render(request, "medic_card/theme_detail.html", context)
 
-@ratelimit(key="ip", rate="100/h")
+@anonymous_page_cache
+@conditional.content_condition(conditional.ticket_last_modified)
+@rate_limit("read")
 def ticket_detail(request, ticket_id):
     """Страница билета со списком вопросов"""
     ticket = get_object_or_404(Ticket, id=ticket_id, is_active=True)
-    questions = ticket.questions.filter(is_active=True).order_by("order", "created_at")
+    questions = Question.with_counts(ticket.get_questions())
     context = {"ticket": ticket, "questions": questions}
     return render(request, "medic_card/ticket_detail.html", context)
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("answer")
 @login_required
 def start_ticket(request, ticket_id):
     """Начать прохождение билета"""
@@ -145,9 +156,12 @@ def start_ticket(request, ticket_id):
         # Если билет уже завершен, предлагаем перерешать
         return redirect("medic_card:ticket_result", ticket_id=ticket_id)
 
-    # Если это новый прогресс или билет не завершен, обновляем время начала
-    if created or not progress.is_completed:
+    # Попытка начинается заново, пока пользователь не перешел дальше первого
+    # вопроса. Ответы, данные до начала попытки (например, на этот же вопрос
+    # в другом билете), в ней не учитываются
+    if created or progress.current_question_index == 0:
         progress.started_at = timezone.now()
+        progress.correct_answers = 0
         progress.save()
 
     return redirect(
@@ -157,7 +171,7 @@ def start_ticket(request, ticket_id):
     )
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("read")
 @login_required
 def take_question(request, ticket_id, question_index):
     """Страница вопроса для прохождения билета"""
@@ -182,6 +196,7 @@ def take_question(request, ticket_id, question_index):
         progress.completed_at = timezone.now()
         progress.calculate_time_spent()
         progress.save()
+        record_ticket_completed(ticket)
 
         # Если это временный билет, обновляем оригинальный билет и удаляем временный
         if ticket.is_temporary and ticket.original_ticket:
@@ -197,11 +212,8 @@ def take_question(request, ticket_id, question_index):
 
         # Если это работа над ошибками (временный билет без original_ticket)
         if ticket.is_temporary and not ticket.original_ticket:
-            # Очищаем сессию (результаты уже обновлены в submit_answer)
-            if "errors_work_question_mapping" in request.session:
-                del request.session["errors_work_question_mapping"]
-            if "initial_errors_count" in request.session:
-                del request.session["initial_errors_count"]
+            # Попытка (ErrorsWorkAttempt) остается: по ней считаются
+            # исправленные ошибки на странице результатов
             # Удаляем временный билет
             ticket.delete()
             # Перенаправляем на результаты работы над ошибками
@@ -217,9 +229,9 @@ def take_question(request, ticket_id, question_index):
     answers = list(question.answers.filter(is_active=True).order_by("order", "id"))
     random.shuffle(answers)
 
-    # Проверяем, есть ли уже ответ на этот вопрос
+    # Проверяем, есть ли уже ответ на этот вопрос в текущей попытке
     user_answer = UserAnswer.objects.filter(
-        user=request.user, question=question
+        user=request.user, question=question, answered_at__gte=progress.started_at
     ).first()
 
     context = {
@@ -235,7 +247,7 @@ def take_question(request, ticket_id, question_index):
     return render(request, "medic_card/take_question.html", context)
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("answer")
 @login_required
 def submit_answer(request, ticket_id, question_index):
     """Обработка ответа пользователя"""
@@ -269,88 +281,37 @@ def submit_answer(request, ticket_id, question_index):
         )
 
     # Получаем выбранные ответы
-    selected_answers = Answer.objects.filter(
-        id__in=selected_answer_ids, question=question, is_active=True
+    selected_ids = list(
+        Answer.objects.filter(
+            id__in=selected_answer_ids, question=question, is_active=True
+        ).values_list("id", flat=True)
     )
 
     # Проверяем правильность ответа
     correct_answers = question.answers.filter(is_correct=True, is_active=True)
-    is_correct = set(selected_answers.values_list("id", flat=True)) == set(
-        correct_answers.values_list("id", flat=True)
-    )
-
-    # Сохраняем или обновляем ответ пользователя
-    user_answer, created = UserAnswer.objects.get_or_create(
-        user=request.user, question=question, defaults={"is_correct": is_correct}
-    )
-
-    # Запоминаем старое состояние для обновления прогресса
-    old_correct = user_answer.is_correct
-
-    # Обновляем ответ
-    user_answer.is_correct = is_correct
-    user_answer.answered_at = timezone.now()
-    user_answer.save()
-
-    # Обновляем выбранные ответы
-    user_answer.selected_answers.set(selected_answers)
-
-    # Если это работа над ошибками (временный билет без original_ticket),
-    # сразу обновляем оригинальный билет
-    if ticket.is_temporary and not ticket.original_ticket:
-        if is_correct:
-            # Если вопрос решен правильно, удаляем все неправильные ответы с таким же текстом вопроса
-            UserAnswer.objects.filter(
-                user=request.user, question__text=question.text, is_correct=False
-            ).delete()
-        else:
-            # Если вопрос решен неправильно, находим оригинальный вопрос по тексту
-            try:
-                original_question = (
-                    Question.objects.filter(text=question.text, is_active=True)
-                    .exclude(ticket__is_temporary=True)
-                    .first()
-                )
-
-                if original_question:
-                    # Обновляем или создаем ответ в оригинальном билете
-                    original_user_answer, created = UserAnswer.objects.get_or_create(
-                        user=request.user,
-                        question=original_question,
-                        defaults={"is_correct": is_correct},
-                    )
-
-                    if not created:
-                        original_user_answer.is_correct = is_correct
-                        original_user_answer.answered_at = timezone.now()
-                        original_user_answer.save()
+    is_correct = set(selected_ids) == set(correct_answers.values_list("id", flat=True))
 
-                    # Обновляем выбранные ответы
-                    original_user_answer.selected_answers.set(selected_answers)
+    metrics.ANSWERS_GRADED.inc(result="correct" if is_correct else "wrong")
 
-            except Exception:
-                pass
-
-    # Обновляем прогресс
-    if created:
-        # Новый ответ
-        if is_correct:
-            progress.correct_answers += 1
-    else:
-        # Существующий ответ - пересчитываем статистику
-        if is_correct and not old_correct:
-            progress.correct_answers += 1
-        elif not is_correct and old_correct:
-            progress.correct_answers = max(0, progress.correct_answers - 1)
-
-    progress.save()
+    # Сохраняем ответ и обновляем прогресс (сразу или через поток-писатель)
+    write = AnswerWrite(
+        user_id=request.user.pk,
+        question_id=question.pk,
+        progress_id=progress.pk,
+        answer_ids=selected_ids,
+        is_correct=is_correct,
+    )
+    try:
+        record_answer(write)
+    except AnswerWriteTimeout:
+        messages.error(request, "Не удалось сохранить ответ, отправьте его еще раз")
 
     return redirect(
         "medic_card:take_question", ticket_id=ticket_id, question_index=question_index
     )
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("answer")
 @login_required
 def next_question(request, ticket_id, question_index):
     """Переход к следующему вопросу"""
@@ -369,7 +330,7 @@ def next_question(request, ticket_id, question_index):
     )
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("read")
 @login_required
 def ticket_result(request, ticket_id):
     """Результаты прохождения билета"""
@@ -377,8 +338,8 @@ def ticket_result(request, ticket_id):
         ticket = Ticket.objects.get(id=ticket_id, is_active=True)
     except Ticket.DoesNotExist:
         # Если билет не найден, возможно это был временный билет для работы над ошибками
-        # Проверяем, есть ли маппинг в сессии
-        if "errors_work_question_mapping" in request.session:
+        # Проверяем, не был ли это билет последней работы над ошибками
+        if ErrorsWorkAttempt.is_attempt_ticket(request.user, ticket_id):
             # Перенаправляем на результаты работы над ошибками
             return redirect("medic_card:errors_work_result")
         else:
@@ -395,6 +356,7 @@ def ticket_result(request, ticket_id):
         progress.completed_at = timezone.now()
         progress.calculate_time_spent()
         progress.save()
+        record_ticket_completed(ticket)
 
         # Если это временный билет, обновляем оригинальный билет и удаляем временный
         if ticket.is_temporary and ticket.original_ticket:
@@ -410,11 +372,8 @@ def ticket_result(request, ticket_id):
 
         # Если это работа над ошибками (временный билет без original_ticket)
         if ticket.is_temporary and not ticket.original_ticket:
-            # Очищаем сессию (результаты уже обновлены в submit_answer)
-            if "errors_work_question_mapping" in request.session:
-                del request.session["errors_work_question_mapping"]
-            if "initial_errors_count" in request.session:
-                del request.session["initial_errors_count"]
+            # Попытка (ErrorsWorkAttempt) остается: по ней считаются
+            # исправленные ошибки на странице результатов
             # Удаляем временный билет
             ticket.delete()
             # Перенаправляем на результаты работы над ошибками
@@ -424,10 +383,12 @@ def ticket_result(request, ticket_id):
         update_user_profile(request.user, progress)
 
     # Получаем все ответы пользователя по билету
-    questions = ticket.questions.filter(is_active=True).order_by("order", "created_at")
-    user_answers = UserAnswer.objects.filter(
-        user=request.user, question__in=questions
-    ).select_related("question")
+    questions = ticket.get_questions()
+    user_answers = (
+        UserAnswer.objects.filter(user=request.user, question__in=questions)
+        .select_related("question")
+        .prefetch_related("selected_answers")
+    )
 
     wrong_answers = user_answers.filter(is_correct=False)
 
@@ -450,7 +411,7 @@ def ticket_result(request, ticket_id):
     return render(request, "medic_card/ticket_result.html", context)
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("answer")
 @login_required
 def retake_ticket(request, ticket_id, mode="all"):
     """Перерешать билет (весь или только ошибки)"""
@@ -460,7 +421,7 @@ def retake_ticket(request, ticket_id, mode="all"):
     if mode == "errors":
         # Перерешать только ошибки - создаем временный билет
         wrong_answers = UserAnswer.objects.filter(
-            user=request.user, question__ticket=ticket, is_correct=False
+            user=request.user, question__tickets=ticket, is_correct=False
         )
 
         if wrong_answers.exists():
@@ -485,8 +446,9 @@ def retake_ticket(request, ticket_id, mode="all"):
             messages.info(request, "Нет ошибок для перерешивания")
             return redirect("medic_card:ticket_result", ticket_id=ticket_id)
     else:
-        # Перерешать весь билет
-        UserAnswer.objects.filter(user=request.user, question__ticket=ticket).delete()
+        # Перерешать весь билет. Ответы не удаляются: вопрос может входить
+        # и в другие билеты пользователя, а в новой попытке учитываются
+        # только ответы после started_at
 
         # Сбрасываем весь прогресс
         progress.current_question_index = 0
@@ -519,19 +481,21 @@ def retake_ticket(request, ticket_id, mode="all"):
     return redirect("medic_card:start_ticket", ticket_id=ticket_id)
 
 
-@ratelimit(key="ip", rate="100/h")
+@anonymous_page_cache
+@conditional.content_condition(conditional.question_last_modified)
+@rate_limit("read")
 def question_detail(request, question_id):
     """Страница вопроса с вариантами ответов"""
     question = get_object_or_404(Question, id=question_id, is_active=True)
     answers = question.answers.filter(is_active=True).order_by("order", "id")
-    # Получаем билет и темы вопроса
-    ticket = question.ticket
-    themes = ticket.themes.all()
+    # Получаем основной билет и темы вопроса
+    ticket = question.get_primary_ticket()
+    themes = ticket.themes.all() if ticket else []
     context = {"question": question, "answers": answers, "ticket": ticket, "themes": themes}
     return render(request, "medic_card/question_detail.html", context)
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("answer")
 @login_required
 @require_http_methods(["POST"])
 def toggle_favorite(request):
@@ -557,7 +521,52 @@ def toggle_favorite(request):
         return JsonResponse({"success": False, "message": str(e)})
 
 
-@ratelimit(key="ip", rate="100/h")
+def _parse_ids(value, limit=100):
+    """Список id из строки "1,2,3" (не больше limit, мусор пропускается)"""
+    return [int(part) for part in value.split(",")[:limit] if part.strip().isdigit()]
+
+
+def _overlay(obj, user):
+    return {
+        "is_favorite": Favorites.is_favorite(user, obj),
+        "color": obj.get_progress_color(user),
+        "stats": obj.get_user_progress_stats(user),
+    }
+
+
+@rate_limit("read")
+@login_required
+@never_cache
+@require_http_methods(["GET"])
+def user_overlays(request):
+    """AJAX: избранное и прогресс пользователя для карточек страницы.
+
+    Карточки тем и билетов отрисовываются одинаково для всех, а данные
+    пользователя для всех карточек страницы приходят одним запросом:
+    ?themes=1,2&tickets=3,4.
+    """
+    user = request.user
+    themes = Theme.preload_user_state(
+        [Theme(id=theme_id) for theme_id in _parse_ids(request.GET.get("themes", ""))],
+        user,
+    )
+    ticket_ids = _parse_ids(request.GET.get("tickets", ""))
+    tickets = []
+    if ticket_ids:
+        # Количество вопросов нужно для прогресса по еще не начатым билетам
+        tickets = Ticket.preload_user_state(
+            Ticket.with_counts(Ticket.objects.filter(id__in=ticket_ids)).only("id"),
+            user,
+        )
+    return JsonResponse(
+        {
+            "themes": {theme.id: _overlay(theme, user) for theme in themes},
+            "tickets": {ticket.id: _overlay(ticket, user) for ticket in tickets},
+        }
+    )
+
+
+@rate_limit("read")
 @login_required
 @require_http_methods(["GET"])
 def get_errors_count(request):
@@ -568,8 +577,8 @@ def get_errors_count(request):
             user=request.user, is_correct=False
         ).count()
 
-        # Получаем изначальное количество ошибок из сессии
-        initial_errors_count = request.session.get("initial_errors_count", 0)
+        # Изначальное количество ошибок из текущей попытки
+        initial_errors_count = ErrorsWorkAttempt.initial_count(request.user)
 
         # Вычисляем количество исправленных ошибок
         corrected_errors = max(0, initial_errors_count - current_errors_count)
@@ -591,23 +600,33 @@ def get_errors_count(request):
         return JsonResponse({"success": False, "message": str(e)})
 
 
-@ratelimit(key="ip", rate="100/h")
+@rate_limit("read")
 @login_required
 def favorites_list(request):
     """Страница избранного"""
-    favorites = Favorites.objects.filter(user=request.user).prefetch_related(
-        "content_object"
+    favorites = list(Favorites.objects.filter(user=request.user))
+
+    # Разделяем на темы и билеты; объекты загружаем сразу со счетчиками
+    # и прогрессом пользователя, чтобы не делать запросов на каждую карточку
+    theme_type = ContentType.objects.get_for_model(Theme)
+    ticket_type = ContentType.objects.get_for_model(Ticket)
+    theme_ids = [f.object_id for f in favorites if f.content_type_id == theme_type.id]
+    ticket_ids = [
+        f.object_id for f in favorites if f.content_type_id == ticket_type.id
+    ]
+    themes = Theme.preload_user_state(
+        Theme.with_counts(Theme.objects.filter(id__in=theme_ids)), request.user
     )
-
-    # Разделяем на темы и билеты
-    themes = []
-    tickets = []
-
+    tickets = Ticket.preload_user_state(
+        Ticket.with_counts(Ticket.objects.filter(id__in=ticket_ids)), request.user
+    )
+    objects = {(theme_type.id, theme.id): theme for theme in themes}
+    objects.update({(ticket_type.id, ticket.id): ticket for ticket in tickets})
     for favorite in favorites:
-        if isinstance(favorite.content_object, Theme):
-            themes.append(favorite.content_object)
-        elif isinstance(favorite.content_object, Ticket):
-            tickets.append(favorite.content_object)
+        favorite.content_object = objects.get(
+            (favorite.content_type_id, favorite.object_id)
+        )
+    favorites = [favorite for favorite in favorites if favorite.content_object]
 
     # Объединяем и сортируем по времени добавления
     all_items = []
@@ -635,46 +654,46 @@ def errors_work(request):
     # Получаем все неправильные ответы пользователя
     wrong_answers = (
         UserAnswer.objects.filter(user=request.user, is_correct=False)
-        .select_related("question", "question__ticket")
-        .prefetch_related("selected_answers", "question__ticket__themes")
+        .select_related("question")
+        .prefetch_related("selected_answers", "question__tickets__themes")
         .order_by("-answered_at")
     )
 
-    request.session["initial_errors_count"] = len(wrong_answers)
-
     # Группируем ошибки по темам и билетам
     errors_by_theme = {}
-    total_errors = wrong_answers.count()
+    total_errors = len(wrong_answers)
 
-    for answer in wrong_answers:
-        # Исправлено: получаем все темы билета
-        themes = answer.question.ticket.themes.all()
-        ticket = answer.question.ticket
+    # Точка отсчета для исправленных ошибок; пишем, только если изменилась
+    if ErrorsWorkAttempt.initial_count(request.user) != total_errors:
+        ErrorsWorkAttempt.remember(request.user, initial_errors_count=total_errors)
 
-        for theme in themes:
-            if theme.id not in errors_by_theme:
-                errors_by_theme[theme.id] = {"theme": theme, "tickets": {}}
-
-            if ticket.id not in errors_by_theme[theme.id]["tickets"]:
-                errors_by_theme[theme.id]["tickets"][ticket.id] = {
-                    "ticket": ticket,
-                    "errors": [],
-                }
-
-            errors_by_theme[theme.id]["tickets"][ticket.id]["errors"].append(answer)
+    for answer in wrong_answers:
+        # Вопрос может входить в несколько билетов и тем
+        for ticket in answer.question.tickets.all():
+            if ticket.is_temporary:
+                continue
+
+            for theme in ticket.themes.all():
+                if theme.id not in errors_by_theme:
+                    errors_by_theme[theme.id] = {"theme": theme, "tickets": {}}
+
+                if ticket.id not in errors_by_theme[theme.id]["tickets"]:
+                    errors_by_theme[theme.id]["tickets"][ticket.id] = {
+                        "ticket": ticket,
+                        "errors": [],
+                    }
+
+                errors_by_theme[theme.id]["tickets"][ticket.id]["errors"].append(
+                    answer
+                )
 
     # Создаем временный билет со всеми ошибками
     if request.method == "POST" and wrong_answers.exists():
-        # Сохраняем изначальное количество ошибок в сессии
-        request.session["initial_errors_count"] = total_errors
-
         # Получаем все вопросы с ошибками
         wrong_question_ids = list(
             wrong_answers.values_list("question_id", flat=True).distinct()
         )
-        wrong_questions = Question.objects.filter(
-            id__in=wrong_question_ids
-        ).prefetch_related("answers")
+        wrong_questions = Question.objects.filter(id__in=wrong_question_ids)
 
         # Создаем временный билет для работы над ошибками
         temp_ticket = Ticket.objects.create(
@@ -691,34 +710,13 @@ def errors_work(request):
         if first_theme:
             temp_ticket.themes.add(first_theme)
 
-        # Сохраняем связь между новыми вопросами и оригинальными
-        question_mapping = {}
-
-        # Копируем все вопросы с ошибками
-        for question in wrong_questions:
-            new_question = Question.objects.create(
-                ticket=temp_ticket,
-                text=question.text,
-                image=question.image,
-                created_by=request.user,
-                is_active=True,
-            )
+        # Билет ссылается на те же вопросы, ответы попадут прямо в них
+        temp_ticket.add_questions(wrong_questions)
 
-            # Сохраняем связь между новым и оригинальным вопросом
-            question_mapping[new_question.id] = question.id
-
-            # Копируем ответы
-            for answer in question.answers.filter(is_active=True):
-                Answer.objects.create(
-                    question=new_question,
-                    text=answer.text,
-                    is_correct=answer.is_correct,
-                    is_active=True,
-                    order=answer.order,
-                )
-
-        # Сохраняем маппинг вопросов в сессии для последующего обновления
-        request.session["errors_work_question_mapping"] = question_mapping
+        # Запоминаем временный билет для перехода к результатам
+        ErrorsWorkAttempt.remember(
+            request.user, initial_errors_count=total_errors, ticket_id=temp_ticket.id
+        )
 
         # Перенаправляем на временный билет
         return redirect("medic_card:start_ticket", ticket_id=temp_ticket.id)
@@ -734,14 +732,14 @@ def errors_work(request):
 @login_required
 def errors_work_result(request):
     """Результаты работы над ошибками - показывает оставшиеся ошибки"""
-    # Получаем изначальное количество ошибок из сессии
-    initial_errors_count = request.session.get("initial_errors_count", 0)
+    # Изначальное количество ошибок из текущей попытки
+    initial_errors_count = ErrorsWorkAttempt.initial_count(request.user)
 
     # Получаем все текущие неправильные ответы пользователя
     current_wrong_answers = (
         UserAnswer.objects.filter(user=request.user, is_correct=False)
-        .select_related("question", "question__ticket")
-        .prefetch_related("selected_answers", "question__ticket__themes")
+        .select_related("question")
+        .prefetch_related("selected_answers", "question__tickets__themes")
         .order_by("-answered_at")
     )
 
@@ -754,21 +752,24 @@ def errors_work_result(request):
     errors_by_theme = {}
 
     for answer in current_wrong_answers:
-        # Исправлено: получаем все темы билета
-        themes = answer.question.ticket.themes.all()
-        ticket = answer.question.ticket
-
-        for theme in themes:
-            if theme.id not in errors_by_theme:
-                errors_by_theme[theme.id] = {"theme": theme, "tickets": {}}
-
-            if ticket.id not in errors_by_theme[theme.id]["tickets"]:
-                errors_by_theme[theme.id]["tickets"][ticket.id] = {
-                    "ticket": ticket,
-                    "errors": [],
-                }
-
-            errors_by_theme[theme.id]["tickets"][ticket.id]["errors"].append(answer)
+        # Вопрос может входить в несколько билетов и тем
+        for ticket in answer.question.tickets.all():
+            if ticket.is_temporary:
+                continue
+
+            for theme in ticket.themes.all():
+                if theme.id not in errors_by_theme:
+                    errors_by_theme[theme.id] = {"theme": theme, "tickets": {}}
+
+                if ticket.id not in errors_by_theme[theme.id]["tickets"]:
+                    errors_by_theme[theme.id]["tickets"][ticket.id] = {
+                        "ticket": ticket,
+                        "errors": [],
+                    }
+
+                errors_by_theme[theme.id]["tickets"][ticket.id]["errors"].append(
+                    answer
+                )
 
     # Обработка POST-запроса для создания нового билета
     if request.method == "POST" and current_errors_count > 0:
@@ -776,14 +777,9 @@ def errors_work_result(request):
         wrong_question_ids = current_wrong_answers.values_list(
             "question_id", flat=True
         ).distinct()
-        wrong_questions = Question.objects.filter(
-            id__in=wrong_question_ids
-        ).prefetch_related("answers")
+        wrong_questions = Question.objects.filter(id__in=wrong_question_ids)
 
         if wrong_questions.exists():
-            # Обновляем изначальное количество ошибок в сессии
-            request.session["initial_errors_count"] = current_errors_count
-
             temp_ticket = Ticket.objects.create(
                 title="Работа над ошибками",
                 description="Временный билет для перерешивания оставшихся ошибок",
@@ -798,34 +794,15 @@ def errors_work_result(request):
             if first_theme:
                 temp_ticket.themes.add(first_theme)
 
-            # Сохраняем связь между новыми вопросами и оригинальными
-            question_mapping = {}
-
-            # Копируем вопросы с оставшимися ошибками
-            for question in wrong_questions:
-                new_question = Question.objects.create(
-                    ticket=temp_ticket,
-                    text=question.text,
-                    image=question.image,
-                    created_by=request.user,
-                    is_active=True,
-                )
-
-                # Сохраняем связь между новым и оригинальным вопросом
-                question_mapping[new_question.id] = question.id
-
-                # Копируем ответы
-                for answer in question.answers.filter(is_active=True):
-                    Answer.objects.create(
-                        question=new_question,
-                        text=answer.text,
-                        is_correct=answer.is_correct,
-                        is_active=True,
-                        order=answer.order,
-                    )
+            # Билет ссылается на те же вопросы, ответы попадут прямо в них
+            temp_ticket.add_questions(wrong_questions)
 
-            # Сохраняем маппинг вопросов в сессии для последующего обновления
-            request.session["errors_work_question_mapping"] = question_mapping
+            # Новая попытка: оставшиеся ошибки и временный билет
+            ErrorsWorkAttempt.remember(
+                request.user,
+                initial_errors_count=current_errors_count,
+                ticket_id=temp_ticket.id,
+            )
 
             # Перенаправляем на новый временный билет
             return redirect("medic_card:start_ticket", ticket_id=temp_ticket.id)
@@ -931,20 +908,20 @@ def search(request):
         ).order_by('-relevance', 'title_length')
 
     # Основной поиск
-    themes_base = Theme.objects.filter(
+    themes_base = Theme.with_counts().filter(
         create_search_q(['title', 'description'], query_lower),
         is_active=True
     ).select_related('created_by').distinct()
 
-    tickets_base = Ticket.objects.filter(
+    tickets_base = Ticket.with_counts().filter(
         create_search_q(['title', 'description'], query_lower),
         is_active=True
     ).prefetch_related('themes').select_related('created_by').distinct()
 
-    questions_base = Question.objects.filter(
+    questions_base = Question.with_counts().filter(
         create_search_q(['text'], query_lower),
         is_active=True
-    ).select_related('ticket', 'created_by').prefetch_related('ticket__themes').distinct()
+    ).select_related('created_by').prefetch_related('tickets__themes').distinct()
 
     # Аннотация релевантности
     results['themes'] = annotate_relevance(themes_base, ['title', 'description'], query_lower)
@@ -985,7 +962,7 @@ def search(request):
         # Добавляем похожие результаты для каждой категории
         if len(results['themes']) < 5:
             similar_themes = find_similar(
-                Theme.objects.filter(is_active=True),
+                Theme.with_counts().filter(is_active=True),
                 ['title', 'description'],
                 results['themes']
             )
@@ -993,7 +970,7 @@ def search(request):
 
         if len(results['tickets']) < 5:
             similar_tickets = find_similar(
-                Ticket.objects.filter(is_active=True),
+                Ticket.with_counts().filter(is_active=True),
                 ['title', 'description'],
                 results['tickets']
             )
@@ -1001,7 +978,7 @@ def search(request):
 
         if len(results['questions']) < 5:
             similar_questions = find_similar(
-                Question.objects.filter(is_active=True),
+                Question.with_counts().filter(is_active=True),
                 ['text'],
                 results['questions']
             )
@@ -1015,6 +992,8 @@ def search(request):
         elif len(results[key]) > MAX_RESULTS_PER_CATEGORY:
             results[key] = results[key][:MAX_RESULTS_PER_CATEGORY]
 
+    # Избранное и прогресс для карточек дорисовывает user_overlays
+
     context = {
         'query': query,
         'results': results,
@@ -1023,3 +1002,79 @@ def search(request):
     }
 
     return render(request, 'medic_card/search_results.html', context)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_questions(request, fmt):
+    """Потоковая выгрузка вопросов и ответов (по теме или билету)"""
+    try:
+        theme_id, ticket_id = (
+            int(request.GET[name]) if request.GET.get(name) else None
+            for name in ("theme", "ticket")
+        )
+    except ValueError:
+        return HttpResponse(
+            "theme и ticket должны быть числами",
+            status=400,
+            content_type="text/plain; charset=utf-8",
+        )
+    response = StreamingHttpResponse(
+        stream_questions(fmt, theme_id=theme_id, ticket_id=ticket_id),
+        content_type=EXPORT_CONTENT_TYPES[fmt],
+    )
+    response["Content-Disposition"] = f'attachment; filename="questions.{fmt}"'
+    return response
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def export_results(request, kind, fmt):
+    """Потоковая выгрузка ответов или прогресса пользователей (или когорты)"""
+    users = select_users(
+        usernames=request.GET.getlist("user"), group=request.GET.get("group")
+    )
+    response = StreamingHttpResponse(
+        stream_results(fmt, kind, users), content_type=EXPORT_CONTENT_TYPES[fmt]
+    )
+    response["Content-Disposition"] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+def metrics_view(request):
+    """Метрики в формате Prometheus: для персонала или по METRICS_TOKEN"""
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get("Authorization", "")
+    by_token = bool(token) and hmac.compare_digest(
+        authorization.encode(), f"Bearer {token}".encode()
+    )
+    if not by_token and not request.user.is_staff:
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(
+        metrics.REGISTRY.exposition(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def profiles_list(request):
+    """Сохраненные профили медленных запросов"""
+    context = {
+        **admin.site.each_context(request),
+        "title": "Профили медленных запросов",
+        "profiles": profiling.list_profiles(),
+        "threshold": settings.PROFILER_THRESHOLD,
+        "max_files": settings.PROFILER_MAX_FILES,
+    }
+    return render(request, "admin/profiles.html", context)
+
+
+@staff_member_required
+@require_http_methods(["GET"])
+def profile_download(request, name):
+    """Скачивание файла профиля"""
+    path = profiling.get_profile_path(name)
+    if path is None:
+        raise Http404("Профиль не найден")
+    return FileResponse(path.open("rb"), as_attachment=True, filename=name)
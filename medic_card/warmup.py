@@ -0,0 +1,212 @@
+"""Прогрев процесса и общих кэшей перед приемом запросов.
+
+Первые запросы после запуска платят за ленивую инициализацию: разбор
+URLconf, компиляцию шаблонов, первое соединение с базой и пустой кэш
+страниц. Шаги прогрева делают это заранее.
+
+PROCESS_STEPS не обращаются к базе и не запускают потоков, поэтому
+выполняются один раз в главном процессе gunicorn до fork (preload_app):
+воркеры получают готовые резолвер и шаблоны. WORKER_STEPS открывают
+соединения и проходят весь стек middleware, поэтому выполняются в
+каждом воркере после fork (post_worker_init), но до первого запроса.
+
+CACHE_STEPS заполняют общие для всех процессов кэши: файлы sitemap и
+кэш страниц (вместе с фрагментами {% cache %}). Их выполняет
+warm_caches() в параллельных потоках: команда warm_caches и
+warm_after_migrate после migrate (подключен в apps.py, включается
+настройкой WARM_CACHES_AFTER_MIGRATE).
+
+Страницы запрашиваются через обработчик Django (весь стек middleware),
+без сети и без тестового клиента. Каждый поток прогрева снимает
+ограничение частоты только для себя (ratelimit.bypass): запросы
+посетителей в это время ограничиваются как обычно.
+"""
+
+import io
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.handlers.base import BaseHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+from django.urls import get_resolver, reverse
+
+from . import ratelimit
+from .models import Theme, Ticket
+
+logger = logging.getLogger("medic_card.warmup")
+
+
+def warm_urls():
+    """Заполняет резолвер: reverse и resolve больше не разбирают URLconf"""
+    resolver = get_resolver()
+    return len(resolver.reverse_dict)
+
+
+def warm_templates():
+    """Компилирует все шаблоны в кэширующий загрузчик каждого движка"""
+    compiled = 0
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if not filename.endswith(".html"):
+                        continue
+                    name = os.path.relpath(os.path.join(root, filename), directory)
+                    try:
+                        engine.get_template(name.replace(os.sep, "/"))
+                    except (TemplateDoesNotExist, TemplateSyntaxError):
+                        # Например, шаблоны стороннего пакета без его тегов
+                        continue
+                    compiled += 1
+    return compiled
+
+
+def warm_content_types():
+    """Кэш ContentType процесса (админка, права) одним запросом"""
+    return len(ContentType.objects.get_for_models(*apps.get_models()))
+
+
+def page_request(path):
+    """Анонимный GET path, как его передал бы gunicorn"""
+    host = settings.ALLOWED_HOSTS[0].lstrip(".")
+    return WSGIRequest(
+        {
+            "REQUEST_METHOD": "GET",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": path,
+            "QUERY_STRING": "",
+            "SERVER_NAME": host,
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "HTTP_HOST": host,
+            "REMOTE_ADDR": "127.0.0.1",
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(),
+            "wsgi.errors": sys.stderr,
+        }
+    )
+
+
+def _fetch_pages(paths):
+    handler = BaseHandler()
+    handler.load_middleware()
+    try:
+        with ratelimit.bypass():
+            for path in paths:
+                handler.get_response(page_request(path)).close()
+    finally:
+        connections.close_all()
+
+
+def fetch_pages(paths, workers=1):
+    """Запрашивает страницы анонимом: ответы попадают в кэш страниц"""
+    if workers <= 1:
+        _fetch_pages(paths)
+    else:
+        chunks = [paths[offset::workers] for offset in range(workers)]
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(_fetch_pages, chunks))
+    return len(paths)
+
+
+def warm_home(workers=1):
+    return fetch_pages([reverse("medic_card:home")], workers)
+
+
+def warm_themes(workers=1):
+    ids = Theme.objects.filter(is_active=True).values_list("id", flat=True)
+    paths = [reverse("medic_card:theme_detail", args=[pk]) for pk in ids]
+    return fetch_pages(paths, workers)
+
+
+def warm_tickets(workers=1):
+    ids = Ticket.objects.filter(is_active=True, is_temporary=False).values_list(
+        "id", flat=True
+    )
+    paths = [reverse("medic_card:ticket_detail", args=[pk]) for pk in ids]
+    return fetch_pages(paths, workers)
+
+
+def warm_sitemaps(workers=1):
+    # Не при импорте: модуль sitemap подписывается на content_changed
+    from medic_card_project.sitemap import build_sitemaps
+
+    return build_sitemaps()
+
+
+PROCESS_STEPS = (("urls", warm_urls), ("templates", warm_templates))
+WORKER_STEPS = (
+    ("contenttypes", warm_content_types),
+    ("home", warm_home),
+    ("themes", warm_themes),
+)
+# Страницы вопросов не прогреваются: их десятки тысяч, а промах по
+# каждой стоит одну отрисовку
+CACHE_STEPS = (
+    ("sitemaps", warm_sitemaps),
+    ("home", warm_home),
+    ("themes", warm_themes),
+    ("tickets", warm_tickets),
+)
+
+
+def _run_step(name, step):
+    started = time.perf_counter()
+    try:
+        result = step()
+    except Exception as error:
+        logger.exception("Прогрев %s не удался", name)
+        result = error
+    finally:
+        # Соединения прогрева не должны пережить fork или занять слот воркера
+        connections.close_all()
+    elapsed = time.perf_counter() - started
+    if not isinstance(result, Exception):
+        logger.info("Прогрев %s: %s за %.0f мс", name, result, elapsed * 1000)
+    return name, elapsed, result
+
+
+def run(steps, workers=1):
+    """Выполняет шаги, при workers > 1 - в параллельных потоках.
+
+    Ошибка шага пишется в лог, а не роняет запуск. Возвращает список
+    (имя, секунды, результат или исключение) в порядке steps.
+    """
+    if workers <= 1:
+        return [_run_step(name, step) for name, step in steps]
+    with ThreadPoolExecutor(workers) as executor:
+        futures = [executor.submit(_run_step, name, step) for name, step in steps]
+        return [future.result() for future in futures]
+
+
+def warm_caches(names=None, workers=None):
+    """Прогревает общие кэши CACHE_STEPS (все или только names)"""
+    workers = workers or settings.WARM_CACHES_WORKERS
+    steps = [
+        (name, lambda step=step: step(workers))
+        for name, step in CACHE_STEPS
+        if names is None or name in names
+    ]
+    return run(steps, workers)
+
+
+def warm_after_migrate(sender, using, plan=None, **kwargs):
+    """post_migrate: прогрев после каждого migrate при деплое (в образе Docker)"""
+    if (
+        not settings.WARM_CACHES_AFTER_MIGRATE
+        # flush (например, между тестами) шлет post_migrate без plan
+        or plan is None
+        or using != DEFAULT_DB_ALIAS
+        # Тестовая база в памяти: греть нечего, а sitemap общий
+        or connections[using].is_in_memory_db()
+    ):
+        return
+    warm_caches()
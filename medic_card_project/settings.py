@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -64,19 +65,26 @@ SITE_ID = 1
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",  # ← добавлено
+    "medic_card.metrics.MetricsMiddleware",
+    "medic_card.timing.TimingMiddleware",
+    "medic_card.querybudget.QueryBudgetMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "medic_card.profiling.ProfilerMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    # Последним: замеряет только само представление
+    "medic_card.timing.ViewTimingMiddleware",
 ]
 
 ROOT_URLCONF = "medic_card_project.urls"
 
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # DjangoTemplates с замером времени отрисовки для Server-Timing
+        "BACKEND": "medic_card.timing.TimedDjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -99,12 +107,100 @@ UNFOLD = {
 
 WSGI_APPLICATION = "medic_card_project.wsgi.application"
 
+# SQLite с WAL, busy_timeout и BEGIN IMMEDIATE (см. medic_card/db/sqlite3/base.py).
+# Соединение живет CONN_MAX_AGE секунд и проверяется перед каждым запросом.
+# Чтения идут через соединение readonly к тому же файлу (medic_card/db/routers.py)
+DATABASE_FILE = BASE_DIR / "db.sqlite3"
+DATABASE_OPTIONS = {
+    "pragmas": {
+        "busy_timeout": int(os.environ.get("DB_BUSY_TIMEOUT", 5000)),
+    },
+}
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "ENGINE": "medic_card.db.sqlite3",
+        "NAME": DATABASE_FILE,
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": DATABASE_OPTIONS,
+    },
+    "readonly": {
+        "ENGINE": "medic_card.db.sqlite3",
+        "NAME": DATABASE_FILE,
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 600)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {**DATABASE_OPTIONS, "read_only": True},
+        "TEST": {"MIRROR": "default"},
+    },
 }
+DATABASE_ROUTERS = ["medic_card.db.routers.ReadOnlyRouter"]
+
+# Файловый кэш общий для всех воркеров gunicorn (кэш страниц); счетчики
+# ограничения частоты - в отдельном файле SQLite с атомарным incr
+CACHES = {
+    "default": {
+        "BACKEND": "medic_card.cache.InstrumentedFileBasedCache",
+        "LOCATION": os.environ.get(
+            "CACHE_DIR", os.path.join(tempfile.gettempdir(), "medic_card_cache")
+        ),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "ratelimit": {
+        "BACKEND": "medic_card.cache.SQLiteCounterCache",
+        "LOCATION": os.environ.get(
+            "RATELIMIT_DB",
+            os.path.join(tempfile.gettempdir(), "medic_card_ratelimit.sqlite3"),
+        ),
+        "OPTIONS": {"CULL_EVERY": 1000},
+    },
+}
+RATELIMIT_USE_CACHE = "ratelimit"
+RATELIMIT_ENABLE = os.environ.get("RATELIMIT_ENABLE", "1") == "1"
+# Недоступное хранилище счетчиков не должно закрывать сайт
+RATELIMIT_FAIL_OPEN = True
+# Политики ограничения частоты (см. medic_card/ratelimit.py): ведро токенов
+# на пользователя (анонимов - на IP). rate - устойчивая скорость, burst -
+# запас подряд; "auth" рассчитан на вход целого класса с одного NAT
+RATELIMIT_POLICIES = {
+    "read": {"rate": "1200/h", "burst": 200},
+    "answer": {"rate": "600/h", "burst": 100},
+    "auth": {"rate": "120/h", "burst": 90},
+}
+# За Caddy REMOTE_ADDR - адрес прокси; X-Forwarded-For он выставляет сам
+RATELIMIT_TRUST_X_FORWARDED_FOR = (
+    os.environ.get("RATELIMIT_TRUST_X_FORWARDED_FOR", "0") == "1"
+)
+
+# Отложенная запись ответов (см. medic_card/answerwriter.py): ответы
+# собираются в пачки за окно в секундах и пишутся одной транзакцией
+ANSWER_WRITE_BEHIND = os.environ.get("ANSWER_WRITE_BEHIND", "0") == "1"
+ANSWER_WRITE_BATCH_WINDOW = 0.005
+ANSWER_WRITE_BATCH_SIZE = 100
+ANSWER_WRITE_TIMEOUT = 10
+
+# Команда serve (gunicorn): адрес, процессы и потоки, таймаут зависшего
+# воркера и время на завершение текущих запросов при остановке (секунды)
+SERVE_BIND = os.environ.get("SERVE_BIND", "0.0.0.0:8000")
+SERVE_WORKERS = int(os.environ.get("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", 4))
+SERVE_TIMEOUT = 30
+SERVE_GRACEFUL_TIMEOUT = 20
+
+# Прогрев общих кэшей (см. medic_card/warmup.py): число потоков и прогрев
+# после каждого migrate (включается в образе Docker, локально выключен)
+WARM_CACHES_WORKERS = 4
+WARM_CACHES_AFTER_MIGRATE = os.environ.get("WARM_CACHES_AFTER_MIGRATE", "0") == "1"
+
+# Кэш страниц для анонимов (см. medic_card/pagecache.py): срок хранения на
+# сервере и max-age для Caddy и браузеров (их кэш версией не сбросить)
+PAGE_CACHE_ENABLED = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+PAGE_CACHE_TIMEOUT = 60 * 60
+PAGE_CACHE_MAX_AGE = 60
+
+# Готовые файлы sitemap (см. medic_card_project/sitemap.py) и задержка
+# фоновой пересборки после правок контента в секундах (None - не пересобирать)
+SITEMAP_ROOT = os.environ.get("SITEMAP_ROOT", str(BASE_DIR / "sitemaps"))
+SITEMAP_REBUILD_DELAY = 30
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -113,6 +209,9 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 SESSION_COOKIE_AGE = 1209600
+# Сессии читаются из общего файлового кэша, django_session - запасное
+# хранилище; состояние работы над ошибками хранится в ErrorsWorkAttempt
+SESSION_ENGINE = "django.contrib.sessions.backends.cached_db"
 
 LANGUAGE_CODE = "ru"
 
@@ -129,7 +228,91 @@ STATIC_ROOT = BASE_DIR / "staticfiles"  # ← добавлено
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# Отдача media (см. medic_card/media.py): без входа доступны только файлы
+# с этими префиксами; при заданном префиксе файл отдает прокси по
+# X-Accel-Redirect, иначе Django
+MEDIA_PUBLIC_PREFIXES = ["questions/"]
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "")
+MEDIA_CACHE_MAX_AGE = 24 * 60 * 60
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Бюджеты SQL-запросов по именам URL (см. medic_card/querybudget.py).
+# QUERY_BUDGET_RAISE включается в тестах, в работе нарушения пишутся в лог
+QUERY_BUDGET_RAISE = False
+QUERY_BUDGET_MAX_REPEATS = 10
+QUERY_BUDGET_NAMESPACES = ["medic_card", "medic_auth"]
+QUERY_BUDGETS = {
+    "medic_card:home": 8,
+    "medic_card:search": 20,
+    "medic_card:theme_detail": 10,
+    "medic_card:ticket_detail": 8,
+    "medic_card:question_detail": 12,
+    "medic_card:start_ticket": 10,
+    "medic_card:take_question": 25,
+    "medic_card:submit_answer": 20,
+    "medic_card:next_question": 6,
+    "medic_card:ticket_result": 20,
+    "medic_card:retake_ticket": 25,
+    "medic_card:favorites": 12,
+    "medic_card:toggle_favorite": 8,
+    "medic_card:get_errors_count": 5,
+    "medic_card:user_overlays": 10,
+    "medic_card:errors_work": 25,
+    "medic_card:errors_work_result": 25,
+    # Выгрузки потоковые: считаются только запросы до начала отдачи
+    "medic_card:metrics": 4,
+    "medic_card:profiles": 4,
+    "medic_card:profile_download": 4,
+    "medic_card:export_questions": 5,
+    "medic_card:export_results": 5,
+    "medic_auth:register": 15,
+    "medic_auth:login": 15,
+    "medic_auth:logout": 6,
+    "medic_auth:profile": 6,
+    "medic_auth:change_password": 10,
+    "medic_auth:change_password_hint": 8,
+}
+
+# Заголовок Server-Timing (БД, шаблоны, представление, кэш) для всех, а не
+# только для персонала, и доля запросов, замеры которых пишутся в лог
+# medic_card.timing строкой JSON
+SERVER_TIMING_HEADER = os.environ.get("SERVER_TIMING_HEADER", "0") == "1"
+SERVER_TIMING_LOG_SAMPLE_RATE = float(
+    os.environ.get("SERVER_TIMING_LOG_SAMPLE_RATE", "0.01")
+)
+
+# Метрики: общий для воркеров файл SQLite, период сброса итогов процесса
+# (секунды) и токен для /metrics (Authorization: Bearer <токен>)
+METRICS_DB = os.environ.get(
+    "METRICS_DB", os.path.join(tempfile.gettempdir(), "medic_card_metrics.sqlite3")
+)
+METRICS_FLUSH_INTERVAL = 5
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Профилирование медленных запросов (см. medic_card/profiling.py), включается
+# явно: порог в секундах, период снятия стеков и кольцевой буфер профилей
+PROFILER_ENABLED = os.environ.get("PROFILER_ENABLED", "0") == "1"
+PROFILER_THRESHOLD = float(os.environ.get("PROFILER_THRESHOLD", "1.0"))
+PROFILER_SAMPLE_INTERVAL = 0.01
+PROFILER_DIR = os.environ.get(
+    "PROFILER_DIR", os.path.join(tempfile.gettempdir(), "medic_card_profiles")
+)
+PROFILER_MAX_FILES = 50
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "simple": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "simple"},
+    },
+    "loggers": {
+        "medic_card": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
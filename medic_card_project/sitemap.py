@@ -1,6 +1,33 @@
+"""Sitemap сайта, заранее отрисованный в статические файлы.
+
+build_sitemaps() пишет в SITEMAP_ROOT индекс sitemap.xml и страницы
+sitemap-<раздел>-<номер>.xml (не больше 50 000 URL на страницу, как
+требует протокол). Файлы отдает Caddy; Django отдает их только как
+запасной вариант, без выборки из БД. После изменения контента файлы
+пересобираются в фоне с задержкой SITEMAP_REBUILD_DELAY секунд, чтобы
+серия правок в админке вызвала одну сборку.
+"""
+
+import os
+import re
+import tempfile
+import threading
+from datetime import datetime
+from datetime import timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
 from django.contrib.sitemaps import Sitemap
+from django.contrib.sitemaps.views import SitemapIndexItem
+from django.db import close_old_connections, transaction
+from django.http import FileResponse, Http404
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.views.decorators.http import condition
 from medic_card.models import Theme, Ticket, Question
+from medic_card.pagecache import content_changed
+
+SITEMAP_NAME_RE = re.compile(r"^sitemap(-[a-z]+-\d+)?\.xml$")
 
 
 class Site:
@@ -31,10 +58,10 @@ class ThemeSitemap(Sitemap):
 
 
     def items(self):
-        return Theme.objects.filter(is_active=True)
+        return Theme.objects.filter(is_active=True).order_by("id")
 
     def lastmod(self, obj):
-        return obj.created_at  # Лучше использовать updated_at если есть
+        return obj.updated_at
 
     def get_urls(self, site=None, **kwargs):
         site = Site()
@@ -53,10 +80,10 @@ class TicketSitemap(Sitemap):
 
 
     def items(self):
-        return Ticket.objects.filter(is_active=True, is_temporary=False)
+        return Ticket.objects.filter(is_active=True, is_temporary=False).order_by("id")
 
     def lastmod(self, obj):
-        return obj.created_at
+        return obj.updated_at
 
     def get_urls(self, site=None, **kwargs):
         site = Site()
@@ -75,12 +102,19 @@ class QuestionSitemap(Sitemap):
 
 
     def items(self):
-        return Question.objects.filter(
-            is_active=True,
+        # Только вопросы из постоянных билетов: вопрос, который встречается
+        # лишь в работе над ошибками, на публичных страницах не виден
+        return (
+            Question.objects.filter(
+                is_active=True, tickets__is_active=True, tickets__is_temporary=False
+            )
+            .distinct()
+            .only("id", "updated_at")
+            .order_by("id")
         )
 
     def lastmod(self, obj):
-        return obj.created_at
+        return obj.updated_at
 
     def get_urls(self, site=None, **kwargs):
         site = Site()
@@ -97,4 +131,115 @@ sitemaps = {
     'themes': ThemeSitemap,
     'tickets': TicketSitemap,
     'questions': QuestionSitemap,
-}
\ No newline at end of file
+}
+
+
+def sitemap_root():
+    path = Path(settings.SITEMAP_ROOT)
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _write(path, content):
+    """Атомарная запись: читатель видит либо старый, либо новый файл"""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".sitemap-", suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        file.write(content)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+def build_sitemaps():
+    """Пишет индекс и все страницы sitemap, возвращает число URL"""
+    root = sitemap_root()
+    written = set()
+    index = []
+    total = 0
+    for section, sitemap_class in sitemaps.items():
+        sitemap = sitemap_class()
+        for page in sitemap.paginator.page_range:
+            urls = sitemap.get_urls(page=page)
+            name = f"sitemap-{section}-{page}.xml"
+            _write(root / name, render_to_string("sitemap.xml", {"urlset": urls}))
+            written.add(name)
+            total += len(urls)
+            dates = [url["lastmod"] for url in urls if url.get("lastmod")]
+            index.append(
+                SitemapIndexItem(
+                    f"https://{Site.domain}/{name}", max(dates) if dates else None
+                )
+            )
+
+    # Индекс пишется последним, когда все его страницы уже на месте
+    _write(
+        root / "sitemap.xml",
+        render_to_string("sitemap_index.xml", {"sitemaps": index}),
+    )
+    written.add("sitemap.xml")
+    for path in root.glob("sitemap-*.xml"):
+        if path.name not in written:
+            path.unlink(missing_ok=True)
+    return total
+
+
+class RebuildScheduler:
+    """Отложенная пересборка: правки в пределах задержки дают одну сборку"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def schedule(self):
+        delay = settings.SITEMAP_REBUILD_DELAY
+        if delay is None:
+            return
+        with self.lock:
+            if self.timer is not None and self.timer.is_alive():
+                return
+            self.timer = threading.Timer(delay, self.run)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def run(self):
+        try:
+            build_sitemaps()
+        finally:
+            close_old_connections()
+
+
+SCHEDULER = RebuildScheduler()
+
+
+def content_changed_handler(sender, **kwargs):
+    transaction.on_commit(SCHEDULER.schedule)
+
+
+content_changed.connect(content_changed_handler, dispatch_uid="sitemap_rebuild")
+
+
+def _sitemap_path(name):
+    if not SITEMAP_NAME_RE.match(name):
+        raise Http404
+    path = sitemap_root() / name
+    if not path.is_file() and name == "sitemap.xml":
+        # Первый запрос до build_sitemaps: собираем синхронно
+        build_sitemaps()
+    if not path.is_file():
+        raise Http404
+    return path
+
+
+def sitemap_last_modified(request, name="sitemap.xml"):
+    try:
+        mtime = _sitemap_path(name).stat().st_mtime
+    except Http404:
+        return None
+    return datetime.fromtimestamp(mtime, tz=dt_timezone.utc)
+
+
+@condition(last_modified_func=sitemap_last_modified)
+def sitemap_file(request, name="sitemap.xml"):
+    """Отдает готовый файл sitemap (если запрос дошел до Django)"""
+    return FileResponse(
+        _sitemap_path(name).open("rb"), content_type="application/xml"
+    )
@@ -1,11 +1,10 @@
-from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
-from django.contrib.sitemaps.views import sitemap
-from django.urls import include, path
+from django.urls import include, path, re_path
 from django.http import HttpResponse
 
-from .sitemap import sitemaps
+from medic_card.media import serve_media
+
+from .sitemap import sitemap_file
 
 
 def robots_txt(request):
@@ -22,20 +21,14 @@ urlpatterns = [
     path("admin/cucumber-with-salary/", admin.site.urls),
     path("", include("medic_card.urls")),
     path("auth/", include("medic_auth.urls")),
-    # Sitemap
-    path(
-        'sitemap.xml',
-        sitemap,
-        {'sitemaps': sitemaps},
-        name='django.contrib.sitemaps.views.sitemap'
+    # Sitemap: готовые файлы из SITEMAP_ROOT (обычно их отдает Caddy)
+    path('sitemap.xml', sitemap_file, name='sitemap'),
+    re_path(
+        r'^(?P<name>sitemap-[a-z]+-\d+\.xml)$',
+        sitemap_file,
+        name='sitemap_section',
     ),
     path('robots.txt', robots_txt),
+    # Проверка доступа; сами байты отдает Caddy по X-Accel-Redirect
+    path('media/<path:path>', serve_media, name='media'),
 ]
-
-from django.views.static import serve
-urlpatterns += [
-    path('media/<path:path>', serve, {'document_root': settings.MEDIA_ROOT}),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file